@@ -24,6 +24,7 @@ from sqlalchemy import create_engine, MetaData
 from gai_common.errors import *
 #from gai.gen.rag.models.IndexedDocumentChunkPydantic import IndexedDocumentChunkPydantic
 from gai.gen.rag.models import IndexedDocumentChunkPydantic
+from gai.gen.rag.models.IndexingJobPydantic import IndexingJobPydantic
 import gai.api.dependencies as dependencies
 from gai.gen.rag import RAG
 from gai.gen import Gaigen
@@ -75,6 +76,7 @@ rag = RAG(device=DEVICE, in_memory=get_in_memory(), generator_name=default_gener
 async def startup_event():
     try:
         rag.load()
+        await rag.job_queue.start(ws_manager=ws_manager)
     except Exception as e:
         logger.error(f"Failed to load default model: {e}")
         raise e
@@ -84,6 +86,7 @@ app.add_event_handler("startup", startup_event)
 async def shutdown_event():
     # Perform cleanup here
     try:
+        await rag.job_queue.stop()
         rag.unload()
     except Exception as e:
         logger.error(f"Failed to unload default model: {e}")
@@ -138,12 +141,15 @@ async def step_header_async(collection_name: str = Form(...), file: UploadFile =
 
 
 # Description: Step 2 of 3 - Split file and save chunks to database
+# If incremental is true, the existing chunkgroup of the document (or of previous_document_id) is updated and only the changed chunks are re-indexed.
 # POST /gen/v1/rag/step/split
 class DocumentSplitRequest(BaseModel):
     collection_name:str
     document_id: str
     chunk_size: int
     chunk_overlap: int
+    incremental: Optional[bool] = False
+    previous_document_id: Optional[str] = None
 @app.post("/gen/v1/rag/step/split")
 async def step_split_async(req: DocumentSplitRequest):
     logger.info(f"rag_api.index_file: started.")
@@ -152,7 +158,9 @@ async def step_split_async(req: DocumentSplitRequest):
             collection_name=req.collection_name,
             document_id=req.document_id, 
             chunk_size=req.chunk_size, 
-            chunk_overlap=req.chunk_overlap)
+            chunk_overlap=req.chunk_overlap,
+            incremental=req.incremental,
+            previous_document_id=req.previous_document_id)
         return chunkgroup
     except DuplicatedDocumentException:
         raise
@@ -230,6 +238,75 @@ async def index_file_async(collection_name: str = Form(...), file: UploadFile =
         logger.error(f"rag_api.index_file: {id} {str(e)}")
         raise InternalException(id)
 
+# INDEXING JOBS -------------------------------------------------------------------------------------------------------------------------------------------
+
+# Description: Queue the file for indexing in the background and return the job immediately. Use GET /gen/v1/rag/jobs/{job_id} to follow the job.
+# POST /gen/v1/rag/jobs
+# Response:
+# - 200: { "job": {...} }
+# - 500: { "message": "Internal error: {id}" }
+@app.post("/gen/v1/rag/jobs")
+async def submit_job_async(collection_name: str = Form(...), file: UploadFile = File(...), metadata: str = Form(...), chunk_size: Optional[int] = Form(None), chunk_overlap: Optional[int] = Form(None)):
+    logger.info(f"rag_api.submit_job: started.")
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+
+            # Save the file to a temporary directory. The job queue keeps its own copy.
+            file_location = os.path.join(temp_dir, file.filename)
+            with open(file_location, "wb+") as file_object:
+                content = await file.read()
+                file_object.write(content)
+
+            job = rag.job_queue.submit(
+                collection_name=collection_name,
+                file_path=file_location,
+                file_type=file.filename.split(".")[-1],
+                metadata=json.loads(metadata),
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap)
+            return JSONResponse(status_code=200, content={
+                "job": jsonable_encoder(IndexingJobPydantic.from_dalc(job))
+            })
+    except Exception as e:
+        id = str(uuid.uuid4())
+        logger.error(f"rag_api.submit_job: {id} Error=Failed to submit job,{str(e)}")
+        raise InternalException(id)
+
+# GET /gen/v1/rag/jobs
+@app.get("/gen/v1/rag/jobs")
+async def list_jobs_async(collection_name: Optional[str] = Query(None), status: Optional[str] = Query(None)):
+    try:
+        jobs = rag.job_queue.list_jobs(collection_name=collection_name, status=status)
+        return JSONResponse(status_code=200, content={
+            "jobs": [jsonable_encoder(IndexingJobPydantic.from_dalc(job)) for job in jobs]
+        })
+    except Exception as e:
+        id = str(uuid.uuid4())
+        logger.error(f"rag_api.list_jobs: {id} {str(e)}")
+        raise InternalException(id)
+
+# GET /gen/v1/rag/jobs/{job_id}
+# Response:
+# - 200: { "job": {...} }
+# - 404: { "message": "Job with id {job_id} not found" }
+# - 500: { "message": "Internal error: {id}" }
+@app.get("/gen/v1/rag/jobs/{job_id}")
+async def get_job_async(job_id):
+    try:
+        job = rag.job_queue.get_job(job_id)
+        if job is None:
+            logger.warning(f"rag_api.get_job: Job with Id={job_id} not found.")
+            raise ApiException(404, "job_not_found", f"Job with id {job_id} not found")
+        return JSONResponse(status_code=200, content={
+            "job": jsonable_encoder(IndexingJobPydantic.from_dalc(job))
+        })
+    except ApiException:
+        raise
+    except Exception as e:
+        id = str(uuid.uuid4())
+        logger.error(f"rag_api.get_job: {id} {str(e)}")
+        raise InternalException(id)
+
 # WEBSOCKET -------------------------------------------------------------------------------------------------------------------------------------------
 
 # WEBSOCKET "/gen/v1/rag/index-file/ws/{agent_id}"
@@ -250,17 +327,19 @@ async def index_file_websocket_async(websocket:WebSocket,agent_id=None):
 
 # Retrieve document chunks using semantic search
 # POST /gen/v1/rag/retrieve
+# Set hybrid to fuse the semantic search with a keyword (BM25) search, eg. for queries that contain identifiers or part numbers.
 class QueryRequest(BaseModel):
     collection_name: str
     query_texts: str
     n_results: int = 3
+    hybrid: bool = False
 @app.post("/gen/v1/rag/retrieve")
 async def retrieve(request: QueryRequest = Body(...)):
     try:
         logger.info(
             f"main.retrieve: collection_name={request.collection_name}")
         result = rag.retrieve(collection_name=request.collection_name,
-                              query_texts=request.query_texts, n_results=request.n_results)
+                              query_texts=request.query_texts, n_results=request.n_results, hybrid=request.hybrid)
         logger.debug(f"main.retrieve={result}")
         return JSONResponse(status_code=200, content={
             "retrieved": result
@@ -270,6 +349,28 @@ async def retrieve(request: QueryRequest = Body(...)):
         logger.error(f"rag_api.retrieve: {id} {str(e)}")
         raise InternalException(id)
 
+# Retrieve document chunks for many queries from one or more collections in a single request.
+# POST /gen/v1/rag/retrieve/batch
+# Response:
+# - 200: { "retrieved": [[{...}, ...], ...] } one list of chunks per query, sorted by distance
+class BatchQueryRequest(BaseModel):
+    collection_names: List[str]
+    query_texts: List[str]
+    n_results: int = 3
+@app.post("/gen/v1/rag/retrieve/batch")
+async def retrieve_batch(request: BatchQueryRequest = Body(...)):
+    try:
+        logger.info(
+            f"main.retrieve_batch: collection_names={request.collection_names} queries={len(request.query_texts)}")
+        result = rag.retrieve_batch(collection_names=request.collection_names,
+                              query_texts=request.query_texts, n_results=request.n_results)
+        return JSONResponse(status_code=200, content={
+            "retrieved": result
+        })
+    except Exception as e:
+        id = str(uuid.uuid4())
+        logger.error(f"rag_api.retrieve_batch: {id} {str(e)}")
+        raise InternalException(id)
 
 #Collections-------------------------------------------------------------------------------------------------------------------------------------------
 
@@ -1,7 +1,7 @@
 import os
 import subprocess
 import uuid
-from fastapi import FastAPI, Body, HTTPException
+from fastapi import FastAPI, Body, HTTPException, Header
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from fastapi.responses import StreamingResponse,JSONResponse
@@ -66,7 +66,76 @@ async def version():
         "version": dependencies.APP_VERSION
     })
 
+# STATS
+@app.get("/gen/v1/chat/stats")
+async def stats():
+    try:
+        return JSONResponse(status_code=200, content={
+            **gen.get_stats(),
+            "residency": gen.get_residency_stats()
+        })
+    except Exception as e:
+        id=str(uuid.uuid4())
+        logger.error(str(e)+f" id={id}")
+        raise InternalException(id)
+
 ### ----------------- TTT ----------------- ###
+
+# Default coalescing window. 1 token and 0 ms means every chunk is written as soon as it is generated.
+STREAM_COALESCE_TOKENS=int(os.getenv("STREAM_COALESCE_TOKENS","1"))
+STREAM_COALESCE_MS=int(os.getenv("STREAM_COALESCE_MS","0"))
+
+# Closing the async stream cancels the generation when the client disconnects before the end of the stream.
+# Chunks are buffered and written together when coalesce_tokens chunks are buffered or coalesce_ms has passed since the first buffered chunk.
+async def _stream_chunks(response, chunk_format="ndjson", coalesce_tokens=1, coalesce_ms=0):
+    def encode(chunk):
+        if isinstance(chunk, bytes):
+            return chunk
+        if chunk_format == "sse":
+            return ("data: "+json.dumps(jsonable_encoder(chunk))+"\n\n").encode()
+        return (json.dumps(jsonable_encoder(chunk))+"\n").encode()
+
+    loop = asyncio.get_running_loop()
+    buffer = []
+    deadline = None
+    next_chunk = None
+    try:
+        while True:
+            if next_chunk is None:
+                next_chunk = asyncio.ensure_future(response.__anext__())
+            if buffer and coalesce_ms > 0:
+                # Wait for the next chunk without cancelling it if the window expires.
+                await asyncio.wait({next_chunk}, timeout=max(deadline - loop.time(), 0))
+                if not next_chunk.done():
+                    yield b"".join(buffer)
+                    buffer = []
+                    continue
+            pending, next_chunk = next_chunk, None
+            try:
+                chunk = await pending
+            except StopAsyncIteration:
+                break
+            if chunk is None:
+                continue
+            if not buffer:
+                deadline = loop.time() + coalesce_ms/1000
+            buffer.append(encode(chunk))
+            if len(buffer) >= coalesce_tokens or (coalesce_ms > 0 and loop.time() >= deadline):
+                yield b"".join(buffer)
+                buffer = []
+        if chunk_format == "sse":
+            buffer.append(b"data: [DONE]\n\n")
+        if buffer:
+            yield b"".join(buffer)
+    finally:
+        if next_chunk is not None:
+            next_chunk.cancel()
+            try:
+                await next_chunk
+            except (asyncio.CancelledError, StopAsyncIteration):
+                pass
+        await response.aclose()
+
 class MessageRequest(BaseModel):
     role: str
     content: str
@@ -76,21 +145,37 @@ class ChatCompletionRequest(BaseModel):
     class Config:
         extra = 'allow'  # Allow extra fields
     
+# Streams are returned as Server-Sent Events when the request has the header "Accept: text/event-stream",
+# otherwise as newline-delimited JSON.
+# coalesce_tokens and coalesce_ms can be set in the request body to batch the chunks of a stream into fewer writes.
 @app.post("/gen/v1/chat/completions")
-async def _text_to_text(request: ChatCompletionRequest = Body(...)):
+async def _text_to_text(request: ChatCompletionRequest = Body(...), accept: Optional[str] = Header(None)):
 
     response=None
     try:
         messages = request.messages
-        model_params = request.model_dump(exclude={"model", "messages","stream"})  
+        model_params = request.model_dump(exclude={"model", "messages","stream","coalesce_tokens","coalesce_ms"})  
         stream = request.stream
-        response = gen.create(
+        chunk_format = "sse" if accept and "text/event-stream" in accept else "ndjson"
+        coalesce_tokens = getattr(request, "coalesce_tokens", None) or STREAM_COALESCE_TOKENS
+        coalesce_ms = getattr(request, "coalesce_ms", None) or STREAM_COALESCE_MS
+        # Route to the requested generator if it is configured, otherwise use the default generator.
+        generator_name = getattr(request, "model", None)
+        if generator_name not in gen.config or gen.config[generator_name].get("type") != "ttt":
+            generator_name = None
+        # Generation runs on the inference executor so that the event loop is not blocked.
+        response = await gen.create_async(
+            generator_name=generator_name,
             messages=[message.model_dump() for message in messages],
             stream=stream,
+            chunk_format=chunk_format if stream else None,
             **model_params
         )
         if stream:
-            return StreamingResponse(json.dumps(jsonable_encoder(chunk))+"\n" for chunk in response if chunk is not None)
+            chunks = _stream_chunks(response, chunk_format=chunk_format, coalesce_tokens=coalesce_tokens, coalesce_ms=coalesce_ms)
+            if chunk_format == "sse":
+                return StreamingResponse(chunks, media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+            return StreamingResponse(chunks)
         else:
             return response
     except Exception as e:
@@ -102,6 +187,35 @@ async def _text_to_text(request: ChatCompletionRequest = Body(...)):
         logger.error(str(e)+f" id={id}")
         raise InternalException(id)
 
+class ChatCompletionBatchRequest(BaseModel):
+    messages_list: List[List[MessageRequest]]
+    class Config:
+        extra = 'allow'  # Allow extra fields
+
+# Throughput-oriented batch completion. Results are returned in the same order as messages_list.
+@app.post("/gen/v1/chat/completions/batch")
+async def _text_to_text_batch(request: ChatCompletionBatchRequest = Body(...)):
+    try:
+        model_params = request.model_dump(exclude={"model", "messages_list", "stream"})
+        generator_name = getattr(request, "model", None)
+        if generator_name not in gen.config or gen.config[generator_name].get("type") != "ttt":
+            generator_name = None
+        responses = await gen.executor.run(
+            gen.create_batch,
+            list_of_messages=[[message.model_dump() for message in messages] for messages in request.messages_list],
+            generator_name=generator_name,
+            **model_params
+        )
+        return JSONResponse(status_code=200, content=jsonable_encoder(responses))
+    except Exception as e:
+        if (str(e)=='context_length_exceeded'):
+            raise ContextLengthExceededException()
+        if (str(e)=='model_service_mismatch'):
+            raise GeneratorMismatchException()
+        id=str(uuid.uuid4())
+        logger.error(str(e)+f" id={id}")
+        raise InternalException(id)
+
 if __name__ == "__main__":
     import uvicorn
 
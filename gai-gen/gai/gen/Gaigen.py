@@ -1,11 +1,53 @@
-import threading
+import threading, time
+from collections import OrderedDict
+from collections.abc import Iterator
 from gai_common import logging, generators_utils
+from gai.gen.InferenceExecutor import InferenceExecutor
 import os
 from dotenv import load_dotenv
 load_dotenv()
 logger = logging.getLogger(__name__)
 in_memory = os.environ.get("IN_MEMORY","true").lower() != "false"
 
+class _ResidentStream:
+    """
+    # Documentation
+    Descriptions: Wraps a streamed response so that the generator stays in flight until the stream is exhausted, fails or is closed.
+    cancel() is forwarded to the underlying stream.
+    """
+
+    def __init__(self, response, release):
+        self.response = response
+        self._release = release
+        self._released = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.response)
+        except BaseException:
+            self.close()
+            raise
+
+    def cancel(self):
+        if hasattr(self.response, "cancel"):
+            self.response.cancel()
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        try:
+            if hasattr(self.response, "close"):
+                self.response.close()
+        finally:
+            self._release()
+
+    def __del__(self):
+        self.close()
+
 class Gaigen:
     __instance = None       # singleton
 
@@ -24,97 +66,349 @@ class Gaigen:
         else:
             self.config_path=config_path
             self.config = generators_utils.load_generators_config(self.config_path)
+            # The default generator used when create() is called without a generator_name
             self.generator_name = None
-            self.generator = None
-            # for thread safety, using Semaphore allows for easier upgrade to support multiple generators in the future
-            self.semaphore = threading.Semaphore(1)
+            # Resident generators in least-recently-used order
+            self.generators = OrderedDict()
+            self.footprints = {}
+            self.semaphores = {}
+            # Number of requests (including unfinished streams) using each generator. Busy generators are never evicted.
+            self.in_flight = {}
+            # Generators being loaded outside the lock. Other requests for the same generator wait on the event.
+            self.loading = {}
+            # Generators that have been evicted but are still being unloaded outside the lock. Their memory is counted until they are unloaded.
+            self.unloading = set()
+            self.lock = threading.RLock()
+            # Serializes generator.load() and generator.unload() so that the footprint measured for a load is not skewed by other loads or unloads.
+            # Resident generators keep serving requests while a generator is being loaded or unloaded.
+            self.load_lock = threading.Lock()
+            self.released = threading.Condition(self.lock)
+            residency = self.config.get("residency", {})
+            self.max_generators = residency.get("max_generators", 1)
+            self.memory_budget_mb = residency.get("memory_budget_mb", None)
+            # Seconds to wait for busy generators to finish before refusing to load another generator.
+            self.evict_timeout = residency.get("evict_timeout", 30)
+            self.metrics = {
+                "loads": 0,
+                "hits": 0,
+                "evictions": 0,
+                "load_seconds": 0.0,
+            }
+            self.executor = InferenceExecutor()
             Gaigen.__instance = self
 
-    # This is idempotent
-    def load(self, generator_name):
+    # The default generator. It is reloaded if it has been evicted.
+    @property
+    def generator(self):
+        if self.generator_name is None:
+            return None
+        return self._acquire(self.generator_name)
 
-        if generator_name is None:
-            logger.error("Gaigen.load: generator_name parameter is required.")
-            raise Exception(
-                "Gaigen.load: generator_name parameter is required.")
+    # Returns the name of the default generator or raises an exception if no generator is loaded.
+    def _get_default_name(self, method):
+        if self.generator_name is None:
+            logger.error(f"Gaigen.{method}: Generator is not loaded.")
+            raise Exception(f"Gaigen.{method}: Generator is not loaded.")
+        return self.generator_name
+
+    # Memory allocated on the GPU in MB, or 0 if not available.
+    def _memory_allocated_mb(self):
+        try:
+            import torch
+            if torch.cuda.is_available():
+                return torch.cuda.memory_allocated() / (1024*1024)
+        except ImportError:
+            pass
+        return 0
+
+    # Use the footprint from gai.json if specified, otherwise the footprint measured the last time it was loaded.
+    # The footprint is measured as the change in GPU memory allocated by the process during load(), so it is only
+    # accurate if nothing else allocates GPU memory at the same time. Set memory_mb if other work runs on the GPU during loads.
+    def _get_footprint(self, generator_name):
+        return self.config[generator_name].get("memory_mb", self.footprints.get(generator_name, 0))
+
+    # Removes the generator from the resident set and adds it to evicted to be unloaded by _unload_evicted() once the lock is released.
+    # Must be called with the lock held.
+    def _evict(self, generator_name, evicted):
+        generator = self.generators.pop(generator_name)
+        self.semaphores.pop(generator_name, None)
+        self.in_flight.pop(generator_name, None)
+        self.unloading.add(generator_name)
+        self.metrics["evictions"] += 1
+        evicted.append((generator_name, generator))
+
+    # Unloads the evicted generators. Must be called without the lock held so that requests to other generators are not blocked.
+    def _unload_evicted(self, evicted):
+        for generator_name, generator in evicted:
+            logger.info(f"Gaigen: Evicting generator {generator_name}...")
+            try:
+                with self.load_lock:
+                    generator.unload()
+                    try:
+                        import gc, torch
+                        gc.collect()
+                        if torch.cuda.is_available():
+                            torch.cuda.empty_cache()
+                    except ImportError:
+                        pass
+            except Exception as e:
+                logger.error(f"Gaigen: Error unloading generator {generator_name}: {e}")
+            finally:
+                with self.lock:
+                    self.unloading.discard(generator_name)
+                    self.released.notify_all()
+
+    def _is_busy(self, generator_name):
+        return self.in_flight.get(generator_name, 0) > 0
 
-        if self.generator_name == generator_name:
-            logger.debug(
-                "Gaigen.load: Generator is already loaded. Skip loading.")
-            return self
+    # Returns True if the generators that are resident, being loaded or being unloaded exceed max_generators or the memory budget.
+    # Generators in evicted are not counted since they are unloaded by the caller before it loads the generator.
+    def _over_limit(self, generator_name, required_mb, evicted=()):
+        names = (set(self.generators) | set(self.loading) | self.unloading) - {n for n, _ in evicted}
+        count = len(names) + (0 if generator_name in names else 1)
+        used_mb = sum(self._get_footprint(n) for n in names) + required_mb
+        over_count = count > self.max_generators
+        over_budget = self.memory_budget_mb is not None and used_mb > self.memory_budget_mb
+        return over_count or over_budget
 
-        if self.generator_name and self.generator_name != generator_name:
-            logger.debug(
-                "Gaigen.load: New generator_name specified, unload current generator.")
-            if self.generator:
-                self.generator.unload()
+    # Evict idle least-recently-used generators until the required footprint fits within the budget.
+    # If only busy generators are left, wait for them to finish or raise an exception after evict_timeout seconds.
+    # The evicted generators are added to evicted. Must be called with the lock held.
+    def _evict_for(self, generator_name, required_mb, evicted, wait=True):
+        deadline = time.time() + self.evict_timeout
+        while self._over_limit(generator_name, required_mb, evicted):
+            idle = [n for n in self.generators if n != generator_name and not self._is_busy(n)]
+            if idle:
+                self._evict(idle[0], evicted)
+                continue
+            if not wait:
+                logger.warning(f"Gaigen: {generator_name} is over the residency limit but the other generators are busy.")
+                return
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                logger.error(f"Gaigen: Cannot load {generator_name}. The resident generators are busy.")
+                raise Exception(f"Gaigen: Cannot load {generator_name}. The resident generators are busy.")
+            self.released.wait(timeout=remaining)
 
+    def _hold(self, generator_name):
+        self.in_flight[generator_name] = self.in_flight.get(generator_name, 0) + 1
+
+    def _release(self, generator_name):
+        with self.lock:
+            if generator_name in self.in_flight:
+                self.in_flight[generator_name] = max(self.in_flight[generator_name] - 1, 0)
+            self.released.notify_all()
+
+    def _create_generator(self, generator_name):
+        if generator_name not in self.config or "type" not in self.config[generator_name]:
+            logger.error(f"Gaigen.load: The generator {generator_name} is not found.")
+            raise Exception(f"Gaigen.load: The generator {generator_name} is not found.")
         generator_type = self.config[generator_name]["type"]
         if generator_type == "ttt":
             from gai.gen.ttt import TTT
-            self.generator = TTT(generator_name=generator_name,config_path=self.config_path)
+            return TTT(generator_name=generator_name,config_path=self.config_path)
         elif generator_type == "tts":
             from gai.gen.tts import TTS
-            self.generator = TTS(generator_name=generator_name,config_path=self.config_path)
+            return TTS(generator_name=generator_name,config_path=self.config_path)
         elif generator_type == "stt":
             from gai.gen.stt import STT
-            self.generator = STT(generator_name=generator_name,config_path=self.config_path)
+            return STT(generator_name=generator_name,config_path=self.config_path)
         elif generator_type == "itt":
             from gai.gen.itt import ITT
-            self.generator = ITT(generator_name=generator_name,config_path=self.config_path)
+            return ITT(generator_name=generator_name,config_path=self.config_path)
         elif generator_type == "tti":
             from gai.gen.tti import TTI
-            self.generator = TTI(generator_name=generator_name,config_path=self.config_path)
+            return TTI(generator_name=generator_name,config_path=self.config_path)
         elif generator_type == "rag":
             from gai.gen.rag import RAG
-            self.generator = RAG(in_memory=in_memory,config_path=self.config_path)
+            return RAG(in_memory=in_memory,config_path=self.config_path)
         elif generator_type == "ttc":
             from gai.gen.ttc.TTC import TTC
-            self.generator = TTC(generator_name=generator_name,config_path=self.config_path)
-        else:
-            logger.error(
-                f"Gaigen.load: The generator_type {generator_type} is not supported.")
-            raise Exception(
-                f"Gaigen.load: The generator_type {generator_type} is not supported.")
+            return TTC(generator_name=generator_name,config_path=self.config_path)
+        logger.error(
+            f"Gaigen.load: The generator_type {generator_type} is not supported.")
+        raise Exception(
+            f"Gaigen.load: The generator_type {generator_type} is not supported.")
+
+    # Returns the resident generator, loading it and evicting others if required.
+    # The generator is loaded outside the lock so requests to other resident generators are not blocked by a cold load.
+    # If hold=True, the generator is counted as in flight until _release() is called.
+    def _acquire(self, generator_name, hold=False):
+        while True:
+            evicted = []
+            try:
+                with self.lock:
+                    if generator_name in self.generators:
+                        self.generators.move_to_end(generator_name)
+                        self.metrics["hits"] += 1
+                        if hold:
+                            self._hold(generator_name)
+                        return self.generators[generator_name]
+                    if generator_name in self.unloading:
+                        # Wait for the evicted instance to be unloaded before loading it again
+                        self.released.wait()
+                        continue
+                    loading = self.loading.get(generator_name)
+                    if loading is None:
+                        self._evict_for(generator_name, self._get_footprint(generator_name), evicted)
+                        # The lock is released while waiting for busy generators, so check again.
+                        if generator_name in self.generators or generator_name in self.loading or generator_name in self.unloading:
+                            continue
+                        loading = self.loading[generator_name] = threading.Event()
+                        break
+            finally:
+                self._unload_evicted(evicted)
+            # Another request is loading the generator
+            loading.wait()
+
         try:
+            generator = self._create_generator(generator_name)
             logger.info(f"Gaigen: Loading generator {generator_name}...")
-            self.generator.load()
-            self.generator_name = generator_name
-            return self
+            start = time.time()
+            with self.load_lock:
+                before_mb = self._memory_allocated_mb()
+                generator.load()
+                footprint = max(self._memory_allocated_mb() - before_mb, 0)
+            load_seconds = time.time() - start
         except Exception as e:
             logger.error(
                 f"Gaigen: Error loading generator {generator_name}: {e}")
+            with self.lock:
+                self.loading.pop(generator_name).set()
+                self.released.notify_all()
             raise e
 
-    def unload(self):
-        if self.generator is not None:
-            self.generator.unload()
-            self.generator = None
-            self.generator_name = None
+        evicted = []
+        with self.lock:
+            self.footprints[generator_name] = footprint
+            self.metrics["loads"] += 1
+            self.metrics["load_seconds"] += load_seconds
+            self.generators[generator_name] = generator
+            self.semaphores[generator_name] = threading.Semaphore(1)
+            self.in_flight[generator_name] = 0
+            if hold:
+                self._hold(generator_name)
+            self.loading.pop(generator_name).set()
+
+            # The measured footprint may be larger than estimated
+            self._evict_for(generator_name, 0, evicted, wait=False)
+        self._unload_evicted(evicted)
+        return generator
+
+    # This is idempotent
+    def load(self, generator_name):
+
+        if generator_name is None:
+            logger.error("Gaigen.load: generator_name parameter is required.")
+            raise Exception(
+                "Gaigen.load: generator_name parameter is required.")
+
+        self._acquire(generator_name)
+        self.generator_name = generator_name
+        return self
+
+    # Waits for the requests in flight to finish before unloading.
+    def unload(self, generator_name=None):
+        evicted = []
+        try:
+            with self.lock:
+                names = [generator_name] if generator_name is not None else list(self.generators.keys())
+                for name in names:
+                    if name not in self.generators:
+                        continue
+                    if not self.released.wait_for(lambda: not self._is_busy(name), timeout=self.evict_timeout):
+                        logger.error(f"Gaigen.unload: Cannot unload {name}. The generator is busy.")
+                        raise Exception(f"Gaigen.unload: Cannot unload {name}. The generator is busy.")
+                    if name in self.generators:
+                        self._evict(name, evicted)
+                if generator_name is None:
+                    self.generator_name = None
+        finally:
+            self._unload_evicted(evicted)
         return self
 
-    def create(self, **model_params):
-        if self.generator is None:
+    # Runs fn on the generator while it is held in flight. Streamed responses hold the generator until the stream ends.
+    def _run(self, generator_name, fn, *args, **kwargs):
+        generator = self._acquire(generator_name, hold=True)
+        try:
+            # Generators with their own request scheduler are not serialized here.
+            if getattr(generator, "concurrent", False):
+                response = fn(generator, *args, **kwargs)
+            else:
+                with self.semaphores[generator_name]:
+                    response = fn(generator, *args, **kwargs)
+        except BaseException:
+            self._release(generator_name)
+            raise
+        if isinstance(response, Iterator):
+            return _ResidentStream(response, lambda: self._release(generator_name))
+        self._release(generator_name)
+        return response
+
+    # Runs fn on the generator while it is held in flight but without waiting for the request in progress. Used for lightweight calls such as token counting.
+    def _call(self, generator_name, fn):
+        generator = self._acquire(generator_name, hold=True)
+        try:
+            return fn(generator)
+        finally:
+            self._release(generator_name)
+
+    # Routes to the generator named by generator_name, otherwise the default generator.
+    def create(self, generator_name=None, **model_params):
+        generator_name = generator_name or self.generator_name
+        if generator_name is None:
             logger.error("Gaigen.create: Generator is not loaded.")
             raise Exception("Gaigen.create: Generator is not loaded.")
-        with self.semaphore:
-            return self.generator.create(**model_params)
+        return self._run(generator_name, lambda generator: generator.create(**model_params))
+
+    def create_batch(self, list_of_messages, generator_name=None, **model_params):
+        generator_name = generator_name or self.generator_name
+        if generator_name is None:
+            logger.error("Gaigen.create_batch: Generator is not loaded.")
+            raise Exception("Gaigen.create_batch: Generator is not loaded.")
+        def create_batch(generator):
+            if not hasattr(generator, 'create_batch'):
+                raise Exception("create_batch is not supported by this generator.")
+            return generator.create_batch(list_of_messages, **model_params)
+        return self._run(generator_name, create_batch)
+
+    def get_residency_stats(self):
+        with self.lock:
+            return {
+                **self.metrics,
+                "max_generators": self.max_generators,
+                "memory_budget_mb": self.memory_budget_mb,
+                "resident": [{"generator_name": name, "memory_mb": self._get_footprint(name), "in_flight": self.in_flight.get(name, 0)} for name in self.generators]
+            }
+
+    # Non-blocking version of create() for use within an asyncio event loop.
+    # If stream=True, returns an async generator of chunks. Closing it early cancels the generation.
+    async def create_async(self, **model_params):
+        response = await self.executor.run(self.create, **model_params)
+        if model_params.get("stream"):
+            return self.executor.stream(response)
+        return response
 
     def token_count(self, text):
-        if self.generator is None:
-            logger.error("Gaigen.create: Generator is not loaded.")
-            raise Exception("Gaigen.create: Generator is not loaded.")
-        if hasattr(self.generator, 'token_count'):
-            return self.generator.token_count(text)
-        raise Exception("token_count is not supported by this generator.")
+        def token_count(generator):
+            if hasattr(generator, 'token_count'):
+                return generator.token_count(text)
+            raise Exception("token_count is not supported by this generator.")
+        return self._call(self._get_default_name("token_count"), token_count)
 
     def get_token_ids(self, text):
-        if self.generator is None:
-            logger.error("Gaigen.create: Generator is not loaded.")
-            raise Exception("Gaigen.create: Generator is not loaded.")
-        if hasattr(self.generator, 'get_token_ids'):
-            return self.generator.get_token_ids(text)
-        raise Exception("get_token_ids is not supported by this generator.")
+        def get_token_ids(generator):
+            if hasattr(generator, 'get_token_ids'):
+                return generator.get_token_ids(text)
+            raise Exception("get_token_ids is not supported by this generator.")
+        return self._call(self._get_default_name("get_token_ids"), get_token_ids)
+
+    def get_stats(self):
+        def get_stats(generator):
+            if hasattr(generator, 'get_stats'):
+                return generator.get_stats()
+            return {}
+        return self._call(self._get_default_name("get_stats"), get_stats)
 
     async def index_async(self, 
                           collection_name, 
@@ -131,41 +425,39 @@ class Gaigen:
                           chunk_size=None, 
                           chunk_overlap=None, 
                           status_publisher=None):
-        if self.generator is None:
-            logger.error("Gaigen.create: Generator is not loaded.")
-            raise Exception("Gaigen.create: Generator is not loaded.")
-
-        if self.generator.generator_name != "rag":
-            logger.error(
-                f"Gaigen.index: The generator {self.generator.generator_name} does not support indexing.")
-            raise Exception(
-                f"Gaigen.index: The generator {self.generator.generator_name} does not support indexing.")
-        with self.semaphore:
-            return await self.generator.index_async(
-                collection_name=collection_name, 
-                file_path=file_path,
-                file_type=file_type,
-                title=title,
-                source=source,
-                abstract=abstract,
-                authors=authors,
-                publisher=publisher,
-                published_date=published_date,
-                comments=comments,
-                keywords=keywords,
-                chunk_size=chunk_size,
-                chunk_overlap=chunk_overlap,
-                status_publisher=status_publisher)
+        generator_name = self._get_default_name("index_async")
+        generator = self._acquire(generator_name, hold=True)
+        try:
+            if generator.generator_name != "rag":
+                logger.error(
+                    f"Gaigen.index: The generator {generator.generator_name} does not support indexing.")
+                raise Exception(
+                    f"Gaigen.index: The generator {generator.generator_name} does not support indexing.")
+            with self.semaphores[generator_name]:
+                return await generator.index_async(
+                    collection_name=collection_name, 
+                    file_path=file_path,
+                    file_type=file_type,
+                    title=title,
+                    source=source,
+                    abstract=abstract,
+                    authors=authors,
+                    publisher=publisher,
+                    published_date=published_date,
+                    comments=comments,
+                    keywords=keywords,
+                    chunk_size=chunk_size,
+                    chunk_overlap=chunk_overlap,
+                    status_publisher=status_publisher)
+        finally:
+            self._release(generator_name)
 
     def retrieve(self, collection_name, query_texts, n_results=None):
-        if self.generator is None:
-            logger.error("Gaigen.create: Generator is not loaded.")
-            raise Exception("Gaigen.create: Generator is not loaded.")
-
-        if self.generator.generator_name != "rag":
-            logger.error(
-                f"Gaigen.retrieve: The generator {self.generator.generator_name} does not support retrieval.")
-            raise Exception(
-                f"Gaigen.retrieve: The generator {self.generator.generator_name} does not support retrieval.")
-        with self.semaphore:
-            return self.generator.retrieve(collection_name, query_texts, n_results)
+        def retrieve(generator):
+            if generator.generator_name != "rag":
+                logger.error(
+                    f"Gaigen.retrieve: The generator {generator.generator_name} does not support retrieval.")
+                raise Exception(
+                    f"Gaigen.retrieve: The generator {generator.generator_name} does not support retrieval.")
+            return generator.retrieve(collection_name, query_texts, n_results)
+        return self._run(self._get_default_name("retrieve"), retrieve)
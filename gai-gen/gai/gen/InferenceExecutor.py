@@ -0,0 +1,82 @@
+import asyncio, threading, os
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from gai_common.logging import getLogger
+logger = getLogger(__name__)
+
+class InferenceExecutor:
+    """
+    # Documentation
+    Descriptions: Runs blocking generator calls on a dedicated thread pool so that the asyncio event loop is never blocked.
+    Streaming output is delivered through a bounded asyncio.Queue. When the queue is full, the producing thread waits for the
+    consumer to catch up (backpressure). When the consumer stops early (eg. client disconnected), the producer is stopped and
+    the underlying stream is cancelled if it supports cancel().
+    Example:
+        executor = InferenceExecutor(max_workers=4)
+        result = await executor.run(gen.create, messages=messages, stream=False)
+        response = await executor.run(gen.create, messages=messages, stream=True)
+        async for chunk in executor.stream(response):
+            ...
+    """
+
+    # Each active stream occupies one worker for its duration, so max_workers bounds the number of concurrent streams.
+    def __init__(self, max_workers=None, queue_size=None):
+        if max_workers is None:
+            max_workers = int(os.environ.get("MAX_INFERENCE_WORKERS", "32"))
+        if queue_size is None:
+            queue_size = int(os.environ.get("INFERENCE_QUEUE_SIZE", "64"))
+        self.queue_size = queue_size
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="InferenceExecutor")
+
+    async def run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: fn(*args, **kwargs))
+
+    # Iterates a synchronous stream of chunks on the executor and yields them asynchronously.
+    async def stream(self, response):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        stopped = threading.Event()
+        _END = object()
+
+        def put(item):
+            # Blocks the producer thread while the queue is full
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            while not stopped.is_set():
+                try:
+                    return future.result(timeout=0.1)
+                except FutureTimeoutError:
+                    continue
+            future.cancel()
+
+        def produce():
+            try:
+                for chunk in response:
+                    if stopped.is_set():
+                        break
+                    if chunk is not None:
+                        put(chunk)
+                put(_END)
+            except Exception as e:
+                logger.error(f"InferenceExecutor.stream: Generation failed. error={e}")
+                put(e)
+            finally:
+                # Closed on the producer thread so that a stream stopped early releases its resources immediately.
+                if hasattr(response, "close"):
+                    response.close()
+
+        loop.run_in_executor(self.executor, produce)
+        try:
+            while True:
+                item = await queue.get()
+                if item is _END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stopped.set()
+            if hasattr(response, "cancel"):
+                response.cancel()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
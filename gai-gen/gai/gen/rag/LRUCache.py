@@ -0,0 +1,45 @@
+import threading
+from collections import OrderedDict
+
+class LRUCache:
+    """
+    # Documentation
+    Descriptions: Thread-safe bounded dictionary that evicts the least recently used entry when it is full. A cache with max_size 0 is disabled and never stores anything.
+    Example:
+        cache = LRUCache(max_size=1024)
+        cache.put(("instructor-large", "what is attention?"), embedding)
+        embedding = cache.get(("instructor-large", "what is attention?"))
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size or 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Returns None if the key is not cached.
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
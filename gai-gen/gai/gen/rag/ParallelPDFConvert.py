@@ -0,0 +1,75 @@
+import re
+import io
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from gai_common import logging
+logger = logging.getLogger(__name__)
+
+# Runs in the worker process. The pages [start, end) are copied into an in-memory PDF and partitioned on their own.
+def _convert_shard(pdf_file_path, start, end):
+    from pypdf import PdfReader, PdfWriter
+    from unstructured.partition.pdf import partition_pdf
+    reader = PdfReader(pdf_file_path)
+    writer = PdfWriter()
+    for page in reader.pages[start:end]:
+        writer.add_page(page)
+    shard = io.BytesIO()
+    writer.write(shard)
+    shard.seek(0)
+    elements = partition_pdf(file=shard)
+    return "\n\n".join([str(el) for el in elements])
+
+class ParallelPDFConvert:
+    """
+    # Documentation
+    Descriptions: Converts PDF to text on a process pool so that the conversion does not block the event loop.
+    PDFs with more than pages_per_shard pages are split into page ranges that are converted in parallel and joined back in page order,
+    so that a large document uses all the workers. The output is the same as PDFConvert.pdf_to_text.
+    The workers are started with "spawn" so that they do not inherit the CUDA context of the parent process.
+    Example:
+        converter = ParallelPDFConvert(max_workers=8, pages_per_shard=20)
+        text = await converter.pdf_to_text_async("attention-is-all-you-need.pdf")
+    """
+
+    def __init__(self, max_workers=None, pages_per_shard=20):
+        self.max_workers = max_workers
+        self.pages_per_shard = pages_per_shard
+        self.executor = None
+
+    def _get_executor(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self.executor
+
+    # Returns the page ranges [start, end) of the shards in page order.
+    def get_shards(self, pdf_file_path):
+        from pypdf import PdfReader
+        page_count = len(PdfReader(pdf_file_path).pages)
+        return [(start, min(start+self.pages_per_shard, page_count)) for start in range(0, max(page_count,1), self.pages_per_shard)]
+
+    def _join(self, texts, clean):
+        text = "\n\n".join([text for text in texts if text])
+        text = re.sub(r'\(cid:[^\)]*\)', '', text)
+        if clean:
+            text = re.sub(r'\s+', ' ', text)
+        return text
+
+    def pdf_to_text(self, pdf_file_path, clean=True):
+        shards = self.get_shards(pdf_file_path)
+        executor = self._get_executor()
+        futures = [executor.submit(_convert_shard, pdf_file_path, start, end) for start, end in shards]
+        return self._join([future.result() for future in futures], clean)
+
+    async def pdf_to_text_async(self, pdf_file_path, clean=True):
+        loop = asyncio.get_running_loop()
+        shards = await loop.run_in_executor(None, self.get_shards, pdf_file_path)
+        logger.info(f"ParallelPDFConvert.pdf_to_text_async: converting {pdf_file_path} in {len(shards)} shards")
+        executor = self._get_executor()
+        texts = await asyncio.gather(*[loop.run_in_executor(executor, _convert_shard, pdf_file_path, start, end) for start, end in shards])
+        return self._join(texts, clean)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
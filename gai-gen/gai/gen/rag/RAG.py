@@ -1,4 +1,5 @@
 import os
+import tempfile
 from gai_common.errors import DuplicatedDocumentException
 from gai.gen.rag.dalc.RAGVSRepository import RAGVSRepository
 import torch
@@ -9,8 +10,12 @@ from gai_common.utils import get_gen_config, get_app_path
 import threading
 from gai_common import logging, file_utils, generators_utils
 from gai.gen.rag.dalc.RAGDBRepository import RAGDBRepository
+from gai.gen.rag.dalc.RAGBlobRepository import RAGBlobRepository
+from gai.gen.rag.ParallelPDFConvert import ParallelPDFConvert
+from gai.gen.rag.RAGJobQueue import RAGJobQueue
+from gai.gen.rag.dalc.RAGJobRepository import RAGJobRepository
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, scoped_session
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 from gai.gen.rag.dalc.Base import Base
@@ -36,6 +41,7 @@ class RAG(GenBase):
             
         logger.info(f"RAG: device={self.device}")
         self.n_results = self.config["chromadb"]["n_results"]
+        self.embedding_model_name = generator_name
         
         # vector store config
         self.vs_repo = RAGVSRepository.New(in_memory)
@@ -44,16 +50,34 @@ class RAG(GenBase):
         app_path = get_app_path()
         sqlite_path = os.path.join(app_path, self.config["sqlite"]["path"])
         if in_memory:
-            sqlite_path = ":memory:"
+            # A temporary file is used instead of :memory: so that each thread can open its own connection to the database.
+            sqlite_path = os.path.join(tempfile.mkdtemp(), "rag.db")
         sqlite_string = f'sqlite:///{sqlite_path}' 
         logger.info(f"RAG: sqlite={sqlite_string}")
 
         engine = create_engine(sqlite_string)
-        if in_memory:
-            Base.metadata.create_all(engine)
-        session = sessionmaker(bind=engine)()
+        RAGDBRepository.Migrate(engine)
+        # The session is scoped to the thread so that the job workers do not share the session of the service.
+        session = scoped_session(sessionmaker(bind=engine))
 
-        self.db_repo = RAGDBRepository(session)
+        # file store config
+        blob_repo = None
+        if in_memory:
+            blob_repo = RAGBlobRepository(tempfile.mkdtemp())
+        self.db_repo = RAGDBRepository(session, blob_repo)
+
+        # PDF conversion runs on a process pool
+        pdf_config = self.config.get("pdf", {})
+        self.pdf_converter = ParallelPDFConvert(
+            max_workers=pdf_config.get("max_workers"),
+            pages_per_shard=pdf_config.get("pages_per_shard", 20))
+
+        # Background indexing jobs. The workers are started by the service with job_queue.start().
+        jobs_config = self.config.get("jobs", {})
+        jobs_path = os.path.join(app_path, jobs_config.get("path", "rag/jobs"))
+        if in_memory:
+            jobs_path = tempfile.mkdtemp()
+        self.job_queue = RAGJobQueue(self, RAGJobRepository(session), jobs_path, workers=jobs_config.get("workers", 1))
 
         # StatusPublisher
         self.status_publisher = status_publisher
@@ -62,14 +86,18 @@ class RAG(GenBase):
         self.semaphore = threading.Semaphore(1)
 
     # Load Instructor model
+    # The embedding model name is the key of the embedding cache so that embeddings from different models are not mixed up.
     def load(self):
         if self.generator_name == "openai-ada-rag":
+            self.embedding_model_name = "text-embedding-ada-002"
             self.vs_repo._ef = OpenAIEmbeddingFunction(
                 api_key=os.environ["OPENAI_API_KEY"],
-                model_name="text-embedding-ada-002"
+                model_name=self.embedding_model_name
                 )
         else:            
+            self.embedding_model_name = os.path.basename(os.path.normpath(self.model_path))
             self.vs_repo._ef = InstructorEmbeddingFunction(self.model_path, device=self.device)
+        self.vs_repo.embedding_model_name = self.embedding_model_name
 
     def unload(self):
         try:
@@ -77,6 +105,7 @@ class RAG(GenBase):
         except:
             pass
         self.vs_repo._ef = None
+        self.pdf_converter.shutdown()
         gc.collect()
         torch.cuda.empty_cache()
 
@@ -128,9 +157,8 @@ class RAG(GenBase):
 
         try:
             # If document exists, use update instead of create
-            document_id = self.create_document_hash(file_path)
-            doc = self.db_repo.get_document_header(collection_name, document_id)
-            if doc:
+            document_id = self.db_repo.find_document_id(collection_name, file_path)
+            if document_id:
                 logger.debug(f"rag.index_document_header_async: document exists. updating doc with id={document_id}.")
                 document_id=self.db_repo.update_document_header(
                     document_id = document_id,
@@ -145,7 +173,7 @@ class RAG(GenBase):
                     keywords=keywords
                     )
             else:
-                logger.debug(f"rag.index_document_header_async: creating doc header with id={document_id}.")
+                logger.debug(f"rag.index_document_header_async: creating doc header.")
                 if file_type is None:
                     _,file_type = os.path.splitext(file_path)
                 document_id=self.db_repo.create_document_header(
@@ -170,13 +198,31 @@ class RAG(GenBase):
             raise error
 
     # Step 2/3: Split file and save chunks into database.
+    # If incremental is True, the existing chunkgroup of the document (or of previous_document_id, the previous revision of the document)
+    # is updated by comparing chunk hashes instead of being rebuilt, so that only the added chunks are indexed in step 3.
     async def index_document_split_async(self, 
         collection_name,
         document_id,
         chunk_size=None,
-        chunk_overlap=None):
+        chunk_overlap=None,
+        incremental=False,
+        previous_document_id=None):
         try:
             logger.info(f"rag.index_document_split_async: splitting chunks")
+
+            if chunk_size is None:
+                chunk_size = self.config["chunks"]["size"]
+            if chunk_overlap is None:
+                chunk_overlap = self.config["chunks"]["overlap"]
+
+            await self._convert_document_async(collection_name, document_id)
+
+            if incremental:
+                existing_ids = self.list_chunkgroup_ids(document_id=previous_document_id or document_id)
+                if existing_ids:
+                    return self._update_chunkgroup(collection_name, document_id, existing_ids, chunk_size, chunk_overlap)
+                logger.info(f"rag.index_document_split_async: no existing chunkgroup found. Creating a new chunkgroup.")
+
             # Create the chunk group based on the default splitting algorithm
 
             # delete any existing chunkgroup and chunks before starting
@@ -185,36 +231,74 @@ class RAG(GenBase):
             for chunkgroup_id in existing_ids:
                 self.delete_chunkgroup(collection_name, chunkgroup_id=chunkgroup_id)
 
-            if chunk_size is None:
-                chunk_size = self.config["chunks"]["size"]
-            if chunk_overlap is None:
-                chunk_overlap = self.config["chunks"]["overlap"]
+            # The document is split in memory and the chunks are created together with the chunk group
             chunkgroup = self.db_repo.create_chunkgroup(
                 collection_name=collection_name,
                 document_id=document_id, 
                 chunk_size=chunk_size, 
-                chunk_overlap=chunk_overlap, 
-                splitter=file_utils.split_file)
-            logger.info(f"rag.index_document_split_async: chunkgroup created. chunkgroup_id={chunkgroup.Id}")
-
-            # Create the chunks in the database
-            chunks = self.db_repo.create_chunks(
-                chunkgroup.Id,
-                chunkgroup.ChunksDir
-            )
-            logger.info(f"rag.index_document_split_async: chunks created. count={len(chunks)}")
+                chunk_overlap=chunk_overlap)
+            logger.info(f"rag.index_document_split_async: chunkgroup created. chunkgroup_id={chunkgroup.Id} count={chunkgroup.ChunkCount}")
         
             return chunkgroup
         except Exception as error:
             logger.error(f"RAG.index_document_split_async: Failed to create chunks. error={error}")
             raise error
 
+    # Convert the PDF on the process pool and cache the text before splitting so that the conversion does not block the event loop.
+    async def _convert_document_async(self, collection_name, document_id):
+        doc = self.db_repo.get_document_header(collection_name, document_id)
+        if doc is None or doc.FileType != 'pdf' or not doc.FileRef or self.db_repo.has_document_text(doc.Id):
+            return
+        text = await self.pdf_converter.pdf_to_text_async(self.db_repo.get_document_file_path(doc.FileRef))
+        self.db_repo.save_document_text(doc.Id, text)
+
+    # Update the first chunkgroup with the new split and delete the rest. Only the chunks that are removed are deleted from VS.
+    def _update_chunkgroup(self, collection_name, document_id, existing_ids, chunk_size, chunk_overlap):
+        for chunkgroup_id in existing_ids[1:]:
+            self.delete_chunkgroup(collection_name, chunkgroup_id=chunkgroup_id)
+        result = self.db_repo.update_chunkgroup(
+            collection_name=collection_name,
+            chunkgroup_id=existing_ids[0],
+            document_id=document_id,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap)
+        chunkgroup = result["chunkgroup"]
+        self.vs_repo.delete_chunks(collection_name, result["removed_chunk_ids"])
+
+        # The reused chunks may belong to the previous revision of the document so their metadata is updated to the new document.
+        doc = self.db_repo.get_document_header(collection_name, document_id)
+        reused_ids = [chunk.Id for chunk in self.db_repo.list_chunks(chunkgroup.Id) if chunk.IsIndexed]
+        self.vs_repo.update_chunks_metadata(
+            collection_name=collection_name,
+            chunk_ids=reused_ids,
+            **self._get_chunk_metadata(doc, chunkgroup.Id))
+
+        chunkgroup.ChunksReused = result["reused"]
+        chunkgroup.ChunksAdded = result["added"]
+        chunkgroup.ChunksRemoved = len(result["removed_chunk_ids"])
+        logger.info(f"rag.index_document_split_async: chunkgroup updated. chunkgroup_id={chunkgroup.Id} reused={chunkgroup.ChunksReused} added={chunkgroup.ChunksAdded} removed={chunkgroup.ChunksRemoved}")
+        return chunkgroup
+
+    def _get_chunk_metadata(self, doc, chunkgroup_id):
+        return {
+            "document_id": doc.Id,
+            "chunkgroup_id": chunkgroup_id,
+            "source": doc.Source if doc.Source else "",
+            "abstract": doc.Abstract if doc.Abstract else "",
+            "title": doc.Title if doc.Title else "",
+            "published_date": doc.PublishedDate.strftime('%Y-%b-%d') if doc.PublishedDate else "",
+            "keywords": doc.Keywords if doc.Keywords else ""
+        }
+
     # Step 3/3: Index chunk into vector database
+    # Chunks that are already indexed, eg. chunks reused by an incremental split, are skipped.
+    # progress_callback is awaited after each batch with the number of chunks indexed so far and the number of chunks in the chunkgroup.
     async def index_document_index_async(self, 
                                          collection_name, 
                                          document_id, 
                                          chunkgroup_id, 
-                                         ws_manager=None):
+                                         ws_manager=None,
+                                         progress_callback=None):
 
         try:
             logger.info(f"RAG.index_document_index_async: Start indexing...")
@@ -223,38 +307,67 @@ class RAG(GenBase):
             doc = self.db_repo.get_document_header(collection_name, document_id)
             chunks = self.db_repo.list_chunks(chunkgroup_id)
 
-            ids = []
-            for i, chunk in tqdm(enumerate(chunks)):
+            batch_size = self.config["chunks"].get("batch_size", 64)
+            metadata = self._get_chunk_metadata(doc, chunkgroup_id)
+
+            ids = [chunk.Id for chunk in chunks if chunk.IsIndexed]
+            skipped = len(ids)
+            chunks = [chunk for chunk in chunks if not chunk.IsIndexed]
+            reused = 0
+            computed = 0
+            for start in tqdm(range(0, len(chunks), batch_size)):
+                batch = chunks[start:start+batch_size]
                 try:
-                    #chunk = self.db_repo.get_chunk(chunk.Id)
-                    self.vs_repo.index_chunk(
+                    # Only embed the chunks that are not in the embedding cache.
+                    embeddings = self.db_repo.get_embeddings(self.embedding_model_name, [chunk.ChunkHash for chunk in batch])
+                    missing = list({ chunk.ChunkHash: chunk.Content for chunk in batch if chunk.ChunkHash not in embeddings }.items())
+                    if missing:
+                        new_embeddings = dict(zip([chunk_hash for chunk_hash,_ in missing], self.vs_repo.embed([content for _,content in missing])))
+                        self.db_repo.save_embeddings(self.embedding_model_name, new_embeddings)
+                        embeddings.update(new_embeddings)
+                    reused += len(batch) - len(missing)
+                    computed += len(missing)
+
+                    self.vs_repo.index_chunks(
                         collection_name=collection_name, 
-                        content=chunk.Content, 
-                        chunk_id=chunk.Id, 
-                        document_id=doc.Id,
-                        chunkgroup_id=chunkgroup_id,
-                        source=doc.Source if doc.Source else "",
-                        abstract=doc.Abstract if doc.Abstract else "",
-                        title=doc.Title if doc.Title else "",
-                        published_date=doc.PublishedDate.strftime('%Y-%b-%d') if doc.PublishedDate else "",
-                        keywords=doc.Keywords if doc.Keywords else ""
+                        contents=[chunk.Content for chunk in batch], 
+                        chunk_ids=[chunk.Id for chunk in batch], 
+                        embeddings=[embeddings[chunk.ChunkHash] for chunk in batch],
+                        **metadata
                     )
-                    ids.append(chunk.Id)
+                    self.db_repo.update_chunks_indexed([chunk.Id for chunk in batch])
+                    ids.extend([chunk.Id for chunk in batch])
                     logger.debug(
-                        f"RAG.index_document_index_async: Indexed {i+1}/{len(chunks)} chunk {chunk.Id} into collection {collection_name}")
+                        f"RAG.index_document_index_async: Indexed {start+len(batch)}/{len(chunks)} chunks into collection {collection_name}")
                 except Exception as e:
-                    # Log error and continue. Do not raise exception to avoid stopping the indexing process. We can rerun the indexing process to create the missing chunks.
-                    chunk.IsIndexed = False
-                    logger.error(f"RAG.index_document_index_async: Failed to index chunk {chunk.Id}. error={e}")
+                    # Retry the batch one chunk at a time so that only the failed chunks are marked as not indexed.
+                    logger.warning(f"RAG.index_document_index_async: Failed to index batch at {start}. Retrying chunk by chunk. error={e}")
+                    for chunk in batch:
+                        try:
+                            self.vs_repo.index_chunk(
+                                collection_name=collection_name, 
+                                content=chunk.Content, 
+                                chunk_id=chunk.Id, 
+                                **metadata
+                            )
+                            self.db_repo.update_chunks_indexed([chunk.Id])
+                            ids.append(chunk.Id)
+                        except Exception as e:
+                            # Log error and continue. Do not raise exception to avoid stopping the indexing process. We can rerun the indexing process to create the missing chunks.
+                            chunk.IsIndexed = False
+                            logger.error(f"RAG.index_document_index_async: Failed to index chunk {chunk.Id}. error={e}")
 
                 # Callback for progress update
                 if ws_manager:
                     try:
-                        logger.debug(f"RAG.index_document_index_async: Send progress {i+1} to updater")
-                        await ws_manager.broadcast_progress(i+1,len(chunks))
+                        logger.debug(f"RAG.index_document_index_async: Send progress {start+len(batch)} to updater")
+                        await ws_manager.broadcast_progress(start+len(batch),len(chunks))
                     except Exception as e:
-                        logger.error(f"RAG.index_document_index_async: Failed to broadcast 'Send progress {i+1} to updater' message. {e}")
+                        logger.error(f"RAG.index_document_index_async: Failed to broadcast 'Send progress {start+len(batch)} to updater' message. {e}")
+                if progress_callback:
+                    await progress_callback(len(ids), skipped+len(chunks))
 
+            logger.info(f"RAG.index_document_index_async: Indexed {len(ids)-skipped}/{len(chunks)} chunks. already indexed={skipped} embeddings reused={reused} computed={computed}")
             return ids
         except Exception as error:
             logger.error(f"RAG.index_document_index_async: Failed to create chunks. error={error}")
@@ -279,7 +392,9 @@ class RAG(GenBase):
         keywords=None,
         chunk_size=None, 
         chunk_overlap=None, 
-        ws_manager=None):
+        ws_manager=None,
+        incremental=False,
+        previous_document_id=None):
 
         if ws_manager:
             try:
@@ -311,7 +426,9 @@ class RAG(GenBase):
             collection_name=collection_name,
             document_id=doc.Id,
             chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap
+            chunk_overlap=chunk_overlap,
+            incremental=incremental,
+            previous_document_id=previous_document_id
         )
 
         if ws_manager:
@@ -330,26 +447,77 @@ class RAG(GenBase):
         return {"document_id":doc.Id,"chunkgroup_id":chunkgroup.Id,"chunk_ids":chunk_ids}
 
     # RETRIEVAL
-    def retrieve(self, collection_name, query_texts, n_results=None):
+    # If hybrid is True, the vector results are fused with the BM25 results of the lexical index so that exact identifiers are also found.
+    def retrieve(self, collection_name, query_texts, n_results=None, hybrid=False):
         logger.info(f"RAG.retrieve: Retrieving by query {query_texts}...")
 
         if n_results is None:
             n_results = self.n_results
 
         try:
-            result = self.vs_repo.retrieve(collection_name, query_texts, n_results)
+            if hybrid:
+                result = self._retrieve_hybrid(collection_name, query_texts, n_results)
+            else:
+                result = self.vs_repo.retrieve(collection_name, query_texts, n_results)
         except Exception as e:
             logger.error(f"RAG.retrieve: Error retrieving data: {e}")
             return None
 
         # Not found
-        if result is None or not all(col in result.columns for col in ['ids', 'distances']):
-            logger.warn("Result is empty or missing required columns")
+        if not result:
+            logger.warn("Result is empty")
             return None
 
-        result = result.drop_duplicates(subset=['ids']).sort_values('distances', ascending=True)
-        json = result.to_dict(orient='records')
-        return json
+        # The chunks are already sorted by distance and deduplicated by the repository
+        return result
+
+    # Reciprocal rank fusion: each chunk scores 1/(rrf_k+rank) in each result list it appears in, and the chunks are returned by total score.
+    # The chunks found only by the lexical index are loaded from the vector store and have no distance.
+    def _retrieve_hybrid(self, collection_name, query_texts, n_results):
+        hybrid_config = self.config.get("hybrid", {})
+        rrf_k = hybrid_config.get("rrf_k", 60)
+        candidates = max(n_results, hybrid_config.get("candidates", 20))
+        query_text = query_texts if isinstance(query_texts, str) else query_texts[0]
+
+        vector_chunks = self.vs_repo.retrieve(collection_name, query_text, candidates) or []
+        lexical_ids = [chunk_id for chunk_id, _ in self.db_repo.search_chunks(collection_name, query_text, candidates)]
+
+        fused = {}
+        for rank, chunk in enumerate(vector_chunks):
+            chunk["score"] = 1 / (rrf_k + rank + 1)
+            fused[chunk["ids"]] = chunk
+        lexical_chunks = { chunk["ids"]: chunk for chunk in self.vs_repo.get_chunks(collection_name, [chunk_id for chunk_id in lexical_ids if chunk_id not in fused]) }
+        for rank, chunk_id in enumerate(lexical_ids):
+            if chunk_id not in fused:
+                if chunk_id not in lexical_chunks:
+                    continue
+                fused[chunk_id] = lexical_chunks[chunk_id]
+                fused[chunk_id]["score"] = 0
+            fused[chunk_id]["score"] += 1 / (rrf_k + rank + 1)
+        logger.debug(f"RAG._retrieve_hybrid: vector={len(vector_chunks)} lexical={len(lexical_ids)} fused={len(fused)}")
+        return sorted(fused.values(), key=lambda chunk: chunk["score"], reverse=True)[:n_results]
+
+    # Retrieve the results of many queries from one or more collections. The queries are embedded once and each collection is queried once.
+    # Returns a list with the results of each query, where the results from all collections are merged by distance and include the collection name.
+    def retrieve_batch(self, collection_names, query_texts, n_results=None):
+        logger.info(f"RAG.retrieve_batch: Retrieving {len(query_texts)} queries from {collection_names}...")
+
+        if n_results is None:
+            n_results = self.n_results
+        if isinstance(collection_names, str):
+            collection_names = [collection_names]
+
+        query_embeddings = self.vs_repo.embed_queries(query_texts)
+        retrieved = [[] for _ in query_texts]
+        for collection_name in collection_names:
+            results = self.vs_repo.retrieve_batch(collection_name, query_texts, n_results, query_embeddings=query_embeddings)
+            for i, result in enumerate(results):
+                if result is None:
+                    continue
+                for chunk in result:
+                    chunk["collection_name"] = collection_name
+                    retrieved[i].append(chunk)
+        return [sorted(chunks, key=lambda chunk: chunk["distances"])[:n_results] for chunks in retrieved]
 
 
 
@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import shutil
+import asyncio
+import queue
+import threading
+from gai_common import logging
+from gai.gen.rag.dalc.RAGJobRepository import RAGJobRepository
+logger = logging.getLogger(__name__)
+
+# Raised inside a job when the queue is stopped. The job is left running and is resumed from its last completed step on the next start.
+class JobStoppedException(Exception):
+    pass
+
+class _LoopProxy:
+    """
+    # Documentation
+    Descriptions: Forwards the coroutine methods of target, eg. the websocket manager, to the event loop of the service
+    so that they can be awaited from the event loop of a worker thread.
+    """
+
+    def __init__(self, target, loop):
+        self.target = target
+        self.loop = loop
+
+    def __getattr__(self, name):
+        method = getattr(self.target, name)
+        async def call(*args, **kwargs):
+            return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(method(*args, **kwargs), self.loop))
+        return call
+
+class RAGJobQueue:
+    """
+    # Documentation
+    Descriptions: Runs the header, split and index steps of uploaded documents in the background so that the upload request returns as soon as the file is saved.
+    Jobs are persisted by RAGJobRepository and processed by a fixed number of worker threads. The uploaded file is kept under jobs_path/{job_id} until the job ends.
+    Each worker runs the steps on its own event loop because they embed and write to the databases synchronously, so the event loop of the service
+    stays responsive while jobs are running. The repositories are expected to use a scoped_session so that each worker has its own session.
+    Each step records its result on the job, so when the service restarts the interrupted jobs are queued again and continue from the last completed step.
+    Example:
+        job = rag.job_queue.submit(collection_name="demo", file_path="/tmp/attention-is-all-you-need.pdf", metadata={"title": "Attention is all you need"})
+        job = rag.job_queue.get_job(job.Id)
+    """
+
+    def __init__(self, rag, job_repo: RAGJobRepository, jobs_path, workers=1):
+        self.rag = rag
+        self.job_repo = job_repo
+        self.jobs_path = jobs_path
+        self.workers = workers
+        self.queue = None
+        self.threads = []
+        self.ws_manager = None
+        self.stopping = threading.Event()
+        os.makedirs(self.jobs_path, exist_ok=True)
+
+    # Start the workers and queue the jobs that were pending or interrupted when the service stopped.
+    async def start(self, ws_manager=None):
+        self.ws_manager = _LoopProxy(ws_manager, asyncio.get_running_loop()) if ws_manager else None
+        self.queue = queue.Queue()
+        self.stopping.clear()
+        jobs = self.job_repo.reset_running_jobs()
+        for job in jobs:
+            self.queue.put(job.Id)
+        if jobs:
+            logger.info(f"RAGJobQueue.start: resuming {len(jobs)} jobs")
+        self.threads = [threading.Thread(target=self._worker, name=f"RAGJobQueue-{i}", daemon=True) for i in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+
+    # Running jobs are stopped after the current batch and are resumed on the next start.
+    async def stop(self):
+        self.stopping.set()
+        for _ in self.threads:
+            self.queue.put(None)
+        loop = asyncio.get_running_loop()
+        for thread in self.threads:
+            await loop.run_in_executor(None, thread.join)
+        self.threads = []
+
+    # Wait until all the queued jobs are done.
+    async def join(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.queue.join)
+
+    # Copy the file into the job directory and queue the job. The file at file_path can be deleted after this returns.
+    def submit(self, collection_name, file_path, file_type=None, metadata=None, chunk_size=None, chunk_overlap=None, file_name=None):
+        if file_type is None:
+            file_type = os.path.splitext(file_path)[1].lstrip(".")
+        job = self.job_repo.create_job(
+            collection_name=collection_name,
+            file_path=file_path,
+            file_type=file_type,
+            metadata=json.dumps(metadata or {}),
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap)
+
+        # The document header takes its file name from the path so the original name is kept
+        job_dir = os.path.join(self.jobs_path, job.Id)
+        os.makedirs(job_dir, exist_ok=True)
+        job_file_path = os.path.join(job_dir, file_name or os.path.basename(file_path))
+        shutil.copyfile(file_path, job_file_path)
+        self.job_repo.update_job(job.Id, FilePath=job_file_path)
+
+        if self.queue is not None:
+            self.queue.put(job.Id)
+        logger.info(f"RAGJobQueue.submit: job_id={job.Id} collection_name={collection_name} file={job_file_path}")
+        return self.job_repo.get_job(job.Id)
+
+    def get_job(self, job_id):
+        return self.job_repo.get_job(job_id)
+
+    def list_jobs(self, collection_name=None, status=None):
+        return self.job_repo.list_jobs(collection_name=collection_name, status=status)
+
+    def _worker(self):
+        loop = asyncio.new_event_loop()
+        try:
+            while True:
+                job_id = self.queue.get()
+                try:
+                    if job_id is None or self.stopping.is_set():
+                        return
+                    loop.run_until_complete(self._run_job(job_id))
+                except JobStoppedException:
+                    logger.info(f"RAGJobQueue._worker: job {job_id} stopped.")
+                except Exception as e:
+                    logger.error(f"RAGJobQueue._worker: job {job_id} failed. error={e}")
+                    self.job_repo.fail_job(job_id, e)
+                    self._delete_job_file(job_id)
+                finally:
+                    self.queue.task_done()
+        finally:
+            loop.close()
+
+    def _check_stopping(self, job_id):
+        if self.stopping.is_set():
+            raise JobStoppedException(f"RAGJobQueue: job {job_id} stopped.")
+
+    async def _run_job(self, job_id):
+        job = self.job_repo.get_job(job_id)
+        if job is None or job.Status != RAGJobRepository.PENDING:
+            return
+        self.job_repo.start_job(job_id)
+        collection_name = job.CollectionName
+
+        # Step 1/3
+        document_id = job.DocumentId
+        if document_id is None:
+            metadata = json.loads(job.Metadata or "{}")
+            doc = await self.rag.index_document_header_async(
+                collection_name=collection_name,
+                file_path=job.FilePath,
+                file_type=job.FileType,
+                title=metadata.get("title", ""),
+                source=metadata.get("source", ""),
+                authors=metadata.get("authors", ""),
+                publisher=metadata.get("publisher", ""),
+                published_date=metadata.get("publishedDate", ""),
+                comments=metadata.get("comments", ""),
+                keywords=metadata.get("keywords", ""))
+            document_id = doc.Id
+            self.job_repo.update_job(job_id, Step="split", DocumentId=document_id)
+
+        # Step 2/3
+        self._check_stopping(job_id)
+        chunkgroup_id = job.ChunkGroupId
+        if chunkgroup_id is None:
+            chunkgroup = await self.rag.index_document_split_async(
+                collection_name=collection_name,
+                document_id=document_id,
+                chunk_size=job.ChunkSize,
+                chunk_overlap=job.ChunkOverlap)
+            chunkgroup_id = chunkgroup.Id
+            self.job_repo.update_job(job_id, Step="index", ChunkGroupId=chunkgroup_id, ChunksTotal=chunkgroup.ChunkCount)
+
+        # Step 3/3
+        # Throughput only counts the chunks indexed since the job was (re)started.
+        self._check_stopping(job_id)
+        started = time.monotonic()
+        indexed_at_start = job.ChunksIndexed or 0
+        async def update_progress(indexed, total):
+            elapsed = time.monotonic() - started
+            chunks_per_second = (indexed - indexed_at_start) / elapsed if elapsed > 0 else None
+            self.job_repo.update_job(job_id, ChunksIndexed=indexed, ChunksTotal=total, ChunksPerSecond=chunks_per_second)
+            self._check_stopping(job_id)
+
+        chunk_ids = await self.rag.index_document_index_async(
+            collection_name=collection_name,
+            document_id=document_id,
+            chunkgroup_id=chunkgroup_id,
+            ws_manager=self.ws_manager,
+            progress_callback=update_progress)
+        self.job_repo.update_job(job_id, ChunksIndexed=len(chunk_ids))
+        self.job_repo.complete_job(job_id)
+        self._delete_job_file(job_id)
+        logger.info(f"RAGJobQueue._run_job: job {job_id} completed. document_id={document_id} chunkgroup_id={chunkgroup_id} chunks={len(chunk_ids)}")
+
+    def _delete_job_file(self, job_id):
+        shutil.rmtree(os.path.join(self.jobs_path, job_id), ignore_errors=True)
@@ -0,0 +1,12 @@
+from sqlalchemy import Column, VARCHAR, DateTime, BLOB, INTEGER
+from gai.gen.rag.dalc.Base import Base
+
+# Embeddings are cached by content hash so that identical chunks are only embedded once per embedding model.
+class IndexedChunkEmbedding(Base):
+    __tablename__ = 'IndexedChunkEmbeddings'
+
+    ModelName = Column(VARCHAR(200), primary_key=True)
+    ChunkHash = Column(VARCHAR(64), primary_key=True)   # SHA256 hash of the chunk
+    Dimension = Column(INTEGER, nullable=False)
+    Embedding = Column(BLOB, nullable=False)            # float32 array
+    CreatedAt = Column(DateTime)
@@ -1,5 +1,5 @@
 from sqlalchemy import Column, PrimaryKeyConstraint, Text, VARCHAR, DateTime, Boolean, BLOB, JSON, INTEGER, Date,BIGINT
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from gai.gen.rag.dalc.Base import Base
 from gai.gen.rag.dalc.IndexedDocumentChunk import IndexedDocumentChunk
 
@@ -7,11 +7,12 @@ class IndexedDocument(Base):
     __tablename__ = 'IndexedDocuments'
 
     Id = Column(VARCHAR(44), nullable=False)
-    CollectionName = Column(VARCHAR(200), nullable=False)
+    CollectionName = Column(VARCHAR(200), nullable=False, index=True)
     ByteSize = Column(BIGINT, nullable=False)
     FileName = Column(VARCHAR(200))
     FileType = Column(VARCHAR(10))
-    File = Column(BLOB)
+    File = deferred(Column(BLOB))     # Only used by documents created before the blob store. New documents are stored in RAGBlobRepository.
+    FileRef = Column(VARCHAR(44))     # Reference to the file in RAGBlobRepository
     Source = Column(VARCHAR(255))
     Abstract = Column(Text)
     Authors = Column(VARCHAR(255))
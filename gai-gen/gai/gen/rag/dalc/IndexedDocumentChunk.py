@@ -6,12 +6,14 @@ class IndexedDocumentChunk(Base):
     __tablename__ = 'IndexedDocumentChunks'
 
     Id = Column(VARCHAR(36), primary_key=True)
-    ChunkHash = Column(VARCHAR(64))   # SHA256 hash of the chunk
-    ChunkGroupId = Column(VARCHAR(36), ForeignKey('IndexedDocumentChunkGroups.Id'))
+    ChunkHash = Column(VARCHAR(64), index=True)   # SHA256 hash of the chunk
+    ChunkGroupId = Column(VARCHAR(36), ForeignKey('IndexedDocumentChunkGroups.Id'), index=True)
+    ChunkIndex = Column(INTEGER)      # Position of the chunk in the document
     ByteSize = Column(INTEGER)
     IsDuplicate = Column(Boolean)
     IsIndexed = Column(Boolean)
     Content = Column(Text)
+    LexicalId = Column(INTEGER, index=True, unique=True)   # Key of the chunk in the lexical index. Assigned by trigger and, unlike rowid, not renumbered by VACUUM.
 
     # Relationship to IndexedDocumentChunkGroup
     ChunkGroup = relationship("IndexedDocumentChunkGroup", back_populates="Chunks")
\ No newline at end of file
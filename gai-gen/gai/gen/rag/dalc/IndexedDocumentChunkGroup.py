@@ -7,7 +7,7 @@ class IndexedDocumentChunkGroup(Base):
 
     # Primary key for the chunk group itself
     Id = Column(VARCHAR(36), primary_key=True)
-    DocumentId = Column(VARCHAR(36), ForeignKey('IndexedDocuments.Id'), nullable=False)
+    DocumentId = Column(VARCHAR(36), ForeignKey('IndexedDocuments.Id'), nullable=False, index=True)
     SplitAlgo = Column(VARCHAR(200))
     ChunkCount = Column(INTEGER, nullable=False)
     ChunkSize = Column(INTEGER, nullable=False)
@@ -19,4 +19,4 @@ class IndexedDocumentChunkGroup(Base):
     Document = relationship("IndexedDocument", back_populates="ChunkGroups")
 
     # Relationship to IndexedDocumentChunk
-    Chunks = relationship("IndexedDocumentChunk", back_populates="ChunkGroup")
+    Chunks = relationship("IndexedDocumentChunk", back_populates="ChunkGroup", order_by="IndexedDocumentChunk.ChunkIndex")
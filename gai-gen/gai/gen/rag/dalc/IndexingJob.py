@@ -0,0 +1,26 @@
+from sqlalchemy import Column, VARCHAR, DateTime, INTEGER, Float, Text
+from gai.gen.rag.dalc.Base import Base
+
+# Indexing jobs are persisted so that jobs interrupted by a restart can be resumed from the last completed step.
+class IndexingJob(Base):
+    __tablename__ = 'IndexingJobs'
+
+    Id = Column(VARCHAR(36), primary_key=True)
+    CollectionName = Column(VARCHAR(200), nullable=False, index=True)
+    FilePath = Column(VARCHAR(255), nullable=False)     # Uploaded file, deleted when the job ends
+    FileType = Column(VARCHAR(10))
+    Metadata = Column(Text)                             # JSON document header fields
+    ChunkSize = Column(INTEGER)
+    ChunkOverlap = Column(INTEGER)
+    Status = Column(VARCHAR(20), nullable=False, index=True)    # Pending, Running, Completed, Failed
+    Step = Column(VARCHAR(20))                          # header, split, index
+    DocumentId = Column(VARCHAR(44))
+    ChunkGroupId = Column(VARCHAR(36))
+    ChunksTotal = Column(INTEGER, default=0)
+    ChunksIndexed = Column(INTEGER, default=0)
+    ChunksPerSecond = Column(Float)
+    Error = Column(Text)
+    CreatedAt = Column(DateTime)
+    StartedAt = Column(DateTime)
+    UpdatedAt = Column(DateTime)
+    CompletedAt = Column(DateTime)
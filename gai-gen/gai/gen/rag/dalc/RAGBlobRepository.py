@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+from gai_common import logging
+logger = logging.getLogger(__name__)
+
+class RAGBlobRepository:
+    """
+    # Documentation
+    Descriptions: Content-addressed file store for uploaded documents. Each file is stored once under blobs_path/{id[:2]}/{id}
+    where id is the document id, so documents with the same content share the same file and the database only holds the reference.
+    Files are copied in blocks and moved into place after they are complete so that a partially written file is never visible.
+    Example:
+        blob_repo = RAGBlobRepository("/home/user/gai/rag/blobs")
+        blob_ref = blob_repo.put(document_id, "/tmp/attention-is-all-you-need.pdf")
+        with blob_repo.open(blob_ref) as f:
+            ...
+    """
+
+    def __init__(self, blobs_path):
+        self.blobs_path = blobs_path
+        os.makedirs(self.blobs_path, exist_ok=True)
+
+    def get_path(self, blob_ref):
+        if not blob_ref or os.path.sep in blob_ref or blob_ref.startswith("."):
+            raise ValueError(f"RAGBlobRepository: Invalid blob reference {blob_ref}")
+        return os.path.join(self.blobs_path, blob_ref[:2], blob_ref)
+
+    def exists(self, blob_ref):
+        return os.path.exists(self.get_path(blob_ref))
+
+    # Copy the file into the store and return its reference. The file is not copied again if the blob already exists.
+    def put(self, blob_ref, file_path):
+        blob_path = self.get_path(blob_ref)
+        if os.path.exists(blob_path):
+            return blob_ref
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(blob_path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, 'wb') as dest, open(file_path, 'rb') as src:
+                shutil.copyfileobj(src, dest, 1024*1024)
+            os.replace(temp_path, blob_path)
+        except Exception as e:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            logger.error(f"RAGBlobRepository.put: Failed to store blob {blob_ref}. Error={e}")
+            raise
+        return blob_ref
+
+    # Text blobs are used to cache the converted text of a document.
+    def put_text(self, blob_ref, text):
+        blob_path = self.get_path(blob_ref)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(blob_path), prefix=".tmp-")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(temp_path, blob_path)
+        return blob_ref
+
+    # Returns None if the text is not cached.
+    def get_text(self, blob_ref):
+        blob_path = self.get_path(blob_ref)
+        if not os.path.exists(blob_path):
+            return None
+        with open(blob_path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def open(self, blob_ref):
+        return open(self.get_path(blob_ref), 'rb')
+
+    def delete(self, blob_ref):
+        blob_path = self.get_path(blob_ref)
+        if os.path.exists(blob_path):
+            os.remove(blob_path)
+
+    def purge(self):
+        shutil.rmtree(self.blobs_path, ignore_errors=True)
+        os.makedirs(self.blobs_path, exist_ok=True)
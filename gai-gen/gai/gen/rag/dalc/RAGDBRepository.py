@@ -1,5 +1,9 @@
 import os
+import re
+import unicodedata
 import uuid
+import hashlib
+import base64
 from gai_common.errors import DuplicatedDocumentException
 from gai.gen.rag.dalc.IndexedDocumentChunk import IndexedDocumentChunk
 from gai.gen.rag.dalc.IndexedDocumentChunkGroup import IndexedDocumentChunkGroup
@@ -10,21 +14,101 @@ from gai.gen.rag.models.IndexedDocumentPydantic import IndexedDocumentPydantic
 from tqdm import tqdm
 from datetime import datetime
 from datetime import date
-from sqlalchemy import MetaData, create_engine
+from sqlalchemy import MetaData, create_engine, inspect, text, insert
 from sqlalchemy.orm import sessionmaker, selectinload, defer
 from gai.gen.rag.dalc.Base import Base
 from gai_common.utils import get_gen_config, get_app_path
 from gai_common import logging, file_utils
 from gai_common.PDFConvert import PDFConvert
+from gai_common.TextSplitter import TextSplitter
 from gai.gen.rag.dalc.IndexedDocument import IndexedDocument
+from gai.gen.rag.dalc.IndexedChunkEmbedding import IndexedChunkEmbedding
+from gai.gen.rag.dalc.RAGBlobRepository import RAGBlobRepository
+import numpy as np
 logger = logging.getLogger(__name__)
 from sqlalchemy.orm import Session
 
 class RAGDBRepository:
+
+    # Columns added after the first release. create_all only creates missing tables so missing columns are added to existing tables here.
+    MIGRATION_COLUMNS = {
+        "IndexedDocumentChunks": {
+            "ChunkIndex": "INTEGER",
+            "LexicalId": "INTEGER"
+        },
+        "IndexedDocuments": {
+            "FileRef": "VARCHAR(44)"
+        }
+    }
+
+    '''
+    Create the missing tables, columns and indexes so that databases created by previous versions can be opened.
+    '''
+    @staticmethod
+    def Migrate(engine):
+        Base.metadata.create_all(engine)
+        inspector = inspect(engine)
+        with engine.begin() as conn:
+            for table_name, columns in RAGDBRepository.MIGRATION_COLUMNS.items():
+                existing = [column["name"] for column in inspector.get_columns(table_name)]
+                for column_name, column_type in columns.items():
+                    if column_name not in existing:
+                        logger.info(f"RAGDBRepository.Migrate: adding column {table_name}.{column_name}")
+                        conn.execute(text(f'ALTER TABLE "{table_name}" ADD COLUMN "{column_name}" {column_type}'))
+
+            # create_all does not add indexes to tables that already exist
+            for table in Base.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.create(conn, checkfirst=True)
+
+            if engine.dialect.name == "sqlite":
+                RAGDBRepository._create_lexical_index(conn)
+
+    # The lexical index is an FTS5 table over IndexedDocumentChunks.Content that is kept up to date by triggers,
+    # so chunks are added to and removed from the index in the same transaction as the chunks themselves.
+    # The content is not copied; the index refers to the chunks by LexicalId. The implicit rowid cannot be used because the table has
+    # a VARCHAR primary key, so VACUUM may renumber it. LexicalId is assigned on insert from the largest LexicalId so it is never reused.
+    LEXICAL_INDEX_TRIGGERS = [
+        '''CREATE TRIGGER IF NOT EXISTS "IndexedDocumentChunks_fts_insert" AFTER INSERT ON "IndexedDocumentChunks" BEGIN
+            UPDATE "IndexedDocumentChunks" SET "LexicalId" = (SELECT coalesce(max("LexicalId"), 0) + 1 FROM "IndexedDocumentChunks")
+            WHERE rowid = new.rowid AND "LexicalId" IS NULL;
+            INSERT INTO "IndexedDocumentChunksFts"(rowid, "Content") SELECT "LexicalId", "Content" FROM "IndexedDocumentChunks" WHERE rowid = new.rowid;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS "IndexedDocumentChunks_fts_delete" AFTER DELETE ON "IndexedDocumentChunks" BEGIN
+            INSERT INTO "IndexedDocumentChunksFts"("IndexedDocumentChunksFts", rowid, "Content") VALUES ('delete', old."LexicalId", old."Content");
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS "IndexedDocumentChunks_fts_update" AFTER UPDATE OF "Content" ON "IndexedDocumentChunks" BEGIN
+            INSERT INTO "IndexedDocumentChunksFts"("IndexedDocumentChunksFts", rowid, "Content") VALUES ('delete', old."LexicalId", old."Content");
+            INSERT INTO "IndexedDocumentChunksFts"(rowid, "Content") VALUES (new."LexicalId", new."Content");
+        END'''
+    ]
+
+    @staticmethod
+    def _create_lexical_index(conn):
+        sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE name='IndexedDocumentChunksFts'")).scalar()
+        if sql is not None and "LexicalId" not in sql:
+            # Lexical index created by a previous version that referred to the chunks by rowid
+            logger.info(f"RAGDBRepository.Migrate: recreating lexical index")
+            conn.execute(text('DROP TABLE "IndexedDocumentChunksFts"'))
+            for trigger in ["insert", "delete", "update"]:
+                conn.execute(text(f'DROP TRIGGER IF EXISTS "IndexedDocumentChunks_fts_{trigger}"'))
+            sql = None
+        if sql is None:
+            logger.info(f"RAGDBRepository.Migrate: creating lexical index")
+            # Assign a LexicalId to the chunks created before the lexical index existed
+            conn.execute(text('''UPDATE "IndexedDocumentChunks" SET "LexicalId" = rowid + (SELECT coalesce(max("LexicalId"), 0) FROM "IndexedDocumentChunks")
+                WHERE "LexicalId" IS NULL'''))
+            conn.execute(text('''CREATE VIRTUAL TABLE "IndexedDocumentChunksFts" USING fts5("Content", content='IndexedDocumentChunks', content_rowid='LexicalId')'''))
+            conn.execute(text('''INSERT INTO "IndexedDocumentChunksFts"("IndexedDocumentChunksFts") VALUES ('rebuild')'''))
+        for trigger in RAGDBRepository.LEXICAL_INDEX_TRIGGERS:
+            conn.execute(text(trigger))
     
-    def __init__(self, session: Session):
+    def __init__(self, session: Session, blob_repo: RAGBlobRepository = None):
         self.config = get_gen_config()["gen"]["instructor-rag"]
         self.app_path = get_app_path()
+        if blob_repo is None:
+            blob_repo = RAGBlobRepository(os.path.join(self.app_path, self.config.get("blobs", {}).get("path", "rag/blobs")))
+        self.blob_repo = blob_repo
         self.chunks_path = os.path.join(self.app_path, self.config["chunks"]["path"])
         self.chunk_size = self.config["chunks"]["size"]
         self.chunk_overlap = self.config["chunks"]["overlap"]
@@ -48,11 +132,61 @@ class RAGDBRepository:
         return text
 
     '''
-    Used to get document_id from content
+    Used to get document_id from content. The id is the URL-safe Base64 SHA256 hash of the raw file bytes, read in blocks so that the file
+    is neither converted nor loaded into memory in full.
     '''
     def create_document_hash(self, file_path):
-        text = self._load_and_convert(file_path)
-        return file_utils.create_chunk_id_base64(text)
+        sha256 = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024*1024), b''):
+                sha256.update(block)
+        return base64.urlsafe_b64encode(sha256.digest()).decode().rstrip('=')
+
+    '''
+    Returns the id of the document in the collection with the same content as the file, or None if it is not in the collection.
+    Documents indexed before the id was based on the raw file bytes keep the hash of their converted text as id. The file is only
+    converted to compute that legacy id if the collection has another document of the same byte size.
+    '''
+    def find_document_id(self, collection_name, file_path):
+        try:
+            document_id = self.create_document_hash(file_path)
+            query = self.session.query(IndexedDocument.Id).filter(IndexedDocument.CollectionName==collection_name)
+            if query.filter(IndexedDocument.Id==document_id).first():
+                return document_id
+            candidates = [row.Id for row in query.filter(IndexedDocument.ByteSize==os.path.getsize(file_path)).all()]
+            if not candidates:
+                return None
+            legacy_id = file_utils.create_chunk_id_base64(self._load_and_convert(file_path))
+            return legacy_id if legacy_id in candidates else None
+        except Exception as e:
+            logger.error(f"RAGDBRepository.find_document_id: Error = {e}")
+            raise
+        finally:
+            self.session.close()
+
+    '''
+    Returns the text of the document. The text is converted once and cached in the blob store by document id for subsequent splits.
+    '''
+    def _load_text(self, existing_doc):
+        text = self.get_document_text(existing_doc.Id)
+        if text is not None:
+            return text
+        text = self._load_and_convert(self.get_document_file_path(existing_doc.FileRef), existing_doc.FileType)
+        self.save_document_text(existing_doc.Id, text)
+        return text
+
+    def get_document_file_path(self, file_ref):
+        return self.blob_repo.get_path(file_ref)
+
+    # Returns None if the text of the document is not converted yet.
+    def get_document_text(self, document_id):
+        return self.blob_repo.get_text(f"{document_id}.txt")
+
+    def has_document_text(self, document_id):
+        return self.blob_repo.exists(f"{document_id}.txt")
+
+    def save_document_text(self, document_id, text):
+        self.blob_repo.put_text(f"{document_id}.txt", text)
 
 
 # Collections -------------------------------------------------------------------------------------------------------------------------------------------
@@ -60,10 +194,17 @@ class RAGDBRepository:
     # However, Collection is a record in the RAGVSRepository.
 
     def purge(self):
+        engine = self.session.get_bind()
+        self.session.close()
+        # The lexical index has to be dropped on its own because its shadow tables cannot be dropped directly
+        if engine.dialect.name == "sqlite":
+            with engine.begin() as conn:
+                conn.execute(text('DROP TABLE IF EXISTS "IndexedDocumentChunksFts"'))
         metadata = MetaData()
-        metadata.reflect(bind=self.engine)
-        metadata.drop_all(bind=self.engine)
-        Base.metadata.create_all(self.engine)
+        metadata.reflect(bind=engine)
+        metadata.drop_all(bind=engine)
+        RAGDBRepository.Migrate(engine)
+        self.blob_repo.purge()
 
     '''
     Delete all the documents (and its chunks) with the given collection name.
@@ -83,8 +224,7 @@ class RAGDBRepository:
 
     def collection_chunk_count(self,collection_name):
         try:
-            chunks = self.session.query(IndexedDocumentChunk).join(IndexedDocumentChunkGroup).join(IndexedDocument).filter(IndexedDocument.CollectionName==collection_name).all()
-            return len(chunks)
+            return self.session.query(IndexedDocumentChunk).join(IndexedDocumentChunkGroup).join(IndexedDocument).filter(IndexedDocument.CollectionName==collection_name).count()
         except Exception as e:
             logger.error(f"RAGDBRepository: Error getting chunk count for collection {collection_name}. Error={str(e)}")
             raise
@@ -168,9 +308,8 @@ class RAGDBRepository:
             elif not isinstance(document.PublishedDate, date):
                 document.PublishedDate = None
 
-            # Read the file content
-            with open(file_path, 'rb') as f:
-                document.File = f.read()
+            # Copy the file into the blob store. Only the reference is saved in the database.
+            document.FileRef = self.blob_repo.put(document.Id, file_path)
             
             self.session.add(document)
             self.session.commit()
@@ -270,6 +409,11 @@ class RAGDBRepository:
                 self.session.delete(chunk_group)
             self.session.delete(document)
             self.session.commit()
+
+            # The same file can be shared by documents in other collections
+            if document.FileRef and self.session.query(IndexedDocument).filter(IndexedDocument.FileRef==document.FileRef).count() == 0:
+                self.blob_repo.delete(document.FileRef)
+                self.blob_repo.delete(f"{document.Id}.txt")
         except Exception as e:
             self.session.rollback()
             logger.error(f"RAGDBRepository.delete_document: Error = {e}")
@@ -282,9 +426,11 @@ class RAGDBRepository:
 
     '''
     There are many ways that a document can be chunked based on different strategies such as chunk size, overlap, algorithm, etc.
-    This function will create a chunk group and then create the chunks in chunks_dir based on the strategy.
+    This function will create a chunk group and its chunks based on the strategy. The document is split in memory and the chunks are
+    saved in the same order as they appear in the document.
+    splitter is an optional function splitter(text, chunk_size, chunk_overlap) that returns a list of chunks. Defaults to TextSplitter.
     '''
-    def create_chunkgroup(self, collection_name, document_id, chunk_size, chunk_overlap, splitter):
+    def create_chunkgroup(self, collection_name, document_id, chunk_size, chunk_overlap, splitter=None):
         try:
             existing_doc = self.session.query(IndexedDocument).filter(
                 IndexedDocument.Id==document_id, 
@@ -294,53 +440,129 @@ class RAGDBRepository:
             # Load text from database or load text converted from pdf from database
             if existing_doc is None:
                 raise ValueError(f"RAGDBRepository.create_chunkgroup: Document header not found {document_id}")
-            
-            if existing_doc.FileType == 'pdf':
-                import tempfile
-                with tempfile.NamedTemporaryFile() as temp_file:
-                    temp_file.write(existing_doc.File)
-                    temp_file_path = temp_file.name
-                    text = PDFConvert.pdf_to_text(temp_file_path)
-            elif existing_doc.FileType == 'txt':
-                text = existing_doc.File.decode('utf-8')
-            else:
-                raise ValueError(f"Unsupported file type: {existing_doc.FileType}")
-            
-            # Write the text into a temp text file
-            filename = ".".join(existing_doc.FileName.split(".")[:-1])
-            src_file = f"/tmp/{filename}.txt"
-            with open(src_file, 'w') as f:
-                f.write(text)
 
-            #Split temp text file into chunks and save into chunks_dir
             if chunk_size is None:
                 chunk_size = self.chunk_size
             if chunk_overlap is None:
                 chunk_overlap = self.chunk_overlap
-            chunks_dir = splitter(src_file=src_file, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-            chunks_count = len(os.listdir(chunks_dir))
+            contents = self._split_document(existing_doc, chunk_size, chunk_overlap, splitter)
 
             chunkgroup = IndexedDocumentChunkGroup()
             chunkgroup.Id = str(uuid.uuid4())
             chunkgroup.DocumentId = document_id
             chunkgroup.SplitAlgo = "recursive_split"
-            chunkgroup.ChunkCount = chunks_count
+            chunkgroup.ChunkCount = len(contents)
             chunkgroup.ChunkSize = chunk_size
             chunkgroup.Overlap = chunk_overlap
             chunkgroup.IsActive = True
-            chunkgroup.ChunksDir = chunks_dir
-
+            chunkgroup.ChunksDir = None
             self.session.add(chunkgroup)
+
+            self._add_chunks(chunkgroup, contents)
             self.session.commit()
             pydantic_chunkgroup = IndexedDocumentChunkGroupPydantic.from_dalc(chunkgroup)
             return pydantic_chunkgroup
 
         except Exception as e:
+            self.session.rollback()
             logger.error(f"RAGDBRepository.createChunkGroup: Failed to create chunkgroup document {document_id}. Error={str(e)}")
             raise
         finally:
             self.session.close()
 
+    '''
+    This function will load the text of the document and split it into a list of chunks in document order.
+    The file is converted directly from the blob store. Documents created before the blob store are loaded from the File column.
+    '''
+    def _split_document(self, existing_doc, chunk_size, chunk_overlap, splitter=None):
+        if existing_doc.FileRef:
+            text = self._load_text(existing_doc)
+        elif existing_doc.FileType == 'pdf':
+            import tempfile
+            with tempfile.NamedTemporaryFile() as temp_file:
+                temp_file.write(existing_doc.File)
+                temp_file.flush()
+                text = PDFConvert.pdf_to_text(temp_file.name)
+        elif existing_doc.FileType == 'txt':
+            text = existing_doc.File.decode('utf-8')
+        else:
+            raise ValueError(f"Unsupported file type: {existing_doc.FileType}")
+
+        if splitter is not None:
+            return list(splitter(text, chunk_size, chunk_overlap))
+        return TextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap, length_function=len, is_separator_regex=False).split_text(text)
+
+    '''
+    This function will split the document again and update an existing chunk group by comparing the new chunk hashes against the chunks in the group.
+    Chunks that are no longer found are deleted, new chunks are added as not indexed and unchanged chunks are kept as is and moved to their new position.
+    The chunk group is moved to document_id so that the chunk group of the previous revision of a document can be updated for the new revision.
+    Returns the chunk group, the ids of the removed chunks and the number of reused and added chunks.
+    '''
+    def update_chunkgroup(self, collection_name, chunkgroup_id, document_id, chunk_size, chunk_overlap, splitter=None):
+        try:
+            existing_doc = self.session.query(IndexedDocument).filter(
+                IndexedDocument.Id==document_id, 
+                IndexedDocument.CollectionName==collection_name
+                ).first()
+            if existing_doc is None:
+                raise ValueError(f"RAGDBRepository.update_chunkgroup: Document header not found {document_id}")
+            chunkgroup = self.session.query(IndexedDocumentChunkGroup).filter_by(Id=chunkgroup_id).first()
+            if chunkgroup is None:
+                raise ValueError(f"RAGDBRepository.update_chunkgroup: Chunk group not found {chunkgroup_id}")
+
+            if chunk_size is None:
+                chunk_size = self.chunk_size
+            if chunk_overlap is None:
+                chunk_overlap = self.chunk_overlap
+            contents = self._split_document(existing_doc, chunk_size, chunk_overlap, splitter)
+
+            # Existing chunks by hash. A chunk can appear more than once in a document.
+            existing_chunks = {}
+            for chunk in chunkgroup.Chunks:
+                existing_chunks.setdefault(chunk.ChunkHash, []).append(chunk)
+
+            # Reuse an existing chunk with the same hash at the new position, otherwise add a new chunk.
+            reused = 0
+            added_contents = []
+            added_indexes = []
+            for index, content in enumerate(contents):
+                found = existing_chunks.get(file_utils.create_chunk_id_base64(content))
+                if found:
+                    found.pop().ChunkIndex = index
+                    reused += 1
+                else:
+                    added_contents.append(content)
+                    added_indexes.append(index)
+
+            # Delete the chunks that are not found in the new split
+            removed_chunk_ids = []
+            for chunks in existing_chunks.values():
+                for chunk in chunks:
+                    removed_chunk_ids.append(chunk.Id)
+                    chunkgroup.Chunks.remove(chunk)
+                    self.session.delete(chunk)
+
+            self._add_chunks(chunkgroup, added_contents, added_indexes)
+
+            chunkgroup.DocumentId = document_id
+            chunkgroup.ChunkCount = len(contents)
+            chunkgroup.ChunkSize = chunk_size
+            chunkgroup.Overlap = chunk_overlap
+            chunkgroup.ChunksDir = None
+            self.session.commit()
+            return {
+                "chunkgroup": IndexedDocumentChunkGroupPydantic.from_dalc(chunkgroup),
+                "removed_chunk_ids": removed_chunk_ids,
+                "reused": reused,
+                "added": len(added_contents)
+            }
+        except Exception as e:
+            self.session.rollback()
+            logger.error(f"RAGDBRepository.update_chunkgroup: Failed to update chunkgroup {chunkgroup_id}. Error={str(e)}")
+            raise
+        finally:
+            self.session.close()
+
     def list_chunkgroup_ids(self, document_id=None):
         try:
             if document_id is not None:
@@ -391,48 +613,78 @@ class RAGDBRepository:
 # Chunks -------------------------------------------------------------------------------------------------------------------------------------------
 
     '''
-    For each file in the chunks_dir, create the corresponding chunk in the database and add it to the chunk group.
-    Returns an array of chunk info.
+    For each chunk in chunks, create the corresponding chunk in the database and add it to the end of the chunk group.
+    Returns an array of chunk info in the same order as chunks.
     '''
-    def create_chunks(self, chunk_group_id, chunks_dir):
-        result = []
+    def create_chunks(self, chunk_group_id, chunks):
         try:
             chunk_group = self.session.query(IndexedDocumentChunkGroup).filter_by(Id=chunk_group_id).first()
-
-            chunk_ids = os.listdir(chunks_dir)
-            for chunk_id in tqdm(chunk_ids):
-                chunk = IndexedDocumentChunk()
-                chunk.Id = str(uuid.uuid4())
-                chunk.ChunkGroupId = chunk_group.Id
-
-                # Load content
-                chunk.Content = None
-                with open(os.path.join(chunks_dir, chunk_id), 'rb') as f:
-                    chunk.Content = f.read().decode('utf-8')
-                    chunk.ByteSize = len(chunk.Content)
-
-                # Create chunk hash and check for mismatch
-                chunk.ChunkHash = file_utils.create_chunk_id_base64(chunk.Content)
-                if (chunk.ChunkHash != chunk_id):
-                    raise ValueError(f"RAGDBRepository.create_chunks: Chunk hash mismatch: {chunk.ChunkHash} != {chunk_id}")
-
-                # Check for chunk hash duplicates in DB
-                found = self.session.query(IndexedDocumentChunk).filter_by(ChunkHash=chunk_id).first()
-
-                chunk.IsDuplicate= (found is not None)
-                chunk.IsIndexed = False 
-                chunk_group.Chunks.append(chunk)
-                self.session.add(chunk)
-
-                result.append(ChunkInfoPydantic(
-                    Id=chunk.Id, 
-                    ChunkHash=chunk.ChunkHash, 
-                    IsDuplicate=chunk.IsDuplicate, 
-                    IsIndexed=chunk.IsIndexed))
+            if chunk_group is None:
+                raise ValueError(f"RAGDBRepository.create_chunks: Chunk group not found {chunk_group_id}")
+            start = len(chunk_group.Chunks)
+            created = self._add_chunks(chunk_group, chunks, range(start, start+len(chunks)))
+            chunk_group.ChunkCount = start + len(chunks)
+            result = [ChunkInfoPydantic(
+                    Id=chunk["Id"], 
+                    ChunkHash=chunk["ChunkHash"], 
+                    IsDuplicate=chunk["IsDuplicate"], 
+                    IsIndexed=chunk["IsIndexed"]) for chunk in created]
             self.session.commit()
             return result
         except Exception as e:
-            logger.error(f"RAGDBRepository.create_chunks: Error splitting chunks for group {chunk_group_id}. Error={str(e)}")
+            self.session.rollback()
+            logger.error(f"RAGDBRepository.create_chunks: Error creating chunks for group {chunk_group_id}. Error={str(e)}")
+            raise
+        finally:
+            self.session.close()
+
+    # Add the chunks to the chunk group without committing. chunk_indexes are the positions of the chunks in the document.
+    # Duplicates are looked up with a single IN query per batch and the chunks are inserted with a single executemany.
+    def _add_chunks(self, chunk_group, contents, chunk_indexes=None):
+        if chunk_indexes is None:
+            chunk_indexes = range(len(contents))
+        chunks = []
+        for chunk_index, content in zip(chunk_indexes, contents):
+            chunks.append({
+                "Id": str(uuid.uuid4()),
+                "ChunkGroupId": chunk_group.Id,
+                "ChunkIndex": chunk_index,
+                "Content": content,
+                "ByteSize": len(content),
+                "ChunkHash": file_utils.create_chunk_id_base64(content),
+                "IsIndexed": False
+            })
+        if not chunks:
+            return chunks
+
+        # Check for chunk hash duplicates in DB and in the chunks before it
+        seen = self._find_chunk_hashes([chunk["ChunkHash"] for chunk in chunks])
+        for chunk in chunks:
+            chunk["IsDuplicate"] = chunk["ChunkHash"] in seen
+            seen.add(chunk["ChunkHash"])
+
+        self.session.flush()
+        self.session.execute(insert(IndexedDocumentChunk), chunks)
+        return chunks
+
+    # Returns the subset of chunk_hashes that are found in the database. The IN list is batched to stay below the SQLite variable limit.
+    def _find_chunk_hashes(self, chunk_hashes, batch_size=500):
+        chunk_hashes = list(set(chunk_hashes))
+        found = set()
+        for start in range(0, len(chunk_hashes), batch_size):
+            rows = self.session.query(IndexedDocumentChunk.ChunkHash).filter(
+                IndexedDocumentChunk.ChunkHash.in_(chunk_hashes[start:start+batch_size])).all()
+            found.update(row.ChunkHash for row in rows)
+        return found
+
+    def update_chunks_indexed(self, chunk_ids, is_indexed=True):
+        try:
+            self.session.query(IndexedDocumentChunk).filter(IndexedDocumentChunk.Id.in_(chunk_ids)).update(
+                {IndexedDocumentChunk.IsIndexed: is_indexed}, synchronize_session=False)
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            logger.error(f"RAGDBRepository.update_chunks_indexed: Error = {e}")
             raise
         finally:
             self.session.close()
@@ -441,7 +693,7 @@ class RAGDBRepository:
         try:
             if chunkgroup_id is None:
                 return self.session.query(IndexedDocumentChunk).all()
-            return self.session.query(IndexedDocumentChunk).filter_by(ChunkGroupId=chunkgroup_id).all()
+            return self.session.query(IndexedDocumentChunk).filter_by(ChunkGroupId=chunkgroup_id).order_by(IndexedDocumentChunk.ChunkIndex).all()
         except Exception as e:
             logger.error(f"RAGDBRepository.list_chunks: Error = {e}")
             raise
@@ -455,4 +707,132 @@ class RAGDBRepository:
             logger.error(f"RAGDBRepository.get_chunk: Error = {e}")
             raise
         finally:
-            self.session.close()
\ No newline at end of file
+            self.session.close()
+
+# Lexical search -------------------------------------------------------------------------------------------------------------------------------------------
+
+    '''
+    Returns the ids and BM25 scores of the chunks in the collection that best match the words in the query, best match first.
+    A chunk matches if it contains any of the words, so identifiers such as part numbers that are split into several words still match.
+    Every chunk that matches is scored, so the rarest words are used until max_postings chunks would be scored and the more common words,
+    which add little to the BM25 score, are left out. Nothing is returned if even the rarest word is that common.
+    '''
+    def search_chunks(self, collection_name, query_text, n_results=20, max_postings=None):
+        if max_postings is None:
+            max_postings = self.config.get("hybrid", {}).get("max_postings", 10000)
+        # Split the query into words the same way as the unicode61 tokenizer of the index, which also removes diacritics
+        query_text = "".join(c for c in unicodedata.normalize("NFKD", query_text.lower()) if not unicodedata.combining(c))
+        terms = list(dict.fromkeys(re.findall(r"[^\W_]+", query_text)))
+        if not terms:
+            return []
+        try:
+            # Count the chunks of each word in the collection, stopping at max_postings so that common words are not counted in full
+            counts = {}
+            for term in terms:
+                counts[term] = self.session.execute(text('''
+                    SELECT count(*) FROM (
+                        SELECT 1 FROM "IndexedDocumentChunksFts"
+                        JOIN "IndexedDocumentChunks" c ON c."LexicalId" = "IndexedDocumentChunksFts".rowid
+                        JOIN "IndexedDocumentChunkGroups" g ON g."Id" = c."ChunkGroupId"
+                        JOIN "IndexedDocuments" d ON d."Id" = g."DocumentId"
+                        WHERE "IndexedDocumentChunksFts" MATCH :term AND d."CollectionName" = :collection_name
+                        LIMIT :limit)'''),
+                    {"term": f'"{term}"', "collection_name": collection_name, "limit": max_postings + 1}).scalar()
+
+            # Keep the rarest words within the budget. The rarest word is always kept even if it is over the budget.
+            postings = 0
+            terms = []
+            for term in sorted(counts, key=counts.get):
+                if counts[term] == 0:
+                    continue
+                if terms and postings + counts[term] > max_postings:
+                    break
+                postings += counts[term]
+                terms.append(term)
+            if not terms:
+                return []
+
+            rows = self.session.execute(text('''
+                SELECT c."Id", bm25("IndexedDocumentChunksFts") AS "Score"
+                FROM "IndexedDocumentChunksFts"
+                JOIN "IndexedDocumentChunks" c ON c."LexicalId" = "IndexedDocumentChunksFts".rowid
+                JOIN "IndexedDocumentChunkGroups" g ON g."Id" = c."ChunkGroupId"
+                JOIN "IndexedDocuments" d ON d."Id" = g."DocumentId"
+                WHERE "IndexedDocumentChunksFts" MATCH :query AND d."CollectionName" = :collection_name
+                ORDER BY "Score"
+                LIMIT :n_results'''), {
+                    "query": " OR ".join(f'"{term}"' for term in terms),
+                    "collection_name": collection_name,
+                    "n_results": n_results
+                }).all()
+            # bm25() is negative and lower is better
+            return [(row.Id, -row.Score) for row in rows]
+        except Exception as e:
+            logger.error(f"RAGDBRepository.search_chunks: Error = {e}")
+            raise
+        finally:
+            self.session.close()
+
+    '''
+    Rebuild the lexical index from the chunks, eg. if it was restored from a backup that is out of date with the chunks.
+    '''
+    def rebuild_lexical_index(self):
+        try:
+            self.session.execute(text('''INSERT INTO "IndexedDocumentChunksFts"("IndexedDocumentChunksFts") VALUES ('rebuild')'''))
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            logger.error(f"RAGDBRepository.rebuild_lexical_index: Error = {e}")
+            raise
+        finally:
+            self.session.close()
+
+# Embeddings -------------------------------------------------------------------------------------------------------------------------------------------
+
+    '''
+    Returns the cached embeddings of the chunk hashes for the embedding model as a dictionary of chunk hash to embedding.
+    Chunk hashes that are not cached are left out so that the caller only needs to embed the missing ones.
+    The IN list is batched to stay below the SQLite variable limit.
+    '''
+    def get_embeddings(self, model_name, chunk_hashes, batch_size=500):
+        try:
+            chunk_hashes = list(set(chunk_hashes))
+            embeddings = {}
+            for start in range(0, len(chunk_hashes), batch_size):
+                entries = self.session.query(IndexedChunkEmbedding.ChunkHash, IndexedChunkEmbedding.Embedding).filter(
+                    IndexedChunkEmbedding.ModelName==model_name,
+                    IndexedChunkEmbedding.ChunkHash.in_(chunk_hashes[start:start+batch_size])).all()
+                embeddings.update({ entry.ChunkHash: np.frombuffer(entry.Embedding, dtype=np.float32).tolist() for entry in entries })
+            return embeddings
+        except Exception as e:
+            logger.error(f"RAGDBRepository.get_embeddings: Error = {e}")
+            raise
+        finally:
+            self.session.close()
+
+    '''
+    Saves a dictionary of chunk hash to embedding for the embedding model.
+    The rows are written in a single executemany and existing embeddings are replaced.
+    '''
+    def save_embeddings(self, model_name, embeddings):
+        try:
+            if not embeddings:
+                return
+            created_at = datetime.now()
+            rows = []
+            for chunk_hash, embedding in embeddings.items():
+                vector = np.asarray(embedding, dtype=np.float32)
+                rows.append({
+                    "ModelName": model_name,
+                    "ChunkHash": chunk_hash,
+                    "Dimension": len(vector),
+                    "Embedding": vector.tobytes(),
+                    "CreatedAt": created_at})
+            self.session.execute(insert(IndexedChunkEmbedding).prefix_with("OR REPLACE"), rows)
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            logger.error(f"RAGDBRepository.save_embeddings: Error = {e}")
+            raise
+        finally:
+            self.session.close()
@@ -0,0 +1,114 @@
+import uuid
+from datetime import datetime
+from sqlalchemy.orm import Session
+from gai_common import logging
+from gai.gen.rag.dalc.IndexingJob import IndexingJob
+logger = logging.getLogger(__name__)
+
+class RAGJobRepository:
+    """
+    # Documentation
+    Descriptions: Persists the indexing jobs processed by RAGJobQueue.
+    A job moves from Pending to Running to Completed or Failed. The Step, DocumentId and ChunkGroupId columns record how far a running job has got
+    so that it can continue from the last completed step after a restart.
+    Example:
+        job_repo = RAGJobRepository(session)
+        job = job_repo.create_job(collection_name="demo", file_path="/tmp/jobs/1234/attention-is-all-you-need.pdf", file_type="pdf")
+    """
+
+    PENDING = "Pending"
+    RUNNING = "Running"
+    COMPLETED = "Completed"
+    FAILED = "Failed"
+
+    def __init__(self, session: Session):
+        self.session = session
+
+    def create_job(self, collection_name, file_path, file_type=None, metadata=None, chunk_size=None, chunk_overlap=None, job_id=None):
+        try:
+            now = datetime.now()
+            job = IndexingJob(
+                Id=job_id or str(uuid.uuid4()),
+                CollectionName=collection_name,
+                FilePath=file_path,
+                FileType=file_type,
+                Metadata=metadata,
+                ChunkSize=chunk_size,
+                ChunkOverlap=chunk_overlap,
+                Status=self.PENDING,
+                Step="header",
+                ChunksTotal=0,
+                ChunksIndexed=0,
+                CreatedAt=now,
+                UpdatedAt=now)
+            self.session.add(job)
+            self.session.commit()
+            return self.get_job(job.Id)
+        except Exception as e:
+            self.session.rollback()
+            logger.error(f"RAGJobRepository.create_job: Error = {e}")
+            raise
+        finally:
+            self.session.close()
+
+    def get_job(self, job_id):
+        try:
+            return self.session.query(IndexingJob).filter_by(Id=job_id).first()
+        except Exception as e:
+            logger.error(f"RAGJobRepository.get_job: Error = {e}")
+            raise
+        finally:
+            self.session.close()
+
+    def list_jobs(self, collection_name=None, status=None):
+        try:
+            query = self.session.query(IndexingJob)
+            if collection_name:
+                query = query.filter_by(CollectionName=collection_name)
+            if status:
+                query = query.filter_by(Status=status)
+            return query.order_by(IndexingJob.CreatedAt).all()
+        except Exception as e:
+            logger.error(f"RAGJobRepository.list_jobs: Error = {e}")
+            raise
+        finally:
+            self.session.close()
+
+    # Update the given columns of the job, eg. update_job(job_id, Step="split", DocumentId=document_id)
+    def update_job(self, job_id, **columns):
+        try:
+            columns["UpdatedAt"] = datetime.now()
+            self.session.query(IndexingJob).filter_by(Id=job_id).update(columns, synchronize_session=False)
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            logger.error(f"RAGJobRepository.update_job: Error = {e}")
+            raise
+        finally:
+            self.session.close()
+
+    def start_job(self, job_id):
+        self.update_job(job_id, Status=self.RUNNING, StartedAt=datetime.now(), Error=None)
+
+    def complete_job(self, job_id):
+        self.update_job(job_id, Status=self.COMPLETED, CompletedAt=datetime.now())
+
+    def fail_job(self, job_id, error):
+        self.update_job(job_id, Status=self.FAILED, Error=str(error), CompletedAt=datetime.now())
+
+    '''
+    Jobs that were still running when the service stopped are put back in the queue. Returns the pending jobs in the order they were submitted.
+    '''
+    def reset_running_jobs(self):
+        try:
+            self.session.query(IndexingJob).filter_by(Status=self.RUNNING).update(
+                {IndexingJob.Status: self.PENDING, IndexingJob.UpdatedAt: datetime.now()}, synchronize_session=False)
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            logger.error(f"RAGJobRepository.reset_running_jobs: Error = {e}")
+            raise
+        finally:
+            self.session.close()
+        return self.list_jobs(status=self.PENDING)
+
@@ -1,4 +1,5 @@
 import os
+import threading
 from gai.gen.rag.models.IndexedDocumentChunkPydantic import IndexedDocumentChunkPydantic
 from gai.gen.rag.models.IndexedDocumentPydantic import IndexedDocumentPydantic
 from chromadb.config import Settings
@@ -8,11 +9,10 @@ from gai_common import logging
 logger = logging.getLogger(__name__)
 import json
 from chromadb.utils.embedding_functions import InstructorEmbeddingFunction
+from gai.gen.rag.LRUCache import LRUCache
 from dotenv import load_dotenv
 load_dotenv()
 
-import pandas as pd
-
 
 class RAGVSRepository:
 
@@ -44,19 +44,66 @@ class RAGVSRepository:
         self.client = client
         self.n_results = config["chromadb"]["n_results"]
 
+        # Collection handles are cached by name so that each call does not look up the collection in chromadb again.
+        # _collections holds the handles with the embedding function and is cleared when the embedding function is replaced.
+        # The lock is held while a handle is looked up and while a collection is deleted, so a handle of a deleted collection is never cached.
+        self._collections = {}
+        self._collections_ef = ef
+        self._plain_collections = {}
+        self._collections_lock = threading.RLock()
+
+        # Query embeddings are cached by (embedding model, normalized query). Set embedding_model_name when the embedding function is loaded.
+        # Retrieval results are cached by collection version, which is incremented whenever the collection is written to.
+        cache_config = config.get("cache", {})
+        self.embedding_model_name = None
+        self._query_embeddings = LRUCache(cache_config.get("query_embeddings", 1024))
+        self._results = LRUCache(cache_config.get("results", 256))
+        self._collection_versions = {}
+
+    def _clear_collections(self, collection_name=None):
+        with self._collections_lock:
+            if collection_name is None:
+                self._collections.clear()
+                self._plain_collections.clear()
+                self._results.clear()
+                return
+            self._collections.pop(collection_name, None)
+            self._plain_collections.pop(collection_name, None)
+            self._collection_changed(collection_name)
+
+    # Cached retrieval results of the collection are no longer used after this is called.
+    def _collection_changed(self, collection_name):
+        self._collection_versions[collection_name] = self._collection_versions.get(collection_name, 0) + 1
+
     def purge(self):
-        self.client.reset()
+        with self._collections_lock:
+            self.client.reset()
+            self._clear_collections()
+
+    def reset(self):
+        with self._collections_lock:
+            self.client.reset()
+            self._clear_collections()
 
 #Collections-------------------------------------------------------------------------------------------------------------------------------------------
 
+    # Returns the cached handle if the collection has been used for indexing or retrieval, since any handle can be used to get, count or delete chunks.
     def get_or_create_collection(self, collection_name):
-        return self.client.get_or_create_collection(collection_name)
+        with self._collections_lock:
+            collection = self._collections.get(collection_name) or self._plain_collections.get(collection_name)
+            if collection is None:
+                collection = self.client.get_or_create_collection(collection_name)
+                self._plain_collections[collection_name] = collection
+            return collection
     
     def list_collections(self):
         return self.client.list_collections()
     
     def delete_collection(self, collection_name):
-        return self.client.delete_collection(collection_name)
+        with self._collections_lock:
+            result = self.client.delete_collection(collection_name)
+            self._clear_collections(collection_name)
+            return result
     
     def collection_chunk_count(self,collection_name):
         collection=self.get_or_create_collection(collection_name)
@@ -81,6 +128,7 @@ class RAGVSRepository:
     def delete_document(self, collection_name, doc_id):
         collection=self.get_or_create_collection(collection_name)
         collection.delete(where={"DocumentId": {"$eq":doc_id}})
+        self._collection_changed(collection_name)
 
 
 #ChunkGroup-------------------------------------------------------------------------------------------------------------------------------------------
@@ -88,6 +136,7 @@ class RAGVSRepository:
     def delete_chunkgroup(self, collection_name, chunkgroup_id):
         collection=self.get_or_create_collection(collection_name)
         collection.delete(where={"ChunkGroupId": {"$eq":chunkgroup_id}})
+        self._collection_changed(collection_name)
 
 
 #Chunks-------------------------------------------------------------------------------------------------------------------------------------------
@@ -98,9 +147,26 @@ class RAGVSRepository:
         chunk=collection.get(ids=[chunk_id])
         return chunk
 
+    # Returns the chunks with the given ids in the same format as retrieve but without distances. Ids that are not found are left out.
+    def get_chunks(self, collection_name, chunk_ids):
+        if not chunk_ids:
+            return []
+        collection=self.get_or_create_collection(collection_name)
+        result=collection.get(ids=chunk_ids)
+        return [{'documents': document, 'metadatas': metadata, 'distances': None, 'ids': id}
+            for document, metadata, id in zip(result['documents'], result['metadatas'], result['ids'])]
+
     def delete_chunk(self, collection_name, chunk_id):
         collection=self.get_or_create_collection(collection_name)
         collection.delete(ids=[chunk_id])
+        self._collection_changed(collection_name)
+
+    def delete_chunks(self, collection_name, chunk_ids):
+        if not chunk_ids:
+            return
+        collection=self.get_or_create_collection(collection_name)
+        collection.delete(ids=chunk_ids)
+        self._collection_changed(collection_name)
 
 #RAG-------------------------------------------------------------------------------------------------------------------------------------------
 
@@ -109,7 +175,21 @@ class RAGVSRepository:
     def _get_collection(self, collection_name):
         if (self._ef is None):
             raise ValueError("ef is required")
-        return self.client.get_or_create_collection(collection_name, embedding_function=self._ef, metadata={"hnsw:space": "cosine"})
+        with self._collections_lock:
+            self._check_ef()
+            collection = self._collections.get(collection_name)
+            if collection is None:
+                collection = self.client.get_or_create_collection(collection_name, embedding_function=self._ef, metadata={"hnsw:space": "cosine"})
+                self._collections[collection_name] = collection
+            return collection
+
+    # Handles and embeddings from a previous embedding function are not used after it is replaced.
+    def _check_ef(self):
+        if self._ef is not self._collections_ef:
+            self._collections.clear()
+            self._query_embeddings.clear()
+            self._results.clear()
+            self._collections_ef = self._ef
 
     def index_chunk(self, collection_name, content, chunk_id, document_id, chunkgroup_id, source, abstract, title, published_date, keywords):
         if document_id is None:
@@ -128,30 +208,129 @@ class RAGVSRepository:
             }
             collection=self._get_collection(collection_name)
             collection.upsert(documents=[content],metadatas=[metadata],ids=[chunk_id])
+            self._collection_changed(collection_name)
         except Exception as e:
             logger.error(f"Failed to index chunk in chromadb: {e}, metadata={metadata}")
             raise e
         
+    # Index a batch of chunks from the same chunkgroup with a single upsert so that the chunks are embedded together.
+    # If embeddings are provided, they are stored as is and the chunks are not embedded again.
+    def index_chunks(self, collection_name, contents, chunk_ids, document_id, chunkgroup_id, source, abstract, title, published_date, keywords, embeddings=None):
+        if document_id is None:
+            raise ValueError("document_id is required")
+        if chunkgroup_id is None:
+            raise ValueError("chunkgroup_id is required")
+        if len(contents) != len(chunk_ids):
+            raise ValueError("contents and chunk_ids must have the same length")
+        try:
+            metadata = {
+                "DocumentId": document_id,
+                "ChunkGroupId": chunkgroup_id,
+                "Source": source if source else "",
+                "Abstract": abstract if abstract else "",
+                "Title": title if title else "",
+                "PublishedDate": published_date if published_date else "",
+                "Keywords": keywords if keywords else ""                
+            }
+            collection=self._get_collection(collection_name)
+            collection.upsert(documents=contents,metadatas=[metadata]*len(contents),ids=chunk_ids,embeddings=embeddings)
+            self._collection_changed(collection_name)
+        except Exception as e:
+            logger.error(f"Failed to index chunks in chromadb: {e}, metadata={metadata}")
+            raise e
+
+    # Embed the contents with the embedding function without indexing them.
+    def embed(self, contents):
+        if (self._ef is None):
+            raise ValueError("ef is required")
+        return [[float(x) for x in embedding] for embedding in self._ef(contents)]
+
+    # Update the metadata of indexed chunks without embedding them again. Used when chunks are reused by a new revision of a document.
+    def update_chunks_metadata(self, collection_name, chunk_ids, document_id, chunkgroup_id, source, abstract, title, published_date, keywords):
+        if not chunk_ids:
+            return
+        try:
+            metadata = {
+                "DocumentId": document_id,
+                "ChunkGroupId": chunkgroup_id,
+                "Source": source if source else "",
+                "Abstract": abstract if abstract else "",
+                "Title": title if title else "",
+                "PublishedDate": published_date if published_date else "",
+                "Keywords": keywords if keywords else ""                
+            }
+            collection=self._get_collection(collection_name)
+            collection.update(ids=chunk_ids,metadatas=[metadata]*len(chunk_ids))
+            self._collection_changed(collection_name)
+        except Exception as e:
+            logger.error(f"Failed to update chunks in chromadb: {e}, metadata={metadata}")
+            raise e
+
+    # Whitespace differences do not change the cache key of a query.
+    def _normalize_query(self, query_text):
+        return " ".join(query_text.split())
+
+    # Embed the queries, reusing the cached embeddings of queries that have been embedded before.
+    def embed_queries(self, query_texts):
+        self._check_ef()
+        queries = [self._normalize_query(query_text) for query_text in query_texts]
+        embeddings = [self._query_embeddings.get((self.embedding_model_name, query)) for query in queries]
+        missing = list(dict.fromkeys([query for query, embedding in zip(queries, embeddings) if embedding is None]))
+        if missing:
+            new_embeddings = dict(zip(missing, self.embed(missing)))
+            for query, embedding in new_embeddings.items():
+                self._query_embeddings.put((self.embedding_model_name, query), embedding)
+            embeddings = [embedding if embedding is not None else new_embeddings[query] for query, embedding in zip(queries, embeddings)]
+        return embeddings
+
     def retrieve(self, collection_name, query_texts, n_results=None):
+        if isinstance(query_texts, str):
+            query_texts = [query_texts]
+        return self.retrieve_batch(collection_name, query_texts[:1], n_results)[0]
+
+    # Retrieve the results of many queries with a single chromadb query. The queries that are not cached are embedded together.
+    # query_embeddings can be passed to reuse the embeddings across collections.
+    # Returns one list of chunks per query sorted by distance, or None if nothing is found. Each chunk is a dict with the keys documents, metadatas, distances and ids.
+    def retrieve_batch(self, collection_name, query_texts, n_results=None, query_embeddings=None):
         logger.info(f"Retrieving by query {query_texts}...")
         collection = self._get_collection(collection_name)
         if n_results is None:
             n_results = self.n_results
-        result = collection.query(query_texts=query_texts, n_results=n_results)
 
-        # Not found
-        if 'ids' not in result or result['ids'] is None or len(result['ids']) == 0 or len(result['ids'][0]) == 0:
-            return None
+        version = self._collection_versions.get(collection_name, 0)
+        result_keys = [(collection_name, version, self.embedding_model_name, self._normalize_query(query_text), n_results) for query_text in query_texts]
+        results = []
+        for result_key in result_keys:
+            cached = self._results.get(result_key)
+            results.append([dict(chunk) for chunk in cached] if cached is not None else None)
+        missing = [i for i, result in enumerate(results) if result is None]
+        if not missing:
+            return results
+
+        if query_embeddings is None:
+            query_embeddings = self.embed_queries([query_texts[i] for i in missing])
+        else:
+            query_embeddings = [query_embeddings[i] for i in missing]
+        result = collection.query(query_embeddings=query_embeddings, n_results=n_results)
 
-        if len(result['ids']) > 0:
-            logger.debug('result='+ str(result['ids']))
+        # Not found
+        if 'ids' not in result or result['ids'] is None or len(result['ids']) == 0:
+            return results
 
-        df = pd.DataFrame({
-            'documents': result['documents'][0],
-            'metadatas': result['metadatas'][0],
-            'distances': result['distances'][0],
-            'ids': result['ids'][0]
-        })
+        logger.debug('result='+ str(result['ids']))
+        for position, i in enumerate(missing):
+            if len(result['ids'][position]) == 0:
+                continue
 
-        # drop duplicates
-        return df.drop_duplicates(subset=['ids']).sort_values('distances', ascending=True)
\ No newline at end of file
+            # sort by distance and drop duplicates in one pass
+            rows = zip(result['documents'][position], result['metadatas'][position], result['distances'][position], result['ids'][position])
+            chunks = []
+            seen = set()
+            for document, metadata, distance, id in sorted(rows, key=lambda row: row[2]):
+                if id in seen:
+                    continue
+                seen.add(id)
+                chunks.append({'documents': document, 'metadatas': metadata, 'distances': distance, 'ids': id})
+            self._results.put(result_keys[i], chunks)
+            results[i] = [dict(chunk) for chunk in chunks]
+        return results
@@ -1,3 +1,5 @@
 from .IndexedDocument import IndexedDocument
 from .IndexedDocumentChunk import IndexedDocumentChunk
-from .IndexedDocumentChunkGroup import IndexedDocumentChunkGroup
\ No newline at end of file
+from .IndexedDocumentChunkGroup import IndexedDocumentChunkGroup
+from .IndexedChunkEmbedding import IndexedChunkEmbedding
+from .IndexingJob import IndexingJob
\ No newline at end of file
@@ -11,6 +11,10 @@ class IndexedDocumentChunkGroupPydantic(BaseModel):
     Overlap: int
     IsActive: bool = True
     ChunksDir: Optional[str] = None
+    # Only set when the chunk group is updated incrementally
+    ChunksReused: Optional[int] = None
+    ChunksAdded: Optional[int] = None
+    ChunksRemoved: Optional[int] = None
 
     @staticmethod
     def from_dalc(orm):
@@ -10,6 +10,7 @@ class IndexedDocumentHeaderPydantic(BaseModel):
     ByteSize: int
     FileName: Optional[str] = None
     FileType: Optional[str] = None
+    FileRef: Optional[str] = None
     Source: Optional[str] = None
     Abstract: Optional[str] = None
     Authors: Optional[str] = None
@@ -36,6 +37,7 @@ class IndexedDocumentHeaderPydantic(BaseModel):
                 ByteSize=orm.ByteSize,
                 FileName=orm.FileName,
                 FileType=orm.FileType,
+                FileRef=orm.FileRef,
                 Source=orm.Source,
                 Abstract=orm.Abstract,
                 Authors=orm.Authors,
@@ -11,6 +11,7 @@ class IndexedDocumentPydantic(BaseModel):
     FileName: Optional[str] = None
     FileType: Optional[str] = None
     File: Optional[bytes] = None
+    FileRef: Optional[str] = None
     Source: Optional[str] = None
     Abstract: Optional[str] = None
     Authors: Optional[str] = None
@@ -44,5 +45,6 @@ class IndexedDocumentPydantic(BaseModel):
             UpdatedAt=orm.UpdatedAt,
             IsActive=orm.IsActive,
             File=orm.File,
+            FileRef=orm.FileRef,
             ChunkGroups=[IndexedDocumentChunkGroupPydantic.from_dalc(cg) for cg in orm.ChunkGroups]
         )
\ No newline at end of file
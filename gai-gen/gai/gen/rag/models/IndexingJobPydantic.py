@@ -0,0 +1,47 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+from datetime import datetime
+
+class IndexingJobPydantic(BaseModel):
+    Id: str = Field(...)
+    CollectionName: str
+    FileType: Optional[str] = None
+    Status: str
+    Step: Optional[str] = None
+    DocumentId: Optional[str] = None
+    ChunkGroupId: Optional[str] = None
+    ChunksTotal: int = 0
+    ChunksIndexed: int = 0
+    Progress: float = 0.0               # Fraction of the chunks indexed
+    ChunksPerSecond: Optional[float] = None
+    Error: Optional[str] = None
+    CreatedAt: datetime
+    StartedAt: Optional[datetime] = None
+    UpdatedAt: Optional[datetime] = None
+    CompletedAt: Optional[datetime] = None
+
+    @staticmethod
+    def from_dalc(orm):
+        chunks_total = orm.ChunksTotal or 0
+        chunks_indexed = orm.ChunksIndexed or 0
+        progress = chunks_indexed/chunks_total if chunks_total else 0.0
+        if orm.Status == "Completed":
+            progress = 1.0
+        return IndexingJobPydantic(
+            Id=orm.Id,
+            CollectionName=orm.CollectionName,
+            FileType=orm.FileType,
+            Status=orm.Status,
+            Step=orm.Step,
+            DocumentId=orm.DocumentId,
+            ChunkGroupId=orm.ChunkGroupId,
+            ChunksTotal=chunks_total,
+            ChunksIndexed=chunks_indexed,
+            Progress=progress,
+            ChunksPerSecond=orm.ChunksPerSecond,
+            Error=orm.Error,
+            CreatedAt=orm.CreatedAt,
+            StartedAt=orm.StartedAt,
+            UpdatedAt=orm.UpdatedAt,
+            CompletedAt=orm.CompletedAt
+        )
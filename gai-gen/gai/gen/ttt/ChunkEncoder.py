@@ -0,0 +1,90 @@
+import json
+from gai.gen.ttt.ChunkOutputBuilder import ChunkOutputBuilder
+
+class ChunkEncoder:
+    """
+    # Documentation
+    Descriptions: Per-stream chunk encoder with the same Build* methods as ChunkOutputBuilder.
+    chunk_format=None returns ChatCompletionChunk objects built by ChunkOutputBuilder for library callers.
+    chunk_format="ndjson" or "sse" returns ready-to-send bytes. The JSON is rendered from byte templates that are prepared once
+    per stream, so the completion id and creation time are shared by all the chunks of the stream and no pydantic objects are
+    created per token.
+    Example:
+        encoder = ChunkEncoder(generator="mistral7b-exllama", chunk_format="ndjson")
+        encoder.BuildContentBody(content="Once")
+        => b'{"id":"chatcmpl-...","choices":[{"delta":{"content":"Once",...},...}],...}\\n'
+    """
+
+    CHUNK_FORMATS = [None, "ndjson", "sse"]
+
+    def __init__(self, generator, chunk_format=None):
+        if chunk_format not in ChunkEncoder.CHUNK_FORMATS:
+            raise Exception(f"ChunkEncoder: chunk_format {chunk_format} is not supported.")
+        self.generator = generator
+        self.chunk_format = chunk_format
+        if chunk_format is None:
+            return
+
+        # The field order follows ChatCompletionChunk so that the output is the same as the pydantic chunks.
+        chatcompletion_id = ChunkOutputBuilder.Generate_ChatCompletion_Id()
+        created = ChunkOutputBuilder.Generate_CreationTime()
+        self._id = chatcompletion_id
+        self._created = created
+        self._prefix = b'{"id":' + json.dumps(chatcompletion_id).encode() + b',"choices":[{"delta":'
+        self._suffix = (b',"index":0,"logprobs":null}],"created":' + str(created).encode()
+            + b',"model":' + json.dumps(generator).encode()
+            + b',"object":"chat.completion.chunk","system_fingerprint":null}')
+        if chunk_format == "sse":
+            self._start = b'data: '
+            self._end = b'\n\n'
+        else:
+            self._start = b''
+            self._end = b'\n'
+        self._content_head = self._frame(b'{"content":"","function_call":null,"role":"assistant","tool_calls":null},"finish_reason":null')
+        self._content_body_start = self._start + self._prefix + b'{"content":'
+        self._content_body_end = b',"function_call":null,"role":null,"tool_calls":null},"finish_reason":null' + self._suffix + self._end
+
+    def _frame(self, body):
+        return self._start + self._prefix + body + self._suffix + self._end
+
+    def _empty_delta(self, finish_reason):
+        return self._frame(b'{"content":null,"function_call":null,"role":null,"tool_calls":null},"finish_reason":' + json.dumps(finish_reason).encode())
+
+    # Encode any ChatCompletionChunk (or dict) into the same wire format.
+    def encode(self, chunk):
+        if self.chunk_format is None or isinstance(chunk, bytes):
+            return chunk
+        if hasattr(chunk, "model_dump_json"):
+            chunk = chunk.model_copy(update={"id": self._id, "created": self._created})
+            return self._start + chunk.model_dump_json().encode() + self._end
+        return self._start + json.dumps(chunk, separators=(',', ':')).encode() + self._end
+
+    def BuildContentHead(self):
+        if self.chunk_format is None:
+            return ChunkOutputBuilder.BuildContentHead(generator=self.generator)
+        return self._content_head
+
+    def BuildContentBody(self, content):
+        if self.chunk_format is None:
+            return ChunkOutputBuilder.BuildContentBody(generator=self.generator, content=content)
+        return self._content_body_start + json.dumps(content).encode() + self._content_body_end
+
+    def BuildContentTail(self, finish_reason):
+        if self.chunk_format is None:
+            return ChunkOutputBuilder.BuildContentTail(generator=self.generator, finish_reason=finish_reason)
+        if finish_reason and finish_reason not in ['length','stop','tool_calls','content_filter']:
+            finish_reason = 'stop'
+        return self._empty_delta(finish_reason)
+
+    def BuildToolHead(self, tool_name):
+        return self.encode(ChunkOutputBuilder.BuildToolHead(generator=self.generator, tool_name=tool_name))
+
+    def BuildToolBody(self, tool_arguments):
+        return self.encode(ChunkOutputBuilder.BuildToolBody(generator=self.generator, tool_arguments=tool_arguments))
+
+    def BuildToolTail(self, finish_reason):
+        if self.chunk_format is None:
+            return ChunkOutputBuilder.BuildToolTail(generator=self.generator, finish_reason=finish_reason)
+        if finish_reason not in ['length','stop','tool_calls','content_filter']:
+            finish_reason = 'stop'
+        return self._empty_delta(finish_reason)
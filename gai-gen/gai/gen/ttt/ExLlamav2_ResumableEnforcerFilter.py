@@ -0,0 +1,23 @@
+from lmformatenforcer.integrations.exllamav2 import ExLlamaV2TokenEnforcerFilter
+
+class ExLlamav2_ResumableEnforcerFilter(ExLlamaV2TokenEnforcerFilter):
+    """
+    # Documentation
+    Descriptions: Token enforcer filter that uses a given TokenEnforcer and can resume from tokens that were already generated.
+    The prefix_ids are appended to the prompt of the resumed job and are replayed into the token enforcer in begin() so that
+    enforcement continues from the state after the prefix instead of the start of the JSON document.
+    Example:
+        filter = ExLlamav2_ResumableEnforcerFilter(token_enforcer, prefix_ids=[...])
+    """
+
+    def __init__(self, token_enforcer, prefix_ids=None):
+        # The parent constructor is not called because it compiles a new TokenEnforcer.
+        self.token_enforcer = token_enforcer
+        self.prefix_ids = list(prefix_ids or [])
+        self.token_sequence = []
+
+    def begin(self, prefix_str):
+        # Replay the prefix one token at a time. Each step extends the state of the previous step in the enforcer.
+        for i in range(len(self.prefix_ids)):
+            self.token_enforcer.get_allowed_tokens(self.prefix_ids[:i])
+        self.token_sequence = list(self.prefix_ids)
@@ -0,0 +1,225 @@
+import threading, queue
+from gai_common.logging import getLogger
+logger = getLogger(__name__)
+from exllamav2.generator import ExLlamaV2DynamicGenerator
+
+class ExLlamav2_JobHandle:
+    """
+    # Documentation
+    Descriptions: Handle returned by ExLlamav2_Scheduler.submit(). Each job owns its own output queue which is filled by
+    the scheduler thread with the raw result dicts returned by ExLlamaV2DynamicGenerator.iterate().
+    Example: Iterate over the handle to receive the results of the job until end of stream.
+    """
+
+    def __init__(self, job, scheduler):
+        self.job = job
+        self.scheduler = scheduler
+        self.queue = queue.Queue()
+        self.done = False
+
+    def __iter__(self):
+        while not self.done:
+            result = self.queue.get()
+            if isinstance(result, Exception):
+                self.done = True
+                raise result
+            if result is None:
+                # Job was cancelled
+                self.done = True
+                return
+            if result.get("eos"):
+                self.done = True
+            yield result
+
+
+class ExLlamav2_JobStream:
+    """
+    # Documentation
+    Descriptions: Iterator over the output chunks of a streaming job.
+    cancel() is thread-safe and can be called by the HTTP layer when the client disconnects.
+    close() cancels the job and closes the chunk generator. It is called on exiting a with block or when the stream is garbage collected.
+    Example:
+        with ttt.create(messages=messages, stream=True) as stream:
+            for chunk in stream:
+                print(chunk)
+    """
+
+    def __init__(self, handle, chunks):
+        self.handle = handle
+        self.chunks = chunks
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.chunks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    def cancel(self):
+        self.handle.scheduler.cancel(self.handle)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.cancel()
+        if hasattr(self.chunks, "close"):
+            self.chunks.close()
+
+
+class ExLlamav2_Scheduler:
+    """
+    # Documentation
+    Descriptions: Long-lived request scheduler that owns a single ExLlamaV2DynamicGenerator and runs it on a dedicated thread.
+    Jobs can be submitted from any thread and are admitted into the running batch at the next token boundary.
+    The generator is only ever touched by the scheduler thread so no locking is required around the model or cache.
+
+    In paged mode, the cache is divided into pages that are hashed by their token-id prefix. Pages from finished jobs
+    are kept and reused by later jobs that share the same prefix (eg. system prompt and earlier chat turns) until they are
+    evicted in least-recently-used order, so only the new tokens of a prompt need to be prefilled.
+    """
+
+    def __init__(self, model, cache, tokenizer, max_batch_size=None, paged=True):
+        self.generator = ExLlamaV2DynamicGenerator(
+            model=model,
+            cache=cache,
+            tokenizer=tokenizer,
+            max_batch_size=max_batch_size,
+            paged=paged)
+        self.generator.warmup()
+        if not paged:
+            logger.warning("ExLlamav2_Scheduler: paged mode is disabled. Prompt prefix caching is not available.")
+
+        # Prefix cache statistics. Only updated by the scheduler thread.
+        self.stats = {
+            "jobs": 0,
+            "prefix_hits": 0,
+            "prefix_misses": 0,
+            "prompt_tokens": 0,
+            "cached_tokens": 0,
+        }
+
+        # Requests from other threads are posted to these queues and drained by the scheduler thread
+        self._submitted = queue.Queue()
+        self._cancelled = queue.Queue()
+        self._wakeup = threading.Event()
+        self._handles = {}
+        # submit() and close() check and set _stopped under the lock so that no job is submitted after the scheduler thread has stopped
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="ExLlamav2_Scheduler", daemon=True)
+        self._thread.start()
+
+    def submit(self, job):
+        handle = ExLlamav2_JobHandle(job, self)
+        with self._lock:
+            if self._stopped:
+                raise Exception("ExLlamav2_Scheduler.submit: scheduler is closed.")
+            self._submitted.put(handle)
+        self._wakeup.set()
+        return handle
+
+    def cancel(self, handle):
+        if handle.done:
+            return
+        self._cancelled.put(handle)
+        self._wakeup.set()
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        jobs = stats["jobs"]
+        stats["hit_ratio"] = stats["prefix_hits"] / jobs if jobs else 0.0
+        stats["miss_ratio"] = stats["prefix_misses"] / jobs if jobs else 0.0
+        stats["tokens_saved"] = stats["cached_tokens"]
+        stats["token_hit_ratio"] = stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0
+        return stats
+
+    def _update_stats(self, result):
+        prompt_tokens = result.get("prompt_tokens", 0)
+        cached_tokens = result.get("cached_tokens", 0)
+        self.stats["jobs"] += 1
+        self.stats["prompt_tokens"] += prompt_tokens
+        self.stats["cached_tokens"] += cached_tokens
+        if cached_tokens > 0:
+            self.stats["prefix_hits"] += 1
+        else:
+            self.stats["prefix_misses"] += 1
+        logger.debug(f"ExLlamav2_Scheduler: job completed. prompt_tokens={prompt_tokens} cached_tokens={cached_tokens}")
+
+    # Jobs that have not completed when the scheduler is closed end with an exception instead of a normal end of stream.
+    def close(self):
+        with self._lock:
+            self._stopped = True
+        self._wakeup.set()
+        self._thread.join()
+
+    def _drain(self):
+        while not self._submitted.empty():
+            handle = self._submitted.get()
+            try:
+                self.generator.enqueue(handle.job)
+                self._handles[handle.job] = handle
+            except Exception as e:
+                logger.error(f"ExLlamav2_Scheduler._drain: Failed to enqueue job. error={e}")
+                handle.queue.put(e)
+        while not self._cancelled.empty():
+            handle = self._cancelled.get()
+            if self._handles.pop(handle.job, None) is not None:
+                self.generator.cancel(handle.job)
+                logger.debug(f"ExLlamav2_Scheduler._drain: job cancelled.")
+            handle.queue.put(None)
+
+    def _fail_all(self, error):
+        for handle in self._handles.values():
+            handle.queue.put(error)
+        self._handles = {}
+        self.generator.clear_queue()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            self._drain()
+
+            while self._handles and not self._stopped:
+                try:
+                    results = self.generator.iterate()
+                except Exception as e:
+                    logger.error(f"ExLlamav2_Scheduler._run: Generator failed. error={e}")
+                    self._fail_all(e)
+                    break
+
+                for result in results:
+                    handle = self._handles.get(result["job"])
+                    if handle is None:
+                        continue
+                    handle.queue.put(result)
+                    if result.get("eos"):
+                        del self._handles[result["job"]]
+                        self._update_stats(result)
+
+                # Admit new jobs and process cancellations at every token boundary
+                self._drain()
+
+        # Shutting down
+        error = Exception("ExLlamav2_Scheduler: scheduler closed before the job completed.")
+        while not self._submitted.empty():
+            self._submitted.get().queue.put(error)
+        while not self._cancelled.empty():
+            handle = self._cancelled.get()
+            if self._handles.pop(handle.job, None) is not None:
+                self.generator.cancel(handle.job)
+            handle.queue.put(None)
+        for handle in self._handles.values():
+            self.generator.cancel(handle.job)
+            handle.queue.put(error)
+        self._handles = {}
@@ -1,4 +1,5 @@
 import os,torch,gc,json,re
+import importlib.util
 from gai_common.utils import get_app_path
 from gai_common.generators_utils import chat_string_to_list, apply_tools_message,format_list_to_prompt, apply_schema_prompt, get_tools_schema
 from gai_common.logging import getLogger
@@ -12,19 +13,27 @@ from exllamav2 import(
 from exllamav2.cache import ExLlamaV2Cache_Q4
 from exllamav2.generator import (
     ExLlamaV2Sampler,
-    ExLlamaV2StreamingGenerator,
+    ExLlamaV2DynamicJob,
 )
-from exllamav2.generator import ExLlamaV2DynamicGenerator
+from gai.gen.ttt.ExLlamav2_Scheduler import ExLlamav2_Scheduler, ExLlamav2_JobStream
 
 from gai.gen.ttt.OutputBuilder import OutputBuilder
 from gai.gen.ttt.ChunkOutputBuilder import ChunkOutputBuilder
-from lmformatenforcer import JsonSchemaParser
+from gai.gen.ttt.ChunkEncoder import ChunkEncoder
+from lmformatenforcer import JsonSchemaParser, TokenEnforcer
 from lmformatenforcer.characterlevelparser import CharacterLevelParser
 from lmformatenforcer.integrations.exllamav2 import ExLlamaV2TokenEnforcerFilter, build_token_enforcer_tokenizer_data
 from exllamav2.generator.filters.prefix import ExLlamaV2PrefixFilter
+from gai.gen.ttt.SchemaCache import SchemaCache
+from gai.gen.ttt.ExLlamav2_ResumableEnforcerFilter import ExLlamav2_ResumableEnforcerFilter
+from gai.gen.ttt.JsonPrefixValidator import JsonPrefixValidator
+import threading
 
 class ExLlamav2_TTT:
 
+    # Requests are batched by the scheduler so create() can be called concurrently.
+    concurrent = True
+
     def __init__(self, gai_config):
         if (gai_config is None):
             raise Exception("ExLlama_TTT2: gai_config is required")
@@ -41,6 +50,17 @@ class ExLlamav2_TTT:
         self.tokenizer = None
         self.client = None
         self.prompt = None
+        self.scheduler = None
+        self.schema_cache = SchemaCache(max_size=gai_config.get("schema_cache_size",32))
+        self.schema_metrics_lock = threading.Lock()
+        self.schema_metrics = {
+            "requests": 0,
+            "retries": 0,
+            "aborted_early": 0,
+            "resumed": 0,
+            "restarted": 0,
+            "failures": 0,
+        }
 
     def load(self):
         self.unload()
@@ -53,28 +73,59 @@ class ExLlamav2_TTT:
         exllama_config.prepare()
         exllama_config.max_seq_len = self.gai_config.get("max_seq_len",8192)
         exllama_config.no_flash_attn = self.gai_config.get("no_flash_attn",True)
+        # Paged mode is required for batching and depends on flash-attn. Without it the generator runs one sequence at a time.
+        if not exllama_config.no_flash_attn and importlib.util.find_spec("flash_attn") is None:
+            logger.warning("ExLlama_TTT2.load: flash-attn is not installed. Falling back to unpaged mode.")
+            exllama_config.no_flash_attn = True
+        paged=self.gai_config.get("paged",not exllama_config.no_flash_attn) and not exllama_config.no_flash_attn
         self.exllama_config=exllama_config
 
         #model
         self.model=ExLlamaV2(self.exllama_config)
 
         #cache
-        self.cache=ExLlamaV2Cache_Q4(self.model,lazy=True)
+        if paged:
+            # The cache is shared by all jobs in the batch so it should be sized for max_batch_size concurrent sequences.
+            max_batch_size=self.gai_config.get("max_batch_size",8)
+            cache_size=self.gai_config.get("cache_size",exllama_config.max_seq_len*max_batch_size)
+        else:
+            logger.warning("ExLlama_TTT2.load: continuous batching is disabled because paged mode is off. Set no_flash_attn to false and install flash-attn to enable it.")
+            max_batch_size=1
+            cache_size=exllama_config.max_seq_len
+        self.cache=ExLlamaV2Cache_Q4(self.model,max_seq_len=cache_size,lazy=True)
         self.model.load_autosplit(self.cache)
 
         #tokenizer
         self.tokenizer=ExLlamaV2Tokenizer(self.exllama_config)
 
+        #scheduler
+        self.scheduler=ExLlamav2_Scheduler(
+            model=self.model,
+            cache=self.cache,
+            tokenizer=self.tokenizer,
+            max_batch_size=max_batch_size,
+            paged=paged)
+        logger.info(f"ExLlama_TTT2.load: scheduler started. paged={paged} max_batch_size={max_batch_size} cache_size={cache_size}")
+
         #prompt format
         self.prompt_format=self.gai_config.get("prompt_format")
 
         #schema
         # Building the tokenizer data once is a performance optimization, it saves preprocessing in subsequent calls.
         self.tokenizer_data = build_token_enforcer_tokenizer_data(self.tokenizer)
+        # Compiled schemas are bound to the tokenizer.
+        self.schema_cache.clear()
 
         return self
 
     def unload(self):
+        try:
+            if self.scheduler:
+                self.scheduler.close()
+            del self.scheduler
+        except:
+            pass
+        self.scheduler = None
         try:
             self.model.unload()
             del self.model
@@ -91,9 +142,40 @@ class ExLlamav2_TTT:
         self.cache = None
         self.prompt = None
         self.tokenizer_data = None
+        self.schema_cache.clear()
         torch.cuda.empty_cache()
         gc.collect()
 
+    # Prompt prefix cache statistics from the scheduler.
+    def get_stats(self):
+        if not self.scheduler:
+            return {}
+        with self.schema_metrics_lock:
+            schema_metrics = dict(self.schema_metrics)
+        return {
+            "prefix_cache": self.scheduler.get_stats(),
+            "schema_cache": self.schema_cache.get_stats(),
+            "schema_generation": schema_metrics
+        }
+
+    def _count_schema_metric(self, name):
+        with self.schema_metrics_lock:
+            self.schema_metrics[name] += 1
+
+    # The parser is compiled once per schema and shared by all jobs using the schema.
+    # The token enforcer memoizes the allowed tokens of every prefix it has seen, so a new one is created for each request
+    # and its memory is released when the request ends.
+    def _get_compiled_schema(self, schema):
+        return self.schema_cache.get(schema, lambda: JsonSchemaParser(schema))
+
+    def _get_token_enforcer(self, schema):
+        return TokenEnforcer(self.tokenizer_data, self._get_compiled_schema(schema))
+
+    # Retries of the same request pass the token_enforcer of the previous attempt so that the prefix is replayed from its memo.
+    def _get_schema_filter(self, schema, prefix_ids=None, token_enforcer=None):
+        token_enforcer = token_enforcer or self._get_token_enforcer(schema)
+        return ExLlamav2_ResumableEnforcerFilter(token_enforcer, prefix_ids=prefix_ids)
+
     # If the response is a tool, the first yielded output will return
     # the tool name.
     def _yield_tool_name_output(self, text):
@@ -176,158 +258,242 @@ class ExLlamav2_TTT:
 
     # Although support for streaming tools is implemented but it is not as efficient as the non-streaming tools.
     # Recommend to use non-streaming tools for now.
-    def _streaming(self, prompt, settings, max_new_tokens, stop_conditions,schema=None, tools=None, seed=None, tool_choice="none"):
-        generator=ExLlamaV2StreamingGenerator(self.model, self.cache, self.tokenizer)
-        generator.warmup()
-        ids = self.tokenizer.encode(prompt)
-
-        generator.set_stop_conditions(stop_conditions=stop_conditions)
-        generator.begin_stream_ex(
-            input_ids=ids, 
-            gen_settings=settings,
-            token_healing=True,
-            decode_special_tokens=True,
-            add_bos=True,
-            )
-
+    def _streaming(self, handle, tools=None, tool_choice="none", chunk_format=None):
+        encoder = ChunkEncoder(generator=self.gai_config["model_name"], chunk_format=chunk_format)
         response_text=""
-        response_tokens=0
-        responses_ids = []
-        responses_ids.append(torch.empty((1, 0), dtype = torch.long))  
         held_text = ""
-        held_tokens=[]
         tool_name_output = None
         tool_arguments_output = None        
         is_tool_text = False
-        has_head = False
 
-        yield ChunkOutputBuilder.BuildContentHead(generator=self.gai_config["model_name"])
+        try:
+            yield encoder.BuildContentHead()
 
-        while True:
-            res=generator.stream_ex()
-            chunk = res["chunk"]
-            eos = res["eos"]
-            tokens = res["chunk_token_ids"]
+            for res in handle:
+                if res["stage"] != "streaming":
+                    continue
+                chunk = res.get("text","")
+                eos = res["eos"]
 
-            if tools and tool_choice != "none":
+                if tools and tool_choice != "none":
 
-                # Even though its tools, we don't know if the model will choose text or tools yet until we check the function "name"
+                    # Even though its tools, we don't know if the model will choose text or tools yet until we check the function "name"
 
-                held_text+=chunk
-                held_tokens.append(tokens)
+                    held_text+=chunk
 
-                # Find tool name and yield output head
-                if not tool_name_output:
+                    # Find tool name and yield output head
+                    if not tool_name_output:
 
-                    # Each time a token is generated, held_text is checked against the tool name pattern. tool_name_output is None until pattern is matched.
-                    tool_name_output = self._yield_tool_name_output(held_text.strip())
-                    if tool_name_output:
-                        tool_name = tool_name_output.choices[0].delta.tool_calls[0].function.name
-                        logger.info("ExLlama_TTT2._streaming: tool_name_output="+tool_name)
-                        if tool_name != "text":
-                            # flush
-                            for held_token in held_tokens:
-                                responses_ids[-1] = torch.cat([responses_ids[-1], held_token], dim = -1)
+                        # Each time a token is generated, held_text is checked against the tool name pattern. tool_name_output is None until pattern is matched.
+                        tool_name_output = self._yield_tool_name_output(held_text.strip())
+                        if tool_name_output:
+                            tool_name = tool_name_output.choices[0].delta.tool_calls[0].function.name
+                            logger.info("ExLlama_TTT2._streaming: tool_name_output="+tool_name)
+                            if tool_name != "text":
+                                # flush
                                 response_text += held_text
-                            held_text = ""
-                            held_tokens = []
-                            yield tool_name_output
-                        else:
-                            # We confirmed that the call will return text so we need to change the way we return the output.
-                            is_tool_text = True
-
-                # Find tool args and yield output body
-                if not tool_arguments_output:
-
-                    # Each time a token is generated, new_text is checked against the tool arguments pattern. tool_arguments_output is None until pattern is matched.
-                    tool_arguments_output = self._yield_tool_arguments_output(held_text.strip())
-                    if tool_arguments_output:
-                        logger.info("ExLlama_TTT2._streaming: output="+tool_name_output.choices[0].delta.tool_calls[0].function.arguments)                        
-                        if is_tool_text:
-                            # the model decides to return text, we need to stream the text output.
-                            text = tool_arguments_output.choices[0].delta.tool_calls[0].function.arguments
-                            text = json.loads(text)['text']
-                            output_chunks = text.split(" ")
-                            yield ChunkOutputBuilder.BuildContentHead(generator=self.gai_config["model_name"])
-                            initial=True
-                            for chunk in output_chunks:
-                                if initial:
-                                    initial=False
-                                    yield ChunkOutputBuilder.BuildContentBody(generator=self.gai_config["model_name"],content=chunk)
-                                else:
-                                    yield ChunkOutputBuilder.BuildContentBody(generator=self.gai_config["model_name"],content=" "+chunk)
-                            yield ChunkOutputBuilder.BuildContentTail(generator=self.gai_config["model_name"],finish_reason="stop")
-                        else:
-                            yield tool_arguments_output
-                if eos:
-                    yield self._yield_tool_stop_output("tool_calls")
-                    logger.info(f"ExLlama_TTT2._streaming: stopped by stop token. ")
-                    return                    
-
-            if not tools or tool_choice == "none":
-                if len(response_text) == 0: 
-                    chunk = chunk.lstrip()
-                    response_text += chunk
-                    responses_ids[-1] = torch.cat([responses_ids[-1], tokens], dim = -1)
-                if chunk:
-                    yield ChunkOutputBuilder.BuildContentBody(generator=self.gai_config["model_name"],content=chunk)                    
-
-                response_tokens += 1
-                if response_tokens == max_new_tokens:
-                    if self.tokenizer.eos_token_id in generator.stop_tokens:
-                        responses_ids[-1] = torch.cat([responses_ids[-1], self.tokenizer.single_token(self.tokenizer.eos_token_id)], dim = -1)
-                    break
-                if eos or tokens in generator.stop_tokens:
-                    yield ChunkOutputBuilder.BuildContentBody(generator=self.gai_config["model_name"],content=".")
-                    yield ChunkOutputBuilder.BuildContentTail(generator=self.gai_config["model_name"],finish_reason="stop")
-                    return
-
-    def _generating(self, prompt, settings, max_new_tokens, schema, tools, stop_conditions, seed=None):
-        import ast
-        generator=ExLlamaV2DynamicGenerator(model=self.model, cache=self.cache, tokenizer=self.tokenizer,paged=False)
-        generator.warmup()
-
-        inputs = self.tokenizer.encode(prompt)
-        input_len = len(inputs[0])
-
-        response=""
+                                held_text = ""
+                                yield encoder.encode(tool_name_output)
+                            else:
+                                # We confirmed that the call will return text so we need to change the way we return the output.
+                                is_tool_text = True
+
+                    # Find tool args and yield output body
+                    if not tool_arguments_output:
+
+                        # Each time a token is generated, new_text is checked against the tool arguments pattern. tool_arguments_output is None until pattern is matched.
+                        tool_arguments_output = self._yield_tool_arguments_output(held_text.strip())
+                        if tool_arguments_output:
+                            logger.info("ExLlama_TTT2._streaming: output="+tool_name_output.choices[0].delta.tool_calls[0].function.arguments)                        
+                            if is_tool_text:
+                                # the model decides to return text, we need to stream the text output.
+                                text = tool_arguments_output.choices[0].delta.tool_calls[0].function.arguments
+                                text = json.loads(text)['text']
+                                output_chunks = text.split(" ")
+                                yield encoder.BuildContentHead()
+                                initial=True
+                                for chunk in output_chunks:
+                                    if initial:
+                                        initial=False
+                                        yield encoder.BuildContentBody(content=chunk)
+                                    else:
+                                        yield encoder.BuildContentBody(content=" "+chunk)
+                                yield encoder.BuildContentTail(finish_reason="stop")
+                            else:
+                                yield encoder.encode(tool_arguments_output)
+                    if eos:
+                        yield encoder.encode(self._yield_tool_stop_output("tool_calls"))
+                        logger.info(f"ExLlama_TTT2._streaming: stopped by stop token. ")
+                        return                    
+
+                if not tools or tool_choice == "none":
+                    if len(response_text) == 0: 
+                        chunk = chunk.lstrip()
+                        response_text += chunk
+                    if chunk:
+                        yield encoder.BuildContentBody(content=chunk)                    
+
+                    if eos:
+                        if res.get("eos_reason") == "max_new_tokens":
+                            yield encoder.BuildContentTail(finish_reason="length")
+                            return
+                        yield encoder.BuildContentBody(content=".")
+                        yield encoder.BuildContentTail(finish_reason="stop")
+                        return
+        finally:
+            # Release the job if the consumer stops reading before the end of the stream.
+            self.scheduler.cancel(handle)
+
+    # Create a generation job and submit it to the scheduler.
+    # prefix_ids are previously generated tokens to continue from. They are appended to the prompt as token ids
+    # so that they are not re-tokenized, and token healing is disabled so that they are kept as is.
+    # Returns the job handle and the number of prompt tokens.
+    # Special tokens in the prompt template (eg. [INST], <|eot_id|>) are encoded as single tokens, as in ExLlamaV2DynamicGenerator.generate().
+    def _submit(self, prompt, settings, max_new_tokens, stop_conditions, filters=None, seed=None, prefix_ids=None):
+        input_ids = self.tokenizer.encode(prompt, add_bos=True, encode_special_tokens=True)
+        input_len = input_ids.shape[-1]
+        if prefix_ids:
+            input_ids = torch.cat([input_ids, torch.tensor([prefix_ids], dtype=input_ids.dtype)], dim=-1)
+        job = ExLlamaV2DynamicJob(
+            input_ids=input_ids,
+            max_new_tokens=max_new_tokens,
+            gen_settings=settings,
+            filters=filters,
+            seed=seed,
+            stop_conditions=stop_conditions,
+            token_healing=not prefix_ids,
+            decode_special_tokens=True)
+        return self.scheduler.submit(job), input_len
+
+    # Submit a job to the scheduler and block until it completes.
+    # Returns the completion text, the number of prompt tokens and the number of new tokens.
+    def _generate_text(self, prompt, settings, max_new_tokens, stop_conditions, filters=None, seed=None):
+        handle, input_len = self._submit(
+            prompt=prompt,
+            settings=settings,
+            max_new_tokens=max_new_tokens,
+            stop_conditions=stop_conditions,
+            filters=filters,
+            seed=seed)
+
+        text, new_tokens = self._collect_text(handle)
+        return text, input_len, new_tokens
+
+    # Block until the job completes. Returns the completion text and the number of new tokens.
+    def _collect_text(self, handle):
+        text = ""
+        new_tokens = 0
+        for result in handle:
+            if result["stage"] != "streaming":
+                continue
+            text += result.get("text", "")
+            if result["eos"]:
+                new_tokens = result.get("new_tokens", 0)
+        return text, new_tokens
+
+    # Generate a JSON response for the schema. The output is validated incrementally while it is being generated and the job
+    # is aborted at the first invalid token. A retry resumes from the last valid prefix instead of generating from scratch.
+    # Returns the completion text (None if all retries failed), the parsed JSON, the number of prompt tokens,
+    # the number of output tokens and the eos_reason.
+    def _generate_json(self, prompt, settings, max_new_tokens, schema, stop_conditions, seed=None):
         from jsonschema import validate
-        json_data=None
-        retries=10
-        while not response and retries>=0:
-            response=generator.generate(
-                prompt=prompt, 
-                token_healing=True,
-                gen_settings=settings, 
-                max_new_tokens=max_new_tokens, 
-                seed=seed, 
+        self._count_schema_metric("requests")
+        parser = self._get_compiled_schema(schema)
+        token_enforcer = self._get_token_enforcer(schema)
+        retries = self.gai_config.get("schema_max_retries", 2)
+        prefix_ids = []
+        prefix_text = ""
+        input_len = 0
+        eos_reason = None
+
+        for attempt in range(retries+1):
+            if attempt > 0:
+                self._count_schema_metric("retries")
+                self._count_schema_metric("resumed" if prefix_ids else "restarted")
+
+            filters = [self._get_schema_filter(schema, prefix_ids=prefix_ids, token_enforcer=token_enforcer)]
+            if not prefix_ids:
+                filters.append(ExLlamaV2PrefixFilter(self.model, self.tokenizer, ["{","\n\n{"]))
+            # The resumed prefix counts towards the caller's max_new_tokens.
+            handle, input_len = self._submit(
+                prompt=prompt,
+                settings=settings,
+                max_new_tokens=max_new_tokens-len(prefix_ids),
                 stop_conditions=stop_conditions,
-                add_bos=True,
-                decode_special_tokens=True,
-                completion_only=True)
-            if schema:
-                try:
-                    
-                    # It seems like Llama3 stop condition is not working unless decode_special_tokens is true.
-                    # No time to fix. Hardcoding the removal of the header id for Llama3. To be observed.
+                filters=filters,
+                seed=seed,
+                prefix_ids=prefix_ids)
+
+            validator = JsonPrefixValidator(parser)
+            validator.feed(prefix_text)
+            text = prefix_text
+            token_ids = list(prefix_ids)
+            eos_reason = None
+            for result in handle:
+                if result["stage"] != "streaming":
+                    continue
+                chunk = result.get("text", "")
+                validator.feed(chunk)
+                if not validator.valid:
+                    # Abort at the first invalid token and keep the prefix before it.
+                    logger.warning(f"ExLlamav2_TTT._generate_json: invalid JSON prefix. Aborting at {len(text)} characters.")
+                    self._count_schema_metric("aborted_early")
+                    self.scheduler.cancel(handle)
+                    break
+                text += chunk
+                if result.get("token_ids") is not None:
+                    token_ids += result["token_ids"].view(-1).tolist()
+                if result["eos"]:
+                    eos_reason = result.get("eos_reason")
 
-                    response=response.replace("<|start_header_id|>","")
-                    json_data = json.loads(response)
+            if validator.can_end():
+                try:
+                    json_data = json.loads(text)
                     validate(json_data, schema)
+                    return text, json_data, input_len, len(token_ids), eos_reason
                 except Exception as e:
-                    logger.warning(f"ExLlamav2_TTT._generating: Error loading JSON for schema. {e}")
-                    response=""
-                    retries-=1
+                    # The prefix is complete but does not satisfy a constraint that is not enforced during decoding.
+                    logger.warning(f"ExLlamav2_TTT._generate_json: Error validating JSON for schema. {e}")
+                    prefix_ids, prefix_text = [], ""
+                    continue
+
+            # The output was truncated by the token budget. Resuming would only exceed max_new_tokens, so give up.
+            if eos_reason == "max_new_tokens" or len(token_ids) >= max_new_tokens:
+                logger.warning(f"ExLlamav2_TTT._generate_json: JSON is incomplete after max_new_tokens={max_new_tokens}.")
+                break
 
-        if retries<0:
-            logger.warning(f"Failed to generate JSON for schema after maximum number of retries.")
-            # Return a standard response
-            response = "I'm sorry but I am unable to generate a structured response for this request. If you are fine with an unstructured response, please try again with tool_choice=None."
+            # Incomplete or invalid output. Resume from the last valid prefix.
+            prefix_ids, prefix_text = token_ids, text
+
+        self._count_schema_metric("failures")
+        return None, None, input_len, 0, eos_reason
+
+    def _generating(self, prompt, settings, max_new_tokens, schema, tools, stop_conditions, filters=None, seed=None):
+        json_data=None
+        eos_reason=None
+        if schema:
+            response, json_data, input_len, output_len, eos_reason = self._generate_json(
+                prompt=prompt,
+                settings=settings,
+                max_new_tokens=max_new_tokens,
+                schema=schema,
+                stop_conditions=stop_conditions,
+                seed=seed)
+            if response is None:
+                logger.warning(f"Failed to generate JSON for schema after maximum number of retries.")
+                # Return a standard response
+                response = "I'm sorry but I am unable to generate a structured response for this request. If you are fine with an unstructured response, please try again with tool_choice=None."
+        else:
+            response, input_len, output_len = self._generate_text(
+                prompt=prompt,
+                settings=settings,
+                max_new_tokens=max_new_tokens,
+                stop_conditions=stop_conditions,
+                filters=filters,
+                seed=seed)
 
         finish_reason=""        
-        outputs = self.tokenizer.encode(response)
-        output_len = len(outputs[0])
-        if output_len == max_new_tokens:
+        if output_len == max_new_tokens or eos_reason == "max_new_tokens":
             finish_reason="length"
         else:
             finish_reason="stop"
@@ -385,6 +551,76 @@ class ExLlamav2_TTT:
             logger.debug(f"ExLlama_TTT2._generating: completions={chat_completion}")
         return chat_completion
 
+    def _get_settings(self, temperature=None, top_k=None, top_p=None):
+        settings = ExLlamaV2Sampler.Settings()
+        # temperature
+        settings.temperature=temperature or self.gai_config["hyperparameters"].get("temperature",0.85)
+        # top_k
+        settings.top_k=top_k or self.gai_config["hyperparameters"].get("top_k",50)
+        # top_p
+        settings.top_p=top_p or self.gai_config["hyperparameters"].get("top_p",0.8)
+        return settings
+
+    # Generate completions for a list of conversations. Results are returned in the same order as list_of_messages.
+    # All jobs are submitted to the scheduler at once, shortest prompt first, so that prompts of similar length are batched together.
+    # Tools and schema are handled by create() for each conversation.
+    def create_batch(self,
+               list_of_messages: list,
+               max_new_tokens:int=None,
+               temperature:float=None,
+               top_k:float=None,
+               top_p:float=None,
+               tools:dict=None,
+               tool_choice:str='auto',
+               schema:dict=None):
+
+        if not self.model:
+            self.load()
+
+        if (tools and tool_choice != "none") or schema:
+            return [self.create(messages=messages,
+                                stream=False,
+                                max_new_tokens=max_new_tokens,
+                                temperature=temperature,
+                                top_k=top_k,
+                                top_p=top_p,
+                                tools=tools,
+                                tool_choice=tool_choice,
+                                schema=schema) for messages in list_of_messages]
+
+        settings = self._get_settings(temperature=temperature, top_k=top_k, top_p=top_p)
+        max_new_tokens=max_new_tokens or self.gai_config["hyperparameters"].get("max_new_tokens",100)
+        stop_conditions=self.gai_config.get("stop_conditions",[self.tokenizer.eos_token_id])
+        prompt_format = self.gai_config.get("prompt_format")
+
+        prompts = []
+        for messages in list_of_messages:
+            if isinstance(messages,str):
+                messages = chat_string_to_list(messages=messages)
+            prompts.append(format_list_to_prompt(messages=messages, format_type=prompt_format,stream=False))
+        lengths = [self.tokenizer.encode(prompt, add_bos=True, encode_special_tokens=True).shape[-1] for prompt in prompts]
+        logger.info(f"ExLlama_TTT2.create_batch: batch_size={len(prompts)}")
+
+        jobs = {}
+        for i in sorted(range(len(prompts)), key=lambda i: lengths[i]):
+            jobs[i] = self._submit(
+                prompt=prompts[i],
+                settings=settings,
+                max_new_tokens=max_new_tokens,
+                stop_conditions=stop_conditions)
+
+        results = [None]*len(prompts)
+        for i, (handle, input_len) in jobs.items():
+            text, new_tokens = self._collect_text(handle)
+            results[i] = OutputBuilder.BuildContent(
+                generator=self.gai_config["model_name"],
+                finish_reason="length" if new_tokens == max_new_tokens else "stop",
+                content=text.lstrip(),
+                prompt_tokens=input_len,
+                new_tokens=new_tokens
+            )
+        return results
+
     def create(self, 
                messages: str|list, 
                stream:bool=True, 
@@ -394,19 +630,14 @@ class ExLlamav2_TTT:
                top_p:float=None,
                tools:dict=None,
                tool_choice:str='auto',
-               schema:dict=None):
+               schema:dict=None,
+               chunk_format:str=None):
         
         if not self.model:
             self.load()
 
         # settings
-        settings = ExLlamaV2Sampler.Settings()
-        # temperature
-        settings.temperature=temperature or self.gai_config["hyperparameters"].get("temperature",0.85)
-        # top_k
-        settings.top_k=top_k or self.gai_config["hyperparameters"].get("top_k",50)
-        # top_p
-        settings.top_p=top_p or self.gai_config["hyperparameters"].get("top_p",0.8)
+        settings = self._get_settings(temperature=temperature, top_k=top_k, top_p=top_p)
         # max_new_tokens
         max_new_tokens=max_new_tokens or self.gai_config["hyperparameters"].get("max_new_tokens",100)
         # stop_token
@@ -429,11 +660,16 @@ class ExLlamav2_TTT:
         
 
         # schema
+        filters = None
         if schema:
             messages = apply_schema_prompt(messages=messages, schema=schema)
-            parser = JsonSchemaParser(schema)
-            settings.filters = [ExLlamaV2TokenEnforcerFilter(parser, self.tokenizer_data),
-                                ExLlamaV2PrefixFilter(self.model, self.tokenizer, ["{","\n\n{"])]
+            if stream:
+                filters = [self._get_schema_filter(schema),
+                           ExLlamaV2PrefixFilter(self.model, self.tokenizer, ["{","\n\n{"])]
+            # Text stop conditions can truncate a valid JSON document (eg. ".\n\n" inside a string).
+            # The token enforcer only allows eos once the document is complete, so only special tokens are used to stop.
+            stop_conditions=[self.tokenizer.eos_token_id]+[stop for stop in stop_conditions
+                                                           if isinstance(stop, int) or (stop.startswith("<") and stop.endswith(">"))]
         
         # Format the list to corresponding model's prompt format
         prompt_format = self.gai_config.get("prompt_format")
@@ -441,13 +677,18 @@ class ExLlamav2_TTT:
         logger.info(f"ExLlama_TTT2.create:\n\tprompt=`{prompt}`\n\tschema=`{schema}`\n\ttools=`{tools}`\n\tprompt_format=`{prompt_format}`")
 
         if stream:
-            return (chunk for chunk in self._streaming(
+            # The job is submitted immediately so it joins the running batch while the caller sets up the response.
+            handle, _ = self._submit(
                 prompt=prompt,
                 settings=settings,
                 max_new_tokens=max_new_tokens,
-                schema=schema,
-                tools=tools,
                 stop_conditions=stop_conditions,
+                filters=filters,
+            )
+            return ExLlamav2_JobStream(handle, self._streaming(
+                handle=handle,
+                tools=tools,
+                chunk_format=chunk_format,
             ))
         
         response = self._generating(
@@ -457,5 +698,6 @@ class ExLlamav2_TTT:
             schema=schema,
             tools=tools,
             stop_conditions=stop_conditions,
+            filters=filters,
         )
         return response
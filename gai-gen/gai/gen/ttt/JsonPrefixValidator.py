@@ -0,0 +1,32 @@
+class JsonPrefixValidator:
+    """
+    # Documentation
+    Descriptions: Incrementally validates generated text against a character level parser (eg. lmformatenforcer JsonSchemaParser).
+    This is used to detect the first invalid character of a JSON response while it is being generated instead of
+    parsing the whole response after generation.
+    Example:
+        validator = JsonPrefixValidator(JsonSchemaParser(schema))
+        accepted = validator.feed('{"name": ')
+        if not validator.valid: ...
+    """
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.valid = True
+        self.length = 0
+
+    # Returns the number of characters of text accepted. Stops at the first invalid character.
+    def feed(self, text):
+        if not self.valid:
+            return 0
+        for i, c in enumerate(text):
+            if c not in self.parser.get_allowed_characters():
+                self.valid = False
+                return i
+            self.parser = self.parser.add_character(c)
+            self.length += 1
+        return len(text)
+
+    # True if the text so far is a complete document.
+    def can_end(self):
+        return self.valid and self.parser.can_end()
@@ -11,6 +11,8 @@ logger = logging.getLogger(__name__)
 from llama_cpp import Llama, LlamaGrammar
 from gai.gen.ttt.OutputBuilder import OutputBuilder
 from gai.gen.ttt.ChunkOutputBuilder import ChunkOutputBuilder
+from gai.gen.ttt.ChunkEncoder import ChunkEncoder
+from gai.gen.ttt.SchemaCache import SchemaCache
 
 class LlamaCpp_TTT:
 
@@ -35,6 +37,7 @@ class LlamaCpp_TTT:
         self.model_filepath = os.path.join(get_app_path(
             ), gai_config["model_filepath"])
         self.client = None
+        self.schema_cache = SchemaCache(max_size=gai_config.get("schema_cache_size",32))
 
     def load(self):
         logger.info(f"exllama_engine.load: Loading model from {self.model_filepath}")
@@ -51,6 +54,9 @@ class LlamaCpp_TTT:
         gc.collect()
         torch.cuda.empty_cache()
 
+    def get_stats(self):
+        return {"schema_cache": self.schema_cache.get_stats()}
+
     def token_count(self,text):
         #return len(self.client.tokenize(text.encode()))
         if isinstance(text,dict):
@@ -146,8 +152,10 @@ class LlamaCpp_TTT:
                     max_tokens:int,
                     stop:List[str],
                     seed:int,
+                    chunk_format:str=None,
                     ):
-        yield ChunkOutputBuilder.BuildContentHead(generator=self.gai_config["model_name"])
+        encoder = ChunkEncoder(generator=self.gai_config["model_name"], chunk_format=chunk_format)
+        yield encoder.BuildContentHead()
         for chunk in self.client.create_chat_completion(messages=messages,
             stream=True,
             temperature=temperature,
@@ -162,10 +170,10 @@ class LlamaCpp_TTT:
                 #     output='', 
                 #     finish_reason=chunk['choices'][0]['finish_reason']
                 #     )             
-                yield ChunkOutputBuilder.BuildContentTail(generator=self.gai_config["model_name"],finish_reason=chunk['choices'][0]['finish_reason'])                   
+                yield encoder.BuildContentTail(finish_reason=chunk['choices'][0]['finish_reason'])                   
             elif 'content' in chunk['choices'][0]['delta']:
 
-                yield ChunkOutputBuilder.BuildContentBody(generator=self.gai_config["model_name"],content=chunk['choices'][0]['delta']['content'])                    
+                yield encoder.BuildContentBody(content=chunk['choices'][0]['delta']['content'])                    
 
                 # yield self.parse_chunk_output(
                 #     id=chunk['id'],
@@ -209,7 +217,8 @@ class LlamaCpp_TTT:
                tool_choice:str='auto',
                schema:dict=None,
                stop:List[str]=None,
-               seed:int=None):
+               seed:int=None,
+               chunk_format:str=None):
         
         if not self.client:
             self.load()
@@ -239,7 +248,7 @@ class LlamaCpp_TTT:
         # schema
         grammar = None
         if schema:
-            grammar = LlamaGrammar.from_json_schema(json.dumps(schema))
+            grammar = self.schema_cache.get(schema, lambda: LlamaGrammar.from_json_schema(json.dumps(schema)))
 
         # Check if messages contain array content, for ITT
         # has_array_content=False
@@ -262,7 +271,8 @@ class LlamaCpp_TTT:
                 top_p=top_p,
                 max_tokens=max_tokens,
                 stop=stop,
-                seed=seed
+                seed=seed,
+                chunk_format=chunk_format
             ))    
 
         response = self._generating(
@@ -277,3 +287,9 @@ class LlamaCpp_TTT:
             seed=seed
         )
         return response
+
+    # llama_cpp.Llama evaluates one sequence at a time, so the batch is generated serially.
+    # Results are returned in the same order as list_of_messages.
+    def create_batch(self, list_of_messages, **model_params):
+        model_params["stream"] = False
+        return [self.create(messages=messages, **model_params) for messages in list_of_messages]
@@ -0,0 +1,58 @@
+import json, hashlib, threading
+from collections import OrderedDict
+
+class SchemaCache:
+    """
+    # Documentation
+    Descriptions: Thread-safe LRU cache of objects compiled from a JSON schema, eg. token enforcers and grammars.
+    The key is the sha256 of the canonical JSON of the schema so that the same schema with different key order or whitespace
+    is only compiled once.
+    Example:
+        cache = SchemaCache(max_size=32)
+        grammar = cache.get(schema, lambda: LlamaGrammar.from_json_schema(json.dumps(schema)))
+    """
+
+    def __init__(self, max_size=32):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def Hash(schema):
+        canonical = json.dumps(schema, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    # Returns the cached object for the schema, otherwise compiles it with factory() and caches it.
+    def get(self, schema, factory):
+        key = SchemaCache.Hash(schema)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+
+        # Compile outside the lock. If two threads compile the same schema at the same time, the first one is kept.
+        value = factory()
+        with self.lock:
+            if key in self.entries:
+                return self.entries[key]
+            self.entries[key] = value
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+            return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
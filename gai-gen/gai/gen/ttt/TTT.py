@@ -3,6 +3,8 @@ from gai_common import logging, generators_utils
 from gai_common.generators_utils import word_streamer
 logger = logging.getLogger(__name__)
 from gai.gen.GenBase import GenBase
+from gai.gen.ttt.ChunkEncoder import ChunkEncoder
+import inspect
 
 class TTT(GenBase):
 
@@ -48,5 +50,35 @@ class TTT(GenBase):
     def unload(self):
         self.engine.unload()
 
+    # True if the engine can serve multiple create() calls at the same time.
+    @property
+    def concurrent(self):
+        return getattr(self.engine, "concurrent", False)
+
+    def get_stats(self):
+        if hasattr(self.engine, 'get_stats'):
+            return self.engine.get_stats()
+        return {}
+
+    # chunk_format="ndjson" or "sse" returns the streamed chunks as encoded bytes.
+    # Engines that do not support chunk_format natively have their chunks encoded here.
     def create(self,messages,**model_params):
-        return self.engine.create(messages,**model_params)
+        chunk_format = model_params.pop("chunk_format", None)
+        if not chunk_format:
+            return self.engine.create(messages,**model_params)
+        if "chunk_format" in inspect.signature(self.engine.create).parameters:
+            return self.engine.create(messages,chunk_format=chunk_format,**model_params)
+        response = self.engine.create(messages,**model_params)
+        if not model_params.get("stream", True):
+            return response
+        encoder = ChunkEncoder(generator=self.config.get("model_name"), chunk_format=chunk_format)
+        return (encoder.encode(chunk) for chunk in response if chunk is not None)
+
+    # Returns the completions of list_of_messages in the same order.
+    # Engines without batch support generate the completions one at a time.
+    def create_batch(self,list_of_messages,**model_params):
+        model_params.pop("stream", None)
+        model_params.pop("chunk_format", None)
+        if hasattr(self.engine, 'create_batch'):
+            return self.engine.create_batch(list_of_messages,**model_params)
+        return [self.engine.create(messages,stream=False,**model_params) for messages in list_of_messages]
@@ -11,6 +11,7 @@ from uuid import uuid4
 from datetime import datetime
 from typing import List
 import re
+from gai.gen.ttt.OutputBuilder import OutputBuilder
 
 class Transformers_TTT:
 
@@ -219,4 +220,40 @@ class Transformers_TTT:
         return (chunk for chunk in self._streaming(
             prompt=self.prompt,
             **model_params
-        ))    
\ No newline at end of file
+        ))    
+
+    # Generate completions for a list of conversations. Results are returned in the same order as list_of_messages.
+    # Prompts are sorted by length and grouped into batches of batch_size to minimise padding,
+    # then each batch is left-padded and generated in a single forward pass.
+    def create_batch(self,list_of_messages,**model_params):
+        if not self.tokenizer:
+            self.load()
+
+        model_params=generators_utils.filter_params(model_params, self.param_whitelist)
+        model_params = {**self.gai_config["hyperparameters"],**model_params}
+        model_params.pop("stream", None)
+        batch_size = self.gai_config.get("batch_size", 8)
+
+        prompts = [self._apply_template(messages) for messages in list_of_messages]
+        lengths = [len(self.tokenizer.encode(prompt)) for prompt in prompts]
+        order = sorted(range(len(prompts)), key=lambda i: lengths[i])
+
+        # Decoder-only models must be left-padded for batched generation.
+        self.tokenizer.padding_side = "left"
+        results = [None]*len(prompts)
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start+batch_size]
+            inputs = self.tokenizer([prompts[i] for i in indices], return_tensors="pt", padding=True, add_special_tokens=True).to("cuda")
+            generated = self.model.generate(**inputs, pad_token_id=self.tokenizer.pad_token_id, **model_params)
+            input_len = inputs.input_ids.shape[-1]
+            for row, i in enumerate(indices):
+                new_ids = generated[row, input_len:]
+                new_tokens = int((new_ids != self.tokenizer.pad_token_id).sum())
+                results[i] = OutputBuilder.BuildContent(
+                    generator=self.gai_config["model_name"],
+                    finish_reason="length" if new_tokens >= model_params.get("max_new_tokens", 0) else "stop",
+                    content=self.tokenizer.decode(new_ids, skip_special_tokens=True),
+                    prompt_tokens=int(inputs.attention_mask[row].sum()),
+                    new_tokens=new_tokens
+                )
+        return results
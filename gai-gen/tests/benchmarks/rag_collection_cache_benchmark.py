@@ -0,0 +1,59 @@
+'''
+Measures the per-call overhead of looking up the chromadb collection in RAGVSRepository, with and without the collection handle cache.
+
+Usage:
+    python tests/benchmarks/rag_collection_cache_benchmark.py [chunk_count]
+
+Defaults to 1000 chunks. The embedding function returns fixed vectors so that only the repository and chromadb overhead is measured.
+Each operation is timed on an in-memory client and on a persistent client in a temporary directory.
+'''
+import os, sys, time, tempfile
+sys.path.insert(0,os.path.join(os.path.dirname(__file__), "..", ".."))
+import numpy as np
+import chromadb
+from chromadb.config import Settings
+from gai.gen.rag.dalc.RAGVSRepository import RAGVSRepository
+
+DIMENSION=768
+REPEAT=200
+
+class FixedEmbeddingFunction:
+    def __call__(self, input):
+        return [np.full(DIMENSION, (len(text) % 100) / 100, dtype=np.float32).tolist() for text in input]
+
+def populate(repo, chunk_count):
+    metadata = dict(document_id="doc", chunkgroup_id="group", source="", abstract="", title="", published_date="", keywords="")
+    for start in range(0, chunk_count, 100):
+        ids = [f"chunk{i}" for i in range(start, min(start+100, chunk_count))]
+        repo.index_chunks("benchmark", contents=[f"content of {id}" for id in ids], chunk_ids=ids, **metadata)
+
+def measure(repo, fn, cached):
+    fn()
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        if not cached:
+            repo._clear_collections()
+        fn()
+    return (time.perf_counter() - start) / REPEAT * 1000
+
+def run(client, chunk_count):
+    repo = RAGVSRepository(client, FixedEmbeddingFunction())
+    populate(repo, chunk_count)
+    operations = {
+        "retrieve": lambda: repo.retrieve("benchmark", "content of chunk1", 3),
+        "get_chunk": lambda: repo.get_chunk("benchmark", "chunk1"),
+        "collection_chunk_count": lambda: repo.collection_chunk_count("benchmark"),
+    }
+    return {name: (measure(repo, fn, cached=False), measure(repo, fn, cached=True)) for name, fn in operations.items()}
+
+if __name__ == "__main__":
+    chunk_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    print(f"{'client':<12} {'operation':<24} {'uncached (ms)':>14} {'cached (ms)':>12} {'saved (ms)':>11}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        clients = {
+            "in-memory": chromadb.Client(Settings(anonymized_telemetry=False)),
+            "persistent": chromadb.PersistentClient(path=temp_dir, settings=Settings(anonymized_telemetry=False)),
+        }
+        for client_name, client in clients.items():
+            for name, (uncached, cached) in run(client, chunk_count).items():
+                print(f"{client_name:<12} {name:<24} {uncached:>14.3f} {cached:>12.3f} {uncached-cached:>11.3f}")
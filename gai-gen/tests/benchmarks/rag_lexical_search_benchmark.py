@@ -0,0 +1,99 @@
+'''
+Measures the latency of RAGDBRepository.search_chunks, the BM25 lexical search used by hybrid retrieval.
+
+Usage:
+    python tests/benchmarks/rag_lexical_search_benchmark.py [chunk_count ...]
+
+Defaults to 10000 100000 1000000 chunks. Each chunk has 50 words drawn from a Zipf distribution over a 50000 word vocabulary,
+and one chunk in 100 contains a part number. The chunks are spread over 10 collections with 100 chunks per chunkgroup.
+'''
+import os, sys, time, uuid, tempfile
+sys.path.insert(0,os.path.join(os.path.dirname(__file__), "..", ".."))
+import numpy as np
+from datetime import datetime
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from gai.gen.rag.dalc.IndexedDocument import IndexedDocument
+from gai.gen.rag.dalc.IndexedDocumentChunk import IndexedDocumentChunk
+from gai.gen.rag.dalc.IndexedDocumentChunkGroup import IndexedDocumentChunkGroup
+from gai.gen.rag.dalc.RAGDBRepository import RAGDBRepository
+
+CHUNKS_PER_GROUP=100
+COLLECTIONS=10
+WORDS_PER_CHUNK=50
+VOCABULARY=50000
+REPEAT=20
+QUERIES = {
+    "part number": "Where is part XK-40021-B used?",
+    "rare words": "word31977 word48210",
+    "common words": "what is the word1 of word2 and word3",
+}
+
+def populate(engine, chunk_count):
+    rng = np.random.default_rng(0)
+    vocabulary = np.array([f"word{i}" for i in range(VOCABULARY)])
+    group_count = max(chunk_count // CHUNKS_PER_GROUP, 1)
+    now = datetime.now()
+    with engine.begin() as conn:
+        conn.execute(insert(IndexedDocument), [{
+            "Id": f"doc{i}",
+            "CollectionName": f"collection{i % COLLECTIONS}",
+            "ByteSize": 0,
+            "FileName": f"doc{i}.txt",
+            "FileType": "txt",
+            "IsActive": True,
+            "CreatedAt": now,
+            "UpdatedAt": now
+        } for i in range(group_count)])
+        conn.execute(insert(IndexedDocumentChunkGroup), [{
+            "Id": f"group{i}",
+            "DocumentId": f"doc{i}",
+            "SplitAlgo": "recursive_split",
+            "ChunkCount": CHUNKS_PER_GROUP,
+            "ChunkSize": 1000,
+            "Overlap": 100,
+            "IsActive": True
+        } for i in range(group_count)])
+        batch = []
+        for i in range(chunk_count):
+            words = vocabulary[np.minimum(rng.zipf(1.2, WORDS_PER_CHUNK), VOCABULARY) - 1]
+            content = " ".join(words)
+            if i % 100 == 0:
+                content += f" part XK-{40000 + i // 100}-B"
+            batch.append({
+                "Id": str(uuid.uuid4()),
+                "ChunkGroupId": f"group{i // CHUNKS_PER_GROUP}",
+                "ChunkIndex": i % CHUNKS_PER_GROUP,
+                "ChunkHash": uuid.uuid4().hex,
+                "ByteSize": len(content),
+                "IsDuplicate": False,
+                "IsIndexed": True,
+                "Content": content
+            })
+            if len(batch) == 10000:
+                conn.execute(insert(IndexedDocumentChunk), batch)
+                batch = []
+        if batch:
+            conn.execute(insert(IndexedDocumentChunk), batch)
+
+def measure(fn):
+    fn()
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        fn()
+    return (time.perf_counter() - start) / REPEAT * 1000
+
+if __name__ == "__main__":
+    chunk_counts = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+    print(f"{'chunks':>10} {'query':<14} {'hits':>5} {'search (ms)':>12}")
+    for chunk_count in chunk_counts:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            engine = create_engine(f"sqlite:///{os.path.join(temp_dir, 'rag.db')}")
+            RAGDBRepository.Migrate(engine)
+            populate(engine, chunk_count)
+            repo = RAGDBRepository(sessionmaker(bind=engine)())
+            for name, query in QUERIES.items():
+                hits = repo.search_chunks("collection1", query, 20)
+                ms = measure(lambda: repo.search_chunks("collection1", query, 20))
+                print(f"{chunk_count:>10} {name:<14} {len(hits):>5} {ms:>12.2f}")
+            engine.dispose()
@@ -0,0 +1,57 @@
+'''
+Measures RAGVSRepository.retrieve latency for a repeated query: without caches, with the query embedding cached, and with the result cached.
+
+Usage:
+    python tests/benchmarks/rag_query_cache_benchmark.py [embedding_ms] [chunk_count]
+
+Defaults to 20 ms per embedding call and 1000 chunks. The embedding function returns fixed vectors after sleeping for embedding_ms
+to stand in for the embedding model, so the numbers show the saved model time as well as the chromadb query time.
+'''
+import os, sys, time
+sys.path.insert(0,os.path.join(os.path.dirname(__file__), "..", ".."))
+import numpy as np
+import chromadb
+from chromadb.config import Settings
+from gai.gen.rag.dalc.RAGVSRepository import RAGVSRepository
+
+DIMENSION=768
+REPEAT=100
+
+class SlowEmbeddingFunction:
+    def __init__(self, embedding_ms):
+        self.embedding_ms = embedding_ms
+
+    def __call__(self, input):
+        time.sleep(self.embedding_ms / 1000)
+        return [np.full(DIMENSION, (len(text) % 100) / 100, dtype=np.float32).tolist() for text in input]
+
+def measure(fn, before=None):
+    total = 0
+    for _ in range(REPEAT):
+        if before:
+            before()
+        start = time.perf_counter()
+        fn()
+        total += time.perf_counter() - start
+    return total / REPEAT * 1000
+
+if __name__ == "__main__":
+    embedding_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 20
+    chunk_count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    repo = RAGVSRepository(chromadb.Client(Settings(anonymized_telemetry=False)), SlowEmbeddingFunction(embedding_ms))
+    repo.embedding_model_name = "benchmark"
+    metadata = dict(document_id="doc", chunkgroup_id="group", source="", abstract="", title="", published_date="", keywords="")
+    for start in range(0, chunk_count, 100):
+        ids = [f"chunk{i}" for i in range(start, min(start+100, chunk_count))]
+        repo.index_chunks("benchmark", contents=[f"content of {id}" for id in ids], chunk_ids=ids, embeddings=repo._ef(ids), **metadata)
+
+    query = "what is the content of chunk1?"
+    retrieve = lambda: repo.retrieve("benchmark", query, 3)
+    results = {
+        "no cache": measure(retrieve, before=lambda: (repo._query_embeddings.clear(), repo._results.clear())),
+        "query embedding cached": measure(retrieve, before=lambda: repo._results.clear()),
+        "result cached": measure(retrieve),
+    }
+    print(f"{'retrieve':<24} {'ms':>10}")
+    for name, ms in results.items():
+        print(f"{name:<24} {ms:>10.3f}")
@@ -0,0 +1,108 @@
+'''
+Measures the latency of the RAG SQLite queries that filter on secondary columns, with and without the indexes declared on the models.
+
+Usage:
+    python tests/benchmarks/rag_sqlite_index_benchmark.py [chunk_count ...]
+
+Defaults to 10000 100000 1000000 chunks. Each run creates a temporary database with 100 chunks per chunkgroup,
+1 chunkgroup per document and 10 collections.
+'''
+import os, sys, time, uuid, tempfile
+sys.path.insert(0,os.path.join(os.path.dirname(__file__), "..", ".."))
+from datetime import datetime
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import sessionmaker
+from gai.gen.rag.dalc.Base import Base
+from gai.gen.rag.dalc.IndexedDocument import IndexedDocument
+from gai.gen.rag.dalc.IndexedDocumentChunk import IndexedDocumentChunk
+from gai.gen.rag.dalc.IndexedDocumentChunkGroup import IndexedDocumentChunkGroup
+from gai.gen.rag.dalc.RAGDBRepository import RAGDBRepository
+
+CHUNKS_PER_GROUP=100
+COLLECTIONS=10
+REPEAT=20
+
+def populate(engine, chunk_count):
+    group_count = max(chunk_count // CHUNKS_PER_GROUP, 1)
+    now = datetime.now()
+    with engine.begin() as conn:
+        conn.execute(insert(IndexedDocument), [{
+            "Id": f"doc{i}",
+            "CollectionName": f"collection{i % COLLECTIONS}",
+            "ByteSize": 0,
+            "FileName": f"doc{i}.txt",
+            "FileType": "txt",
+            "IsActive": True,
+            "CreatedAt": now,
+            "UpdatedAt": now
+        } for i in range(group_count)])
+        conn.execute(insert(IndexedDocumentChunkGroup), [{
+            "Id": f"group{i}",
+            "DocumentId": f"doc{i}",
+            "SplitAlgo": "recursive_split",
+            "ChunkCount": CHUNKS_PER_GROUP,
+            "ChunkSize": 1000,
+            "Overlap": 100,
+            "IsActive": True
+        } for i in range(group_count)])
+        batch = []
+        for i in range(chunk_count):
+            batch.append({
+                "Id": str(uuid.uuid4()),
+                "ChunkGroupId": f"group{i // CHUNKS_PER_GROUP}",
+                "ChunkIndex": i % CHUNKS_PER_GROUP,
+                "ChunkHash": uuid.uuid4().hex,
+                "ByteSize": 5,
+                "IsDuplicate": False,
+                "IsIndexed": True,
+                "Content": "chunk"
+            })
+            if len(batch) == 10000:
+                conn.execute(insert(IndexedDocumentChunk), batch)
+                batch = []
+        if batch:
+            conn.execute(insert(IndexedDocumentChunk), batch)
+    return group_count
+
+def drop_indexes(engine):
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                conn.execute(text(f'DROP INDEX IF EXISTS "{index.name}"'))
+
+def measure(fn):
+    fn()
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        fn()
+    return (time.perf_counter() - start) / REPEAT * 1000
+
+def run(chunk_count, indexed):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        engine = create_engine(f"sqlite:///{os.path.join(temp_dir, 'rag.db')}")
+        RAGDBRepository.Migrate(engine)
+        if not indexed:
+            drop_indexes(engine)
+        group_count = populate(engine, chunk_count)
+        repo = RAGDBRepository(sessionmaker(bind=engine)())
+        last = group_count - 1
+        with engine.connect() as conn:
+            chunk_hash = conn.execute(text('SELECT "ChunkHash" FROM "IndexedDocumentChunks" ORDER BY rowid DESC LIMIT 1')).scalar()
+        result = {
+            "list_chunks": measure(lambda: repo.list_chunks(f"group{last}")),
+            "list_chunkgroup_ids": measure(lambda: repo.list_chunkgroup_ids(f"doc{last}")),
+            "collection_chunk_count": measure(lambda: repo.collection_chunk_count("collection0")),
+            "list_document_headers": measure(lambda: repo.list_document_headers("collection0")),
+            "duplicate_lookup": measure(lambda: repo._find_chunk_hashes([chunk_hash])),
+        }
+        engine.dispose()
+        return result
+
+if __name__ == "__main__":
+    chunk_counts = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+    print(f"{'chunks':>10} {'query':<24} {'no index (ms)':>14} {'indexed (ms)':>14}")
+    for chunk_count in chunk_counts:
+        without_indexes = run(chunk_count, indexed=False)
+        with_indexes = run(chunk_count, indexed=True)
+        for query in with_indexes:
+            print(f"{chunk_count:>10} {query:<24} {without_indexes[query]:>14.2f} {with_indexes[query]:>14.2f}")
@@ -1,5 +1,5 @@
 import unittest
-import os, sys
+import os, sys, tempfile
 from gai.common import file_utils
 from gai.gen.rag.dalc.IndexedDocumentChunk import IndexedDocumentChunk
 from gai.gen.rag.dalc.IndexedDocumentChunkGroup import IndexedDocumentChunkGroup
@@ -12,6 +12,7 @@ from gai.gen.rag.dalc.Base import Base
 
 from datetime import datetime
 from gai.gen.rag.dalc.RAGDBRepository import RAGDBRepository as Repository
+from gai.gen.rag.dalc.RAGBlobRepository import RAGBlobRepository
 from gai.gen.rag.RAG import RAG
 from gai_common.logging import getLogger
 logger = getLogger(__name__)
@@ -21,10 +22,10 @@ class UT0010_RAGDBRepository_test(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         engine = create_engine('sqlite:///:memory:')
-        Base.metadata.create_all(engine)
+        Repository.Migrate(engine)
         Session = sessionmaker(bind=engine)
         cls.session = Session()
-        cls.repo = Repository(cls.session)
+        cls.repo = Repository(cls.session, RAGBlobRepository(tempfile.mkdtemp()))
 
 
 #-------------------------------------------------------------------------------------------------------------------------------------------
@@ -47,7 +48,7 @@ class UT0010_RAGDBRepository_test(unittest.TestCase):
 
         #convert to base 64
 
-        self.assertEqual("-Sc9eXzUiSlaFV3qEDaKam33Boamkvv4tea8YPsjpy0",doc_id)
+        self.assertEqual("t9cpiP2BB9B_fSeL8LpmIa227UffdL5AFPpKAfA6_2o",doc_id)
 
     def test_ut0014_create_document_header(self):
 
@@ -69,7 +70,7 @@ class UT0010_RAGDBRepository_test(unittest.TestCase):
             comments='This is a test document')
 
         # Assert
-        retrieved_doc = self.repo.get_document_header(collection_name='demo', doc_id="-Sc9eXzUiSlaFV3qEDaKam33Boamkvv4tea8YPsjpy0",include_file=True)
+        retrieved_doc = self.repo.get_document_header(collection_name='demo', doc_id="t9cpiP2BB9B_fSeL8LpmIa227UffdL5AFPpKAfA6_2o")
 
         # Ensure the document was retrieved
         self.assertIsNotNone(retrieved_doc)
@@ -92,10 +93,12 @@ class UT0010_RAGDBRepository_test(unittest.TestCase):
         self.assertIsNotNone(retrieved_doc.CreatedAt)
         self.assertIsNotNone(retrieved_doc.UpdatedAt)
 
-        # compare the file content
+        # compare the file content in the blob store
         with open(file_path, 'rb') as f:
             expected_file_content = f.read()
-        self.assertEqual(retrieved_doc.File, expected_file_content)
+        self.assertEqual(retrieved_doc.FileRef, retrieved_doc.Id)
+        with self.repo.blob_repo.open(retrieved_doc.FileRef) as f:
+            self.assertEqual(f.read(), expected_file_content)
 
 
     def test_ut0015_should_not_create_duplicate(self):
@@ -295,6 +298,148 @@ class UT0010_RAGDBRepository_test(unittest.TestCase):
 #         self.assertEqual(len(docs), 2)
 
 
+    def test_ut0022_save_and_get_embeddings(self):
+        # Arrange
+        self.repo.save_embeddings("instructor-large", {"hash1": [0.5, 0.25], "hash2": [1.0, -1.0]})
+
+        # Act
+        embeddings = self.repo.get_embeddings("instructor-large", ["hash1", "hash2", "hash3"])
+
+        # Assert
+        self.assertEqual(embeddings, {"hash1": [0.5, 0.25], "hash2": [1.0, -1.0]})
+        self.assertEqual(self.repo.get_embeddings("text-embedding-ada-002", ["hash1"]), {})
+
+    def test_ut0029_save_and_get_embeddings_in_batches(self):
+        # Arrange
+        self.repo.save_embeddings("instructor-large", {f"hash{i}": [float(i)] for i in range(1200)})
+        self.repo.save_embeddings("instructor-large", {"hash1": [-1.0]})
+
+        # Act
+        embeddings = self.repo.get_embeddings("instructor-large", [f"hash{i}" for i in range(1300)], batch_size=500)
+
+        # Assert
+        self.assertEqual(len(embeddings), 1200)
+        self.assertEqual(embeddings["hash1"], [-1.0])
+        self.assertEqual(embeddings["hash1199"], [1199.0])
+
+    def test_ut002A_find_document_with_legacy_id(self):
+        # Arrange
+        file_path = os.path.join(os.path.dirname(__file__), "pm_long_speech_2023.txt")
+        doc_id = self.repo.create_document_header(collection_name='legacy', file_path=file_path, file_type='txt')
+        # Documents indexed by previous versions are keyed by the hash of the converted text
+        legacy_id = file_utils.create_chunk_id_base64(self.repo._load_and_convert(file_path))
+        self.session.query(IndexedDocument).filter(IndexedDocument.Id==doc_id).update({IndexedDocument.Id: legacy_id})
+        self.session.commit()
+
+        # Act
+        found_id = self.repo.find_document_id('legacy', file_path)
+
+        # Assert
+        self.assertEqual(found_id, legacy_id)
+        self.assertIsNone(self.repo.find_document_id('other', file_path))
+
+    def test_ut0023_update_chunkgroup_reuses_unchanged_chunks(self):
+        # Arrange
+        file_path = os.path.join(os.path.dirname(__file__), "pm_long_speech_2023.txt")
+        doc_id = self.repo.create_document_header(collection_name='incremental', file_path=file_path, file_type='txt')
+        chunkgroup = self.repo.create_chunkgroup('incremental', doc_id, chunk_size=1000, chunk_overlap=100)
+        chunks = self.repo.list_chunks(chunkgroup.Id)
+        self.repo.update_chunks_indexed([chunk.Id for chunk in chunks])
+
+        # Act
+        result = self.repo.update_chunkgroup('incremental', chunkgroup.Id, doc_id, chunk_size=1000, chunk_overlap=100)
+
+        # Assert
+        self.assertEqual(result["reused"], len(chunks))
+        self.assertEqual(result["added"], 0)
+        self.assertEqual(result["removed_chunk_ids"], [])
+        self.assertTrue(all(chunk.IsIndexed for chunk in self.repo.list_chunks(chunkgroup.Id)))
+
+    def test_ut0024_create_chunkgroup_preserves_chunk_order(self):
+        # Arrange
+        doc_id = self.repo.create_document_header(collection_name='ordered', file_path=os.path.join(os.path.dirname(__file__), "pm_long_speech_2023.txt"), file_type='txt')
+        splitter = lambda text, chunk_size, chunk_overlap: ["first", "second", "first", "third"]
+
+        # Act
+        chunkgroup = self.repo.create_chunkgroup('ordered', doc_id, chunk_size=1000, chunk_overlap=100, splitter=splitter)
+
+        # Assert
+        self.assertIsNone(chunkgroup.ChunksDir)
+        self.assertEqual(chunkgroup.ChunkCount, 4)
+        self.assertEqual([chunk.Content for chunk in self.repo.list_chunks(chunkgroup.Id)], ["first", "second", "first", "third"])
+
+    def test_ut0025_create_chunks_marks_duplicates(self):
+        # Arrange
+        doc_id = self.repo.create_document_header(collection_name='duplicates', file_path=os.path.join(os.path.dirname(__file__), "pm_long_speech_2023.txt"), file_type='txt')
+        chunkgroup = self.repo.create_chunkgroup('duplicates', doc_id, chunk_size=1000, chunk_overlap=100, splitter=lambda text, chunk_size, chunk_overlap: ["alpha"])
+
+        # Act
+        chunks = self.repo.create_chunks(chunkgroup.Id, ["beta", "alpha", "beta"])
+
+        # Assert
+        self.assertEqual([chunk.IsDuplicate for chunk in chunks], [False, True, True])
+        self.assertEqual(self.repo.get_chunkgroup(chunkgroup.Id).ChunkCount, 4)
+
+    def test_ut0026_search_chunks_follows_chunk_changes(self):
+        # Arrange
+        doc_id = self.repo.create_document_header(collection_name='lexical', file_path=os.path.join(os.path.dirname(__file__), "pm_long_speech_2023.txt"), file_type='txt')
+        splitter = lambda text, chunk_size, chunk_overlap: ["Replace filter XK-40021-B every year.", "The pump uses part XK-40022-B.", "Nothing to see here."]
+
+        # Act
+        chunkgroup = self.repo.create_chunkgroup('lexical', doc_id, chunk_size=1000, chunk_overlap=100, splitter=splitter)
+        chunks = self.repo.list_chunks(chunkgroup.Id)
+        found = self.repo.search_chunks('lexical', "XK-40021-B")
+        other_collection = self.repo.search_chunks('other', "XK-40021-B")
+        self.repo.delete_chunkgroup(chunkgroup.Id)
+        deleted = self.repo.search_chunks('lexical', "XK-40021-B")
+
+        # Assert
+        self.assertEqual([chunk_id for chunk_id,_ in found][:2], [chunks[0].Id, chunks[1].Id])
+        self.assertEqual(other_collection, [])
+        self.assertEqual(deleted, [])
+
+    # Creates a document with the given chunks. The file content is unique so that each document gets its own id.
+    def _create_chunks(self, collection_name, contents):
+        file_path = os.path.join(tempfile.mkdtemp(), f"{collection_name}.txt")
+        with open(file_path, "w") as f:
+            f.write(f"{collection_name}: " + " ".join(contents))
+        doc_id = self.repo.create_document_header(collection_name=collection_name, file_path=file_path, file_type='txt')
+        splitter = lambda text, chunk_size, chunk_overlap: contents
+        chunkgroup = self.repo.create_chunkgroup(collection_name, doc_id, chunk_size=1000, chunk_overlap=100, splitter=splitter)
+        return chunkgroup, self.repo.list_chunks(chunkgroup.Id)
+
+    def test_ut0027_search_chunks_after_rowids_change(self):
+        # Arrange
+        deleted_chunkgroup, _ = self._create_chunks('vacuum-deleted', [f"Filler chunk number {i}." for i in range(20)])
+        _, chunks = self._create_chunks('vacuum', ["Replace filter ZQ-71 every year.", "The pump uses part ZQ-72."])
+        self.repo.delete_chunkgroup(deleted_chunkgroup.Id)
+
+        # Act
+        # VACUUM may renumber the rowids of the chunks because the table has no INTEGER PRIMARY KEY. Renumber them the same way.
+        with self.session.get_bind().begin() as conn:
+            conn.exec_driver_sql('UPDATE "IndexedDocumentChunks" SET rowid = rowid + 1000')
+        found = self.repo.search_chunks('vacuum', "ZQ-71")
+        _, new_chunks = self._create_chunks('vacuum-new', ["Order ZQ-71 spares."])
+        found_new = self.repo.search_chunks('vacuum-new', "ZQ-71")
+
+        # Assert
+        self.assertEqual([chunk_id for chunk_id,_ in found][:1], [chunks[0].Id])
+        self.assertEqual([chunk_id for chunk_id,_ in found_new], [new_chunks[0].Id])
+
+    def test_ut0028_search_chunks_counts_postings_per_collection(self):
+        # Arrange
+        self._create_chunks('postings-common', [f"Widget model {i} datasheet." for i in range(5)])
+        _, chunks = self._create_chunks('postings-rare', ["Widget manual.", "Gizmo manual."])
+
+        # Act
+        # widget is common in another collection but not in this one
+        rare = self.repo.search_chunks('postings-rare', "widget gizmo", max_postings=3)
+        # The rarest word is kept even if it has more postings than max_postings
+        common = self.repo.search_chunks('postings-common', "widget", max_postings=3)
+
+        # Assert
+        self.assertEqual(sorted(chunk_id for chunk_id,_ in rare), sorted(chunk.Id for chunk in chunks))
+        self.assertEqual(len(common), 5)
 
 
 if __name__ == '__main__':
@@ -1,8 +1,9 @@
 import unittest
-import os, sys
-from gai.common import file_utils
+import os, sys, re, zlib, math, threading
 sys.path.insert(0,os.path.join(os.path.dirname(__file__), "..", "..", ".."))
 from chromadb.utils.embedding_functions import InstructorEmbeddingFunction
+from chromadb.config import Settings
+import chromadb
 
 from gai.gen.rag.dalc.RAGVSRepository import RAGVSRepository
 from gai.gen.rag.dalc.RAGDBRepository import RAGDBRepository
@@ -58,12 +59,8 @@ class UT0020_RAGVSRepository_test(unittest.TestCase):
         chunkgroup = self.db_repo.create_chunkgroup(
             doc_id=doc.Id, 
             chunk_size=1000, 
-            chunk_overlap=100, 
-            splitter=file_utils.split_file)
-        db_chunks = self.db_repo.create_chunks(
-            chunkgroup.Id,
-            chunkgroup.ChunksDir
-        )
+            chunk_overlap=100)
+        db_chunks = self.db_repo.list_chunks(chunkgroup.Id)
 
         # Act
 
@@ -106,3 +103,94 @@ class UT0020_RAGVSRepository_test(unittest.TestCase):
         self.vs_repo.delete_document('demo','5a4b585a-6b0f-4302-8217-faf9d5fad391')
         vs_count = self.vs_repo.document_chunk_count('demo','5a4b585a-6b0f-4302-8217-faf9d5fad391')
         self.assertEqual(vs_count, 0)
+
+# Bag of words embedding so that the tests do not need to load an embedding model.
+class FakeEmbeddingFunction:
+
+    def __call__(self, input):
+        embeddings = []
+        for text in input:
+            vector = [0.0]*256
+            for word in re.findall(r"\w+", text.lower()):
+                vector[zlib.crc32(word.encode()) % 256] += 1.0
+            norm = math.sqrt(sum(v*v for v in vector)) or 1.0
+            embeddings.append([v/norm for v in vector])
+        return embeddings
+
+class UT0020_RAGVSRepository_in_memory_test(unittest.TestCase):
+
+    def setUp(self):
+        client = chromadb.Client(Settings(allow_reset=True, anonymized_telemetry=False))
+        self.vs_repo = RAGVSRepository(client, FakeEmbeddingFunction())
+        self.vs_repo.reset()
+
+    def test_ut0026_index_chunks_batch(self):
+        collection_name='batch'
+        contents=[f"chunk {i}" for i in range(10)]
+        chunk_ids=[f"batch-chunk-{i}" for i in range(10)]
+        self.vs_repo.index_chunks(collection_name, contents, chunk_ids,
+            document_id='batch-doc',
+            chunkgroup_id='batch-chunkgroup',
+            source="",
+            abstract="",
+            title="",
+            published_date="",
+            keywords=""
+        )
+        self.assertEqual(self.vs_repo.document_chunk_count(collection_name,'batch-doc'), 10)
+
+    def test_ut0027_collection_handle_is_cached_until_deleted(self):
+        col = self.vs_repo._get_collection('cached')
+        self.assertIs(self.vs_repo._get_collection('cached'), col)
+        self.assertIs(self.vs_repo.get_or_create_collection('cached'), col)
+
+        self.vs_repo.delete_collection('cached')
+        self.assertIsNot(self.vs_repo._get_collection('cached'), col)
+
+    def test_ut0028_retrieve_is_cached_until_collection_changes(self):
+        metadata = dict(document_id='cache-doc', chunkgroup_id='cache-chunkgroup', source="", abstract="", title="", published_date="", keywords="")
+        self.vs_repo.index_chunks('query-cache', ["chunk 1", "chunk 2"], ["cache-chunk-1", "cache-chunk-2"], **metadata)
+        first = self.vs_repo.retrieve('query-cache', "chunk", 1)
+        hits = self.vs_repo._results.hits
+        second = self.vs_repo.retrieve('query-cache', " chunk ", 1)
+        self.assertEqual(self.vs_repo._results.hits, hits + 1)
+        self.assertEqual([chunk['ids'] for chunk in first], [chunk['ids'] for chunk in second])
+
+        self.vs_repo.index_chunks('query-cache', ["chunk"], ["cache-chunk-3"], **metadata)
+        third = self.vs_repo.retrieve('query-cache', "chunk", 1)
+        self.assertEqual(self.vs_repo._results.hits, hits + 1)
+        self.assertEqual([chunk['ids'] for chunk in third], ["cache-chunk-3"])
+
+    def test_ut0029_retrieve_batch(self):
+        metadata = dict(document_id='batch-query-doc', chunkgroup_id='batch-query-chunkgroup', source="", abstract="", title="", published_date="", keywords="")
+        self.vs_repo.index_chunks('batch-query', ["The cat sat on the mat.", "Stock prices fell sharply today."], ["batch-query-1", "batch-query-2"], **metadata)
+        results = self.vs_repo.retrieve_batch('batch-query', ["cat on a mat", "stock prices"], 1)
+        self.assertEqual(len(results), 2)
+        self.assertEqual([chunk['ids'] for chunk in results[0]], ["batch-query-1"])
+        self.assertEqual([chunk['ids'] for chunk in results[1]], ["batch-query-2"])
+
+    def test_ut002A_handle_is_not_cached_while_collection_is_deleted(self):
+        col = self.vs_repo.get_or_create_collection('deleting')
+        deleting = threading.Event()
+        deleted = threading.Event()
+        delete_collection = self.vs_repo.client.delete_collection
+        def slow_delete_collection(name):
+            deleting.set()
+            deleted.wait(5)
+            return delete_collection(name)
+        self.vs_repo.client.delete_collection = slow_delete_collection
+        handles = []
+
+        deleter = threading.Thread(target=self.vs_repo.delete_collection, args=('deleting',))
+        deleter.start()
+        self.assertTrue(deleting.wait(5))
+        # The lookup waits for the delete to finish instead of caching the handle of the deleted collection
+        getter = threading.Thread(target=lambda: handles.append(self.vs_repo.get_or_create_collection('deleting')))
+        getter.start()
+        getter.join(0.2)
+        self.assertTrue(getter.is_alive())
+        deleted.set()
+        deleter.join(5)
+        getter.join(5)
+        self.assertIsNot(handles[0], col)
+        self.assertIs(self.vs_repo.get_or_create_collection('deleting'), handles[0])
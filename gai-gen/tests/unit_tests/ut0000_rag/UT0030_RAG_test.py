@@ -40,7 +40,7 @@ class UT0030_RAG(unittest.TestCase):
 
             # Assert
             self.assertIsNotNone(doc_id)
-            self.assertEqual(doc_id, '-Sc9eXzUiSlaFV3qEDaKam33Boamkvv4tea8YPsjpy0')
+            self.assertEqual(doc_id, 't9cpiP2BB9B_fSeL8LpmIa227UffdL5AFPpKAfA6_2o')
         except Exception as e:
             self.fail(f"Failed to index document: {e}")
         finally:
@@ -0,0 +1,120 @@
+import unittest
+import asyncio
+import threading
+import os, sys, tempfile
+sys.path.insert(0,os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+from types import SimpleNamespace
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, scoped_session
+from gai.gen.rag.dalc.RAGDBRepository import RAGDBRepository
+from gai.gen.rag.dalc.RAGJobRepository import RAGJobRepository
+from gai.gen.rag.RAGJobQueue import RAGJobQueue
+from gai_common.logging import getLogger
+logger = getLogger(__name__)
+
+# Records the steps that are called instead of indexing the document.
+class FakeRAG:
+
+    def __init__(self):
+        self.steps = []
+        # Set to block the index step until released, eg. to check that the service is not blocked by a running job.
+        self.indexing = None
+        self.release = None
+
+    async def index_document_header_async(self, collection_name, file_path, **kwargs):
+        self.steps.append(("header", os.path.basename(file_path)))
+        return SimpleNamespace(Id="doc1")
+
+    async def index_document_split_async(self, collection_name, document_id, chunk_size=None, chunk_overlap=None):
+        self.steps.append(("split", document_id))
+        return SimpleNamespace(Id="group1", ChunkCount=3)
+
+    async def index_document_index_async(self, collection_name, document_id, chunkgroup_id, ws_manager=None, progress_callback=None):
+        self.steps.append(("index", chunkgroup_id))
+        await progress_callback(1, 3)
+        if self.indexing:
+            # Blocks the thread like the embedding and database calls of RAG do
+            self.indexing.set()
+            self.release.wait(5)
+        await progress_callback(3, 3)
+        return ["chunk1", "chunk2", "chunk3"]
+
+class UT0050_RAGJobQueue_test(unittest.TestCase):
+
+    def setUp(self):
+        # The workers open their own connections so the database must be a file
+        engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'jobs.db')}")
+        RAGDBRepository.Migrate(engine)
+        self.job_repo = RAGJobRepository(scoped_session(sessionmaker(bind=engine)))
+        self.rag = FakeRAG()
+        self.queue = RAGJobQueue(self.rag, self.job_repo, tempfile.mkdtemp(), workers=2)
+        self.file_path = os.path.join(os.path.dirname(__file__), "pm_long_speech_2023.txt")
+
+    async def _run(self, submit=None):
+        await self.queue.start()
+        job = submit() if submit else None
+        await self.queue.join()
+        await self.queue.stop()
+        return job
+
+    def test_ut0051_submit_and_complete_job(self):
+        job = asyncio.run(self._run(lambda: self.queue.submit("demo", self.file_path, metadata={"title": "speech"})))
+        job = self.queue.get_job(job.Id)
+        self.assertEqual(job.Status, RAGJobRepository.COMPLETED)
+        self.assertEqual(job.DocumentId, "doc1")
+        self.assertEqual(job.ChunksIndexed, 3)
+        self.assertEqual([step for step,_ in self.rag.steps], ["header", "split", "index"])
+        self.assertEqual(self.rag.steps[0][1], "pm_long_speech_2023.txt")
+        self.assertFalse(os.path.exists(os.path.dirname(job.FilePath)))
+
+    def test_ut0052_resume_interrupted_job_from_last_step(self):
+        job = self.queue.submit("demo", self.file_path)
+        self.job_repo.start_job(job.Id)
+        self.job_repo.update_job(job.Id, Step="split", DocumentId="doc1")
+        asyncio.run(self._run())
+        job = self.queue.get_job(job.Id)
+        self.assertEqual(job.Status, RAGJobRepository.COMPLETED)
+        self.assertEqual([step for step,_ in self.rag.steps], ["split", "index"])
+
+    def test_ut0053_get_job_while_job_is_running(self):
+        self.rag.indexing = threading.Event()
+        self.rag.release = threading.Event()
+        async def run():
+            await self.queue.start()
+            job = self.queue.submit("demo", self.file_path)
+            # The event loop keeps serving requests while the worker is blocked
+            self.assertTrue(await asyncio.get_running_loop().run_in_executor(None, self.rag.indexing.wait, 5))
+            running = self.queue.get_job(job.Id)
+            self.rag.release.set()
+            await self.queue.join()
+            await self.queue.stop()
+            return running
+        running = asyncio.run(run())
+        self.assertEqual(running.Status, RAGJobRepository.RUNNING)
+        self.assertEqual(running.Step, "index")
+        self.assertEqual(running.ChunksIndexed, 1)
+        self.assertEqual(self.queue.get_job(running.Id).Status, RAGJobRepository.COMPLETED)
+
+    def test_ut0054_stop_leaves_running_job_to_resume(self):
+        self.rag.indexing = threading.Event()
+        self.rag.release = threading.Event()
+        async def run():
+            await self.queue.start()
+            job = self.queue.submit("demo", self.file_path)
+            self.assertTrue(await asyncio.get_running_loop().run_in_executor(None, self.rag.indexing.wait, 5))
+            stopping = asyncio.create_task(self.queue.stop())
+            # Let stop() signal the workers before the job continues
+            await asyncio.sleep(0)
+            self.rag.release.set()
+            await stopping
+            return job
+        job = asyncio.run(run())
+        self.assertEqual(self.queue.get_job(job.Id).Status, RAGJobRepository.RUNNING)
+
+        self.rag.indexing = None
+        asyncio.run(self._run())
+        self.assertEqual(self.queue.get_job(job.Id).Status, RAGJobRepository.COMPLETED)
+        self.assertEqual([step for step,_ in self.rag.steps], ["header", "split", "index", "index"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+from gai.gen.InferenceExecutor import InferenceExecutor
+import unittest
+import asyncio
+import time
+
+class CancellableStream:
+    def __init__(self, count):
+        self.count = count
+        self.cancelled = False
+        self.produced = 0
+    def __iter__(self):
+        for i in range(self.count):
+            if self.cancelled:
+                return
+            self.produced = i+1
+            time.sleep(0.001)
+            yield i
+    def cancel(self):
+        self.cancelled = True
+
+class UT0240_InferenceExecutor_test(unittest.TestCase):
+
+    def test_UT0241_stream_all_chunks(self):
+        executor = InferenceExecutor(max_workers=2)
+        async def consume():
+            return [chunk async for chunk in executor.stream(iter(range(5)))]
+        self.assertEqual(asyncio.run(consume()), [0,1,2,3,4])
+
+    def test_UT0242_stream_backpressure_and_cancel(self):
+        executor = InferenceExecutor(max_workers=2, queue_size=4)
+        response = CancellableStream(1000)
+        async def consume():
+            chunks = []
+            stream = executor.stream(response)
+            async for chunk in stream:
+                chunks.append(chunk)
+                await asyncio.sleep(0.01)
+                if len(chunks) == 10:
+                    break
+            await stream.aclose()
+            return chunks
+        chunks = asyncio.run(consume())
+        self.assertEqual(chunks, list(range(10)))
+        self.assertTrue(response.cancelled)
+        # Producer cannot run ahead of the consumer by more than the queue size (plus in-flight items)
+        self.assertLess(response.produced, 20)
+
+    def test_UT0243_stream_raises_generator_error(self):
+        executor = InferenceExecutor(max_workers=2)
+        def failing():
+            yield 1
+            raise Exception("generation failed")
+        async def consume():
+            return [chunk async for chunk in executor.stream(failing())]
+        with self.assertRaises(Exception):
+            asyncio.run(consume())
+
+    def test_UT0244_run_does_not_block_event_loop(self):
+        executor = InferenceExecutor(max_workers=2)
+        async def main():
+            ticks = 0
+            task = asyncio.ensure_future(executor.run(time.sleep, 0.2))
+            while not task.done():
+                ticks += 1
+                await asyncio.sleep(0.01)
+            return ticks
+        self.assertGreater(asyncio.run(main()), 5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+from gai.gen import Gaigen
+import unittest, threading
+from unittest.mock import patch, MagicMock
+
+class UT0250_Gaigen_residency_test(unittest.TestCase):
+
+    def setUp(self):
+        self.gen = Gaigen.GetInstance()
+        self.gen.unload()
+        self.gen.config = {
+            "gen-a": {"type": "ttt", "memory_mb": 8000},
+            "gen-b": {"type": "ttt", "memory_mb": 8000},
+            "gen-c": {"type": "ttt", "memory_mb": 8000},
+        }
+        self.gen.max_generators = 3
+        self.gen.memory_budget_mb = 20000
+        self.gen.metrics = {"loads": 0, "hits": 0, "evictions": 0, "load_seconds": 0.0}
+        self.patcher = patch.object(self.gen, "_create_generator", side_effect=lambda name: MagicMock(name=name, concurrent=False))
+        self.patcher.start()
+
+    def tearDown(self):
+        self.gen.unload()
+        self.patcher.stop()
+
+    def test_UT0251_generators_stay_resident(self):
+        self.gen.load("gen-a")
+        self.gen.create(generator_name="gen-b", messages=[])
+        self.gen.create(messages=[])
+        self.assertEqual(list(self.gen.generators.keys()), ["gen-b", "gen-a"])
+        self.assertEqual(self.gen.get_residency_stats()["loads"], 2)
+
+    def test_UT0252_evict_lru_over_budget(self):
+        self.gen.load("gen-a")
+        self.gen.create(generator_name="gen-b", messages=[])
+        self.gen.create(generator_name="gen-a", messages=[])
+        self.gen.create(generator_name="gen-c", messages=[])
+        self.assertEqual(list(self.gen.generators.keys()), ["gen-a", "gen-c"])
+        self.assertEqual(self.gen.get_residency_stats()["evictions"], 1)
+
+    def test_UT0253_evict_lru_over_max_generators(self):
+        self.gen.max_generators = 1
+        self.gen.load("gen-a")
+        self.gen.load("gen-b")
+        self.assertEqual(list(self.gen.generators.keys()), ["gen-b"])
+        self.assertEqual(self.gen.generator_name, "gen-b")
+
+    def test_UT0254_create_batch_routed_by_name(self):
+        self.gen.load("gen-a")
+        self.gen.create_batch([[{"role":"user","content":"hi"}]], generator_name="gen-b", max_new_tokens=10)
+        self.gen.generators["gen-b"].create_batch.assert_called_once_with([[{"role":"user","content":"hi"}]], max_new_tokens=10)
+        self.gen.generators["gen-a"].create_batch.assert_not_called()
+
+    def test_UT0255_busy_generator_not_evicted(self):
+        self.gen.max_generators = 1
+        self.gen.load("gen-a")
+        self.gen.generators["gen-a"].create.return_value = iter(["once", "upon"])
+        stream = self.gen.create(messages=[], stream=True)
+        self.assertEqual(next(stream), "once")
+
+        # gen-b waits for the stream on gen-a to finish before gen-a is evicted
+        loader = threading.Thread(target=self.gen.load, args=("gen-b",))
+        loader.start()
+        loader.join(0.2)
+        self.assertTrue(loader.is_alive())
+        self.assertIn("gen-a", self.gen.generators)
+        self.gen.generators["gen-a"].unload.assert_not_called()
+
+        self.assertEqual(list(stream), ["upon"])
+        loader.join(5)
+        self.assertFalse(loader.is_alive())
+        self.assertEqual(list(self.gen.generators.keys()), ["gen-b"])
+
+    def test_UT0256_refuse_to_evict_busy_generator_after_timeout(self):
+        self.gen.max_generators = 1
+        self.gen.evict_timeout = 0.1
+        self.gen.load("gen-a")
+        self.gen.generators["gen-a"].create.return_value = iter(["once", "upon"])
+        stream = self.gen.create(messages=[], stream=True)
+        with self.assertRaises(Exception):
+            self.gen.create(generator_name="gen-b", messages=[])
+        self.assertEqual(list(self.gen.generators.keys()), ["gen-a"])
+        stream.close()
+        self.assertEqual(self.gen.in_flight["gen-a"], 0)
+
+    def test_UT0257_cold_load_does_not_block_resident_generators(self):
+        self.gen.load("gen-a")
+        loading = threading.Event()
+        loaded = threading.Event()
+        slow = MagicMock(name="gen-b", concurrent=False)
+        slow.load.side_effect = lambda: (loading.set(), loaded.wait(5))
+        self.patcher.stop()
+        self.patcher = patch.object(self.gen, "_create_generator", return_value=slow)
+        self.patcher.start()
+
+        loader = threading.Thread(target=self.gen.create, kwargs={"generator_name": "gen-b", "messages": []})
+        loader.start()
+        self.assertTrue(loading.wait(5))
+        # gen-a is served while gen-b is loading
+        self.gen.create(generator_name="gen-a", messages=[])
+        self.gen.generators["gen-a"].create.assert_called_once()
+        loaded.set()
+        loader.join(5)
+        self.assertEqual(list(self.gen.generators.keys()), ["gen-a", "gen-b"])
+        slow.load.assert_called_once()
+
+    def test_UT0258_default_generator_reloaded_after_eviction(self):
+        self.gen.max_generators = 1
+        self.gen.load("gen-a")
+        self.gen.create(generator_name="gen-b", messages=[])
+        self.assertEqual(list(self.gen.generators.keys()), ["gen-b"])
+
+        # The default generator is loaded again instead of raising "Generator is not loaded"
+        self.gen.token_count("once upon a time")
+        self.assertEqual(list(self.gen.generators.keys()), ["gen-a"])
+        self.gen.generators["gen-a"].token_count.assert_called_once_with("once upon a time")
+        self.assertEqual(self.gen.in_flight["gen-a"], 0)
+
+    def test_UT0259_retrieve_after_eviction(self):
+        self.gen.max_generators = 1
+        self.gen.load("gen-a")
+        self.gen.create(generator_name="gen-b", messages=[])
+        self.patcher.stop()
+        rag = MagicMock(name="rag", concurrent=False, generator_name="rag")
+        self.patcher = patch.object(self.gen, "_create_generator", return_value=rag)
+        self.patcher.start()
+
+        self.gen.retrieve("demo", "once upon a time")
+        rag.retrieve.assert_called_once_with("demo", "once upon a time", None)
+        self.assertEqual(list(self.gen.generators.keys()), ["gen-a"])
+    def test_UT025A_unload_does_not_block_resident_generators(self):
+        self.gen.load("gen-a")
+        self.gen.create(generator_name="gen-b", messages=[])
+        unloading = threading.Event()
+        unloaded = threading.Event()
+        self.gen.generators["gen-a"].unload.side_effect = lambda: (unloading.set(), unloaded.wait(5))
+
+        # gen-c evicts gen-a and waits for it to be unloaded before loading
+        loader = threading.Thread(target=self.gen.create, kwargs={"generator_name": "gen-c", "messages": []})
+        loader.start()
+        self.assertTrue(unloading.wait(5))
+        # gen-b is served while gen-a is being unloaded
+        self.gen.create(generator_name="gen-b", messages=[])
+        self.assertEqual(self.gen.generators["gen-b"].create.call_count, 2)
+        self.assertNotIn("gen-c", self.gen.generators)
+        unloaded.set()
+        loader.join(5)
+        self.assertEqual(list(self.gen.generators.keys()), ["gen-b", "gen-c"])
+        self.assertEqual(self.gen.unloading, set())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+from gai.gen.ttt.ChunkOutputBuilder import ChunkOutputBuilder
+from gai.gen.ttt.ChunkEncoder import ChunkEncoder
+from openai.types.chat.chat_completion_chunk import ChatCompletionChunk
+import unittest
+import json
+
+class UT0260_ChunkEncoder_test(unittest.TestCase):
+
+    def assertSameChunk(self, encoded, expected):
+        actual = ChatCompletionChunk(**json.loads(encoded))
+        self.assertEqual(actual.model, expected.model)
+        self.assertEqual(actual.object, expected.object)
+        self.assertEqual(actual.choices[0].delta, expected.choices[0].delta)
+        self.assertEqual(actual.choices[0].finish_reason, expected.choices[0].finish_reason)
+        self.assertEqual(actual.choices[0].index, expected.choices[0].index)
+
+    def test_UT0261_ndjson_content_chunks(self):
+        encoder = ChunkEncoder(generator="mistral7b-exllama", chunk_format="ndjson")
+        head = encoder.BuildContentHead()
+        body = encoder.BuildContentBody(content='Once "upon"\n')
+        tail = encoder.BuildContentTail(finish_reason="length")
+        for encoded in [head, body, tail]:
+            self.assertTrue(encoded.endswith(b"\n"))
+            self.assertEqual(encoded.count(b"\n"), 1)
+        self.assertSameChunk(head, ChunkOutputBuilder.BuildContentHead(generator="mistral7b-exllama"))
+        self.assertSameChunk(body, ChunkOutputBuilder.BuildContentBody(generator="mistral7b-exllama", content='Once "upon"\n'))
+        self.assertSameChunk(tail, ChunkOutputBuilder.BuildContentTail(generator="mistral7b-exllama", finish_reason="length"))
+
+    def test_UT0262_one_id_per_stream(self):
+        encoder = ChunkEncoder(generator="mistral7b-exllama", chunk_format="ndjson")
+        ids = set([
+            json.loads(encoder.BuildContentHead())["id"],
+            json.loads(encoder.BuildContentBody(content="Once"))["id"],
+            json.loads(encoder.BuildToolHead(tool_name="gg"))["id"],
+            json.loads(encoder.BuildContentTail(finish_reason="stop"))["id"],
+        ])
+        self.assertEqual(len(ids), 1)
+
+    def test_UT0263_sse_framing(self):
+        encoder = ChunkEncoder(generator="mistral7b-exllama", chunk_format="sse")
+        body = encoder.BuildContentBody(content="Once")
+        self.assertTrue(body.startswith(b"data: "))
+        self.assertTrue(body.endswith(b"\n\n"))
+        self.assertSameChunk(body[len(b"data: "):], ChunkOutputBuilder.BuildContentBody(generator="mistral7b-exllama", content="Once"))
+
+    def test_UT0264_pydantic_mode(self):
+        encoder = ChunkEncoder(generator="mistral7b-exllama")
+        result = encoder.BuildContentBody(content="Once")
+        self.assertIsInstance(result, ChatCompletionChunk)
+        self.assertEqual(result.choices[0].delta.content, "Once")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+from gai.gen.ttt.SchemaCache import SchemaCache
+import unittest
+
+class UT0270_SchemaCache_test(unittest.TestCase):
+
+    def test_UT0271_same_schema_compiled_once(self):
+        cache = SchemaCache(max_size=2)
+        compiled = []
+        def factory():
+            compiled.append(1)
+            return object()
+        first = cache.get({"type":"object","properties":{"a":{"type":"string"}}}, factory)
+        # Same schema with different key order
+        second = cache.get({"properties":{"a":{"type":"string"}},"type":"object"}, factory)
+        self.assertIs(first, second)
+        self.assertEqual(len(compiled), 1)
+        self.assertEqual(cache.get_stats()["hits"], 1)
+        self.assertEqual(cache.get_stats()["misses"], 1)
+
+    def test_UT0272_lru_eviction(self):
+        cache = SchemaCache(max_size=2)
+        cache.get({"title":"a"}, lambda: "a")
+        cache.get({"title":"b"}, lambda: "b")
+        cache.get({"title":"a"}, lambda: "a2")
+        cache.get({"title":"c"}, lambda: "c")
+        self.assertEqual(cache.get({"title":"a"}, lambda: "a3"), "a")
+        self.assertEqual(cache.get({"title":"b"}, lambda: "b2"), "b2")
+        self.assertEqual(cache.get_stats()["size"], 2)
+
+if __name__ == '__main__':
+    unittest.main()
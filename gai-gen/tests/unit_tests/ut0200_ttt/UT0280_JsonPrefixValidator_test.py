@@ -0,0 +1,38 @@
+from gai.gen.ttt.JsonPrefixValidator import JsonPrefixValidator
+from lmformatenforcer import JsonSchemaParser
+import unittest
+
+class UT0280_JsonPrefixValidator_test(unittest.TestCase):
+
+    schema = {
+        "type": "object",
+        "properties": {
+            "name": {"type": "string"},
+            "age": {"type": "integer"}
+        },
+        "required": ["name", "age"]
+    }
+
+    def test_UT0281_valid_complete_json(self):
+        validator = JsonPrefixValidator(JsonSchemaParser(self.schema))
+        for chunk in ['{"name"', ': "John",', ' "age": 30}']:
+            self.assertEqual(validator.feed(chunk), len(chunk))
+        self.assertTrue(validator.valid)
+        self.assertTrue(validator.can_end())
+
+    def test_UT0282_incomplete_json_cannot_end(self):
+        validator = JsonPrefixValidator(JsonSchemaParser(self.schema))
+        validator.feed('{"name": "John", "age": 3')
+        self.assertTrue(validator.valid)
+        self.assertFalse(validator.can_end())
+
+    def test_UT0283_abort_at_first_invalid_character(self):
+        validator = JsonPrefixValidator(JsonSchemaParser(self.schema))
+        validator.feed('{"name": "John", ')
+        accepted = validator.feed('"age": "thirty"}')
+        self.assertFalse(validator.valid)
+        self.assertEqual(accepted, len('"age": '))
+        self.assertEqual(validator.length, len('{"name": "John", "age": '))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+from gai.gen.ttt.ExLlamav2_TTT import ExLlamav2_TTT
+from lmformatenforcer.tokenenforcer import TokenEnforcerTokenizerData
+import string
+import unittest
+from unittest.mock import patch, MagicMock
+
+# One token per printable character
+VOCAB = list(string.printable)
+EOS = len(VOCAB)
+
+class TokenIds(list):
+    def view(self, *shape):
+        return self
+    def tolist(self):
+        return list(self)
+
+# Streams one character per token. The last result has eos_reason="max_new_tokens" if the budget is used up.
+def fake_job(text, max_new_tokens):
+    text = text[:max_new_tokens]
+    for i, c in enumerate(text):
+        eos = i == len(text)-1
+        yield {"stage": "streaming", "text": c, "token_ids": TokenIds([VOCAB.index(c)]), "eos": eos,
+               "eos_reason": "max_new_tokens" if eos and len(text) == max_new_tokens else "stop_token"}
+
+class UT0290_ExLlamav2_schema_test(unittest.TestCase):
+
+    def setUp(self):
+        self.ttt = ExLlamav2_TTT({"model_path": "models/test", "model_basename": "model", "model_name": "test"})
+        self.ttt.tokenizer_data = TokenEnforcerTokenizerData(
+            regular_tokens=[(i, c, False) for i, c in enumerate(VOCAB)],
+            decoder=lambda ids: "".join(VOCAB[i] for i in ids if i < EOS),
+            eos_token_id=EOS,
+            use_bitmask=False,
+            vocab_size=EOS+1)
+        self.schema = {"type": "object", "properties": {"answer": {"type": "string"}}, "required": ["answer"]}
+
+    # Run the filter over the text as if the tokens were sampled by the generator.
+    def generate(self, text, token_enforcer=None, prefix_ids=None, complete=True):
+        filter = self.ttt._get_schema_filter(self.schema, prefix_ids=prefix_ids, token_enforcer=token_enforcer)
+        filter.begin("")
+        for c in text:
+            allowed, _ = filter.next()
+            token_id = VOCAB.index(c)
+            self.assertIn(token_id, allowed)
+            filter.feed([[token_id]])
+        allowed, _ = filter.next()
+        if complete:
+            self.assertIn(EOS, allowed)
+        return filter
+
+    def test_UT0291_token_enforcer_memo_is_bounded(self):
+        sizes = []
+        for i in range(50):
+            text = '{"answer":"reply number %d"}' % i
+            filter = self.generate(text)
+            sizes.append(len(filter.token_enforcer.prefix_states))
+            self.assertLessEqual(sizes[-1], len(text)+1)
+        # The parser is compiled once and no per-request state is kept by the cache
+        self.assertEqual(self.ttt.schema_cache.get_stats()["size"], 1)
+        self.assertEqual(self.ttt.schema_cache.get_stats()["misses"], 1)
+
+    def test_UT0292_resume_with_token_enforcer_of_previous_attempt(self):
+        token_enforcer = self.ttt._get_token_enforcer(self.schema)
+        prefix = '{"answer":"once'
+        prefix_ids = [VOCAB.index(c) for c in prefix]
+        self.generate(prefix[:-1], token_enforcer=token_enforcer, complete=False)
+        memo_size = len(token_enforcer.prefix_states)
+        self.generate(' upon a time"}', token_enforcer=token_enforcer, prefix_ids=prefix_ids)
+        # Only the last token of the prefix and the new tokens were added to the memo
+        self.assertEqual(len(token_enforcer.prefix_states), memo_size + 1 + len(' upon a time"}'))
+
+    # Runs _generate_json with each attempt producing the next text in outputs. Returns the result and the max_new_tokens of each attempt.
+    def generate_json(self, outputs, max_new_tokens):
+        budgets = []
+        def submit(max_new_tokens, **kwargs):
+            budgets.append(max_new_tokens)
+            return fake_job(outputs[len(budgets)-1], max_new_tokens), 10
+        self.ttt._submit = submit
+        self.ttt.scheduler = MagicMock()
+        with patch("gai.gen.ttt.ExLlamav2_TTT.ExLlamaV2PrefixFilter"):
+            result = self.ttt._generate_json(prompt="", settings=None, max_new_tokens=max_new_tokens, schema=self.schema, stop_conditions=[])
+        return result, budgets
+
+    def test_UT0293_resume_within_max_new_tokens(self):
+        # The first attempt is aborted at the invalid "]"
+        (text, json_data, _, output_len, _), budgets = self.generate_json(['{"answer":"once"]', '}'], max_new_tokens=30)
+        self.assertEqual(json_data, {"answer": "once"})
+        self.assertEqual(budgets, [30, 30-len('{"answer":"once"')])
+        self.assertEqual(output_len, len(text))
+
+    def test_UT0294_truncated_json_is_not_retried(self):
+        (text, json_data, _, _, eos_reason), budgets = self.generate_json(['{"answer":"once upon a time"}']*3, max_new_tokens=12)
+        self.assertIsNone(text)
+        self.assertIsNone(json_data)
+        self.assertEqual(eos_reason, "max_new_tokens")
+        self.assertEqual(budgets, [12])
+        self.assertEqual(self.ttt.schema_metrics["failures"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
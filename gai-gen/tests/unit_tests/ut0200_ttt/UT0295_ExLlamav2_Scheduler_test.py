@@ -0,0 +1,78 @@
+from gai.gen.ttt.ExLlamav2_Scheduler import ExLlamav2_Scheduler, ExLlamav2_JobStream
+import threading
+import unittest
+from unittest.mock import patch
+
+# Generator that streams one token per iteration and never reaches eos until released.
+class FakeGenerator:
+    def __init__(self, **kwargs):
+        self.jobs = []
+        self.release = threading.Event()
+    def warmup(self):
+        pass
+    def enqueue(self, job):
+        self.jobs.append(job)
+    def cancel(self, job):
+        self.jobs.remove(job)
+    def clear_queue(self):
+        self.jobs = []
+    def iterate(self):
+        self.release.wait(0.01)
+        return [{"job": job, "stage": "streaming", "text": "t", "eos": False} for job in self.jobs]
+
+class UT0295_ExLlamav2_Scheduler_test(unittest.TestCase):
+
+    def setUp(self):
+        with patch("gai.gen.ttt.ExLlamav2_Scheduler.ExLlamaV2DynamicGenerator", FakeGenerator):
+            self.scheduler = ExLlamav2_Scheduler(model=None, cache=None, tokenizer=None)
+
+    def tearDown(self):
+        self.scheduler.close()
+
+    def test_UT0296_close_fails_running_jobs(self):
+        handle = self.scheduler.submit(object())
+        results = iter(handle)
+        self.assertEqual(next(results)["text"], "t")
+        self.scheduler.close()
+        with self.assertRaises(Exception):
+            for _ in results:
+                pass
+
+    def test_UT0297_submit_after_close_raises(self):
+        self.scheduler.close()
+        with self.assertRaises(Exception):
+            self.scheduler.submit(object())
+
+    def test_UT0298_submit_racing_close_does_not_hang(self):
+        handles = []
+        def submit():
+            while True:
+                try:
+                    handles.append(self.scheduler.submit(object()))
+                except Exception:
+                    return
+        thread = threading.Thread(target=submit)
+        thread.start()
+        self.scheduler.close()
+        thread.join()
+        # Every accepted job ends with an exception instead of waiting forever
+        for handle in handles:
+            with self.assertRaises(Exception):
+                for _ in handle:
+                    pass
+
+    def test_UT0299_close_stream_cancels_job(self):
+        job = object()
+        handle = self.scheduler.submit(job)
+        chunks = (result["text"] for result in handle)
+        with ExLlamav2_JobStream(handle, chunks) as stream:
+            self.assertEqual(next(stream), "t")
+        # The chunk generator is closed and the handle ends once the scheduler thread has cancelled the job
+        self.assertIsNone(chunks.gi_frame)
+        list(handle)
+        self.assertTrue(handle.done)
+        self.assertNotIn(job, self.scheduler.generator.jobs)
+        stream.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -84,14 +84,18 @@ class RAGClientAsync(RAGClientBase):
             collection_name,
             document_id,
             chunk_size,
-            chunk_overlap):
+            chunk_overlap,
+            incremental=False,
+            previous_document_id=None):
         url=os.path.join(self.base_url,"step/split")
         try:
             response = await http_post_async(url=url, data={
                 "collection_name": collection_name,
                 "document_id": document_id,
                 "chunk_size": chunk_size,
-                "chunk_overlap": chunk_overlap
+                "chunk_overlap": chunk_overlap,
+                "incremental": incremental,
+                "previous_document_id": previous_document_id
             })
             return response.json()
         except Exception as e:
@@ -189,14 +193,116 @@ class RAGClientAsync(RAGClientBase):
             logger.error(f"index_document_async: Error indexing file. error={e}")
             raise e
     
+    ### ----------------- INDEXING JOBS ----------------- ###
+
+    # Queue the file for indexing in the background. Returns the job without waiting for the indexing to finish.
+    # Response:
+    # - 200: { "job": {...} }
+    async def submit_job_async(
+        self, 
+        collection_name, 
+        file_path,
+        file_type="", 
+        title="",
+        source="",
+        authors="",
+        publisher="",
+        published_date="",
+        comments="",
+        keywords="",
+        chunk_size=None,
+        chunk_overlap=None):
+
+        url=os.path.join(self.base_url,"jobs")
+        metadata = {
+            "title": title,
+            "source": source,
+            "file_type": file_type,
+            "authors": authors,
+            "publisher": publisher,
+            "published_date": published_date,
+            "comments": comments,
+            "keywords": keywords
+        }
+
+        try:
+            if not os.path.exists(file_path):
+                raise Exception(f"File not found: {file_path}")
+            with open(file_path, 'rb') as f:
+                files = {
+                    "file": (os.path.basename(file_path), f, "application/pdf"),
+                    "metadata": (None, json.dumps(metadata), "application/json"),
+                    "collection_name": (None, collection_name, "text/plain")
+                }
+                if chunk_size:
+                    files["chunk_size"] = (None, str(chunk_size), "text/plain")
+                if chunk_overlap:
+                    files["chunk_overlap"] = (None, str(chunk_overlap), "text/plain")
+
+                response = await http_post_async(url=url, files=files)
+                if not response:
+                    raise Exception("No response received")
+                return response.json()["job"]
+        except Exception as e:
+            logger.error(f"RAGClientAsync.submit_job_async: Error submitting job. error={e}")
+            raise e
+
+    # Response:
+    # - 200: { "job": {...} }
+    # - 404: { "message": "Job with id {job_id} not found" }
+    async def get_job_async(self, job_id):
+        url = os.path.join(self.base_url,f"jobs/{job_id}")
+        response = await http_get_async(url)
+        return response.json()["job"]
+
+    async def list_jobs_async(self, collection_name=None, status=None):
+        url = os.path.join(self.base_url,"jobs")
+        params = []
+        if collection_name:
+            params.append(f"collection_name={collection_name}")
+        if status:
+            params.append(f"status={status}")
+        if params:
+            url += "?" + "&".join(params)
+        response = await http_get_async(url)
+        return response.json()["jobs"]
+
+    # Poll the job until it is Completed or Failed. async_callback is awaited with the job after each poll.
+    async def wait_job_async(self, job_id, poll_interval=1, async_callback=None):
+        while True:
+            job = await self.get_job_async(job_id)
+            if async_callback:
+                await async_callback(job)
+            if job["Status"] in ("Completed", "Failed"):
+                return job
+            await asyncio.sleep(poll_interval)
+
     ### ----------------- RETRIEVAL ----------------- ###
 
-    async def retrieve_async(self, collection_name, query_texts, n_results=None):
+    # Set hybrid to also match the keywords of the query, eg. identifiers and part numbers.
+    async def retrieve_async(self, collection_name, query_texts, n_results=None, hybrid=False):
         url = os.path.join(self.base_url,"retrieve")
         data = {
             "collection_name": collection_name,
             "query_texts": query_texts
         }
+        if n_results:
+            data["n_results"] = n_results
+        if hybrid:
+            data["hybrid"] = True
+
+        response = await http_post_async(url, data=data)
+        return response.json()["retrieved"]
+
+    # Retrieve the results of many queries from one or more collections in a single request. Returns one list of chunks per query.
+    async def retrieve_batch_async(self, collection_names, query_texts, n_results=None):
+        url = os.path.join(self.base_url,"retrieve/batch")
+        if isinstance(collection_names, str):
+            collection_names = [collection_names]
+        data = {
+            "collection_names": collection_names,
+            "query_texts": query_texts
+        }
         if n_results:
             data["n_results"] = n_results
 